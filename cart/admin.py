@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.db.models import DecimalField, F, Sum
 from .models import Cart, CartItem
 
 
@@ -16,13 +17,25 @@ class CartAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at', 'updated_at']
     inlines = [CartItemInline]
     
+    def get_queryset(self, request):
+        # Totals for the whole changelist page in the same query
+        return super().get_queryset(request).select_related('user').annotate(
+            items_total=Sum('items__quantity'),
+            price_total=Sum(
+                F('items__quantity') * F('items__product__price'),
+                output_field=DecimalField(max_digits=12, decimal_places=2)
+            ),
+        )
+    
     def total_items(self, obj):
-        return obj.total_items
+        return obj.items_total or 0
     total_items.short_description = 'Товаров'
+    total_items.admin_order_field = 'items_total'
     
     def total_price(self, obj):
-        return f"{obj.total_price} сом"
+        return f"{obj.price_total or 0} сом"
     total_price.short_description = 'Сумма'
+    total_price.admin_order_field = 'price_total'
 
 
 @admin.register(CartItem)
@@ -30,6 +43,7 @@ class CartItemAdmin(admin.ModelAdmin):
     list_display = ['cart', 'product', 'quantity', 'get_total_price', 'added_at']
     list_filter = ['added_at']
     search_fields = ['product__name', 'cart__user__username']
+    list_select_related = ['cart', 'cart__user', 'product', 'product__producer']
     
     def get_total_price(self, obj):
         return f"{obj.get_total_price()} сом"
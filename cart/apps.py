@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class CartConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cart'
-    verbose_name = 'Корзина'
\ No newline at end of file
+    verbose_name = 'Корзина'
+
+    def ready(self):
+        from . import signals  # noqa: F401
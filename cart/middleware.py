@@ -0,0 +1,35 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+
+class CartStorageMiddleware:
+    """Write changes of cookie/cache guest carts to the response
+
+    Supports both sync and async requests, so async views (event streams)
+    are not pushed through the thread executor under ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self.persist(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if getattr(request, '_guest_cart_storage', None) is not None:
+            await sync_to_async(self.persist)(request, response)
+        return response
+
+    def persist(self, request, response):
+        storage = getattr(request, '_guest_cart_storage', None)
+        if storage is not None:
+            storage.persist(response)
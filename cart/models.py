@@ -1,5 +1,7 @@
 from django.db import models
+from django.db.models import DecimalField, F, Sum
 from django.contrib.auth.models import User
+from django.utils.functional import cached_property
 from products.models import Product
 from decimal import Decimal
 
@@ -20,19 +22,29 @@ class Cart(models.Model):
             return f"Корзина {self.user.username}"
         return f"Анонимная корзина {self.session_key}"
     
+    @cached_property
+    def totals(self):
+        """(total_items, total_price) computed with a single aggregate query"""
+        return cart_totals(self.items.all())
+    
+    def refresh_totals(self):
+        """Forget cached totals after the cart items changed"""
+        self.__dict__.pop('totals', None)
+    
     @property
     def total_items(self):
         """Total number of items in cart"""
-        return sum(item.quantity for item in self.items.all())
+        return self.totals[0]
     
     @property
     def total_price(self):
         """Total price of all items in cart"""
-        return sum(item.get_total_price() for item in self.items.all())
+        return self.totals[1]
     
     def clear(self):
         """Remove all items from cart"""
         self.items.all().delete()
+        self.refresh_totals()
 
 
 class CartItem(models.Model):
@@ -65,4 +77,13 @@ class CartItem(models.Model):
             self.quantity -= quantity
             self.save()
         else:
-            self.delete()
\ No newline at end of file
+            self.delete()
+
+
+def cart_totals(items):
+    """Total quantity and price of a CartItem queryset in one aggregate query"""
+    totals = items.aggregate(
+        count=Sum('quantity'),
+        total=Sum(F('quantity') * F('product__price'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+    )
+    return totals['count'] or 0, totals['total'] or Decimal('0')
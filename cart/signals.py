@@ -0,0 +1,11 @@
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+
+from .views import merge_guest_cart
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    """Carry the guest cart over to the account the visitor signed in to"""
+    if request is not None:
+        merge_guest_cart(request, user)
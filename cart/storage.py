@@ -0,0 +1,421 @@
+"""
+Cart storage backends.
+
+Signed-in users always keep their cart in ``Cart``/``CartItem`` rows. Guest
+carts are stored according to ``settings.CART_ANONYMOUS_STORAGE``:
+
+* ``'database'`` - a ``Cart`` row keyed by the session (creates a session);
+* ``'cookie'``   - a signed cookie holding ``{product_id: quantity}``;
+* ``'cache'``    - the same mapping in the cache, keyed by a signed cookie token.
+
+Cookie and cache carts are written to the database only when they are merged
+into the user's cart at login. Views use ``get_cart_storage(request)`` and the
+common interface below, so they do not depend on the backend.
+"""
+
+import json
+import secrets
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signing import BadSignature
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.utils.functional import cached_property
+
+from products.models import Product
+from .models import Cart, CartItem, cart_totals
+
+
+# Session key remembering which session a guest database cart belongs to, so
+# the cart can still be found after login cycles the session key.
+CART_SESSION_KEY = 'cart_session_key'
+
+GUEST_CART_COOKIE = 'tanda_cart'
+GUEST_CART_SALT = 'cart.storage'
+GUEST_CART_MAX_LINES = 50
+
+
+def get_or_create_cart(request):
+    """Get or create cart for user or session"""
+    if request.user.is_authenticated:
+        cart, created = Cart.objects.get_or_create(user=request.user)
+    else:
+        session_key = request.session.session_key
+        if not session_key:
+            request.session.create()
+            session_key = request.session.session_key
+        cart, created = Cart.objects.get_or_create(session_key=session_key)
+        request.session[CART_SESSION_KEY] = session_key
+    return cart
+
+
+def cart_owner_lookup(request, prefix=''):
+    """Filter kwargs selecting the request's cart, or None if it cannot exist yet"""
+    if request.user.is_authenticated:
+        return {f'{prefix}user': request.user}
+    session_key = request.session.session_key
+    if not session_key:
+        return None
+    return {f'{prefix}session_key': session_key}
+
+
+def get_cart(request):
+    """Get existing cart for user or session without creating one"""
+    lookup = cart_owner_lookup(request)
+    if lookup is None:
+        return None
+    return Cart.objects.filter(**lookup).first()
+
+
+class BaseCartStorage:
+    """Interface shared by all cart backends
+
+    Reads are lazy: nothing is queried until ``items``, ``total_items`` or
+    ``total_price`` is accessed.
+    """
+
+    def __init__(self, request):
+        self.request = request
+
+    def items(self):
+        """Cart lines with ``id``, ``product``, ``quantity`` and ``get_total_price()``"""
+        raise NotImplementedError
+
+    def add(self, product, quantity=1):
+        """Add quantity of product and return the resulting line"""
+        raise NotImplementedError
+
+    def add_many(self, quantities):
+        """Add ``{product: quantity}`` to the cart in a single step
+
+        Raises ValueError when a quantity is not positive.
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _check_quantities(quantities):
+        if any(quantity < 1 for quantity in quantities.values()):
+            raise ValueError('Количество должно быть больше нуля')
+
+    def update(self, item_id, quantity):
+        """Set line quantity (removing it when quantity <= 0); return the line or None"""
+        raise NotImplementedError
+
+    def remove(self, item_id):
+        """Remove a line and return it"""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def _totals(self):
+        raise NotImplementedError
+
+    @cached_property
+    def totals(self):
+        return self._totals()
+
+    def _changed(self):
+        self.__dict__.pop('totals', None)
+
+    @property
+    def total_items(self):
+        return self.totals[0]
+
+    @property
+    def total_price(self):
+        return self.totals[1]
+
+    def persist(self, response):
+        """Write pending changes to the response (cookies); no-op by default"""
+
+
+class DatabaseCartStorage(BaseCartStorage):
+    """Cart and CartItem rows (users, and guests in 'database' mode)"""
+
+    @cached_property
+    def cart(self):
+        return get_cart(self.request)
+
+    def _get_or_create_cart(self):
+        if self.cart is None:
+            self.__dict__['cart'] = get_or_create_cart(self.request)
+        return self.cart
+
+    def items(self):
+        if self.cart is None:
+            return []
+        return list(self.cart.items.select_related('product', 'product__producer'))
+
+    def _totals(self):
+        lookup = cart_owner_lookup(self.request, prefix='cart__')
+        if lookup is None:
+            return 0, Decimal('0')
+        return cart_totals(CartItem.objects.filter(**lookup))
+
+    def add(self, product, quantity=1):
+        self.add_many({product: quantity})
+        cart_item = CartItem.objects.get(cart=self.cart, product=product)
+        # Reuse the product we already have for item_total
+        cart_item.product = product
+        return cart_item
+
+    def add_many(self, quantities):
+        if not quantities:
+            return
+        self._check_quantities(quantities)
+        with transaction.atomic():
+            cart = self._get_or_create_cart()
+            # Make sure every line exists (a concurrent request may be inserting
+            # the same one, hence ignore_conflicts), then increment all of them
+            # with one UPDATE so that no quantity is lost to a read-modify-write.
+            CartItem.objects.bulk_create(
+                [CartItem(cart=cart, product=product, quantity=0) for product in quantities],
+                ignore_conflicts=True,
+            )
+            CartItem.objects.filter(cart=cart, product__in=list(quantities)).update(
+                quantity=F('quantity') + Case(
+                    *[When(product=product, then=Value(quantity)) for product, quantity in quantities.items()],
+                    default=Value(0),
+                )
+            )
+        self._changed()
+
+    def _get_item(self, item_id):
+        # Look the item up through the owner of the cart so the Cart row
+        # itself does not have to be fetched first.
+        lookup = cart_owner_lookup(self.request, prefix='cart__')
+        if lookup is None:
+            raise Http404('Товар не найден в корзине')
+        return get_object_or_404(CartItem.objects.select_related('product'), id=item_id, **lookup)
+
+    def update(self, item_id, quantity):
+        cart_item = self._get_item(item_id)
+        self._changed()
+        if quantity > 0:
+            cart_item.quantity = quantity
+            cart_item.save(update_fields=['quantity'])
+            return cart_item
+        cart_item.delete()
+        return None
+
+    def remove(self, item_id):
+        cart_item = self._get_item(item_id)
+        cart_item.delete()
+        self._changed()
+        return cart_item
+
+    def clear(self):
+        lookup = cart_owner_lookup(self.request, prefix='cart__')
+        if lookup is not None:
+            CartItem.objects.filter(**lookup).delete()
+        self._changed()
+
+
+class GuestCartItem:
+    """Cart line of a cookie or cache cart; its id is the product id"""
+
+    def __init__(self, product, quantity):
+        self.id = product.pk
+        self.product = product
+        self.quantity = quantity
+
+    def get_total_price(self):
+        return Decimal(self.quantity) * self.product.price
+
+
+class GuestCartStorage(BaseCartStorage):
+    """Base for carts kept outside the database as {product_id: quantity}"""
+
+    modified = False
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _save(self, response, lines):
+        raise NotImplementedError
+
+    @cached_property
+    def lines(self):
+        lines = {}
+        for product_id, quantity in (self._load() or {}).items():
+            try:
+                product_id, quantity = int(product_id), int(quantity)
+            except (TypeError, ValueError):
+                continue
+            if quantity > 0:
+                lines[product_id] = quantity
+        return lines
+
+    def _set_lines(self, lines):
+        self.__dict__['lines'] = lines
+        self.__dict__.pop('_items', None)
+        self.modified = True
+        self._changed()
+
+    @cached_property
+    def _items(self):
+        products = Product.objects.filter(pk__in=self.lines, is_active=True).select_related('producer')
+        products = {product.pk: product for product in products}
+        return [
+            GuestCartItem(products[product_id], quantity)
+            for product_id, quantity in self.lines.items()
+            if product_id in products
+        ]
+
+    def items(self):
+        return self._items
+
+    def _totals(self):
+        items = self.items()
+        return (
+            sum(item.quantity for item in items),
+            sum((item.get_total_price() for item in items), Decimal('0')),
+        )
+
+    def _get_item(self, item_id):
+        try:
+            item_id = int(item_id)
+        except (TypeError, ValueError):
+            raise Http404('Товар не найден в корзине')
+        for item in self.items():
+            if item.id == item_id:
+                return item
+        raise Http404('Товар не найден в корзине')
+
+    def add(self, product, quantity=1):
+        self.add_many({product: quantity})
+        return GuestCartItem(product, self.lines[product.pk])
+
+    def add_many(self, quantities):
+        self._check_quantities(quantities)
+        lines = dict(self.lines)
+        for product, quantity in quantities.items():
+            if product.pk not in lines and len(lines) >= GUEST_CART_MAX_LINES:
+                raise ValueError('В корзине слишком много товаров')
+            lines[product.pk] = lines.get(product.pk, 0) + quantity
+        self._set_lines(lines)
+
+    def update(self, item_id, quantity):
+        item = self._get_item(item_id)
+        lines = dict(self.lines)
+        if quantity > 0:
+            lines[item.id] = quantity
+            item = GuestCartItem(item.product, quantity)
+        else:
+            lines.pop(item.id, None)
+            item = None
+        self._set_lines(lines)
+        return item
+
+    def remove(self, item_id):
+        item = self._get_item(item_id)
+        lines = dict(self.lines)
+        lines.pop(item.id, None)
+        self._set_lines(lines)
+        return item
+
+    def clear(self):
+        self._set_lines({})
+
+    def persist(self, response):
+        if self.modified:
+            self._save(response, self.lines)
+            self.modified = False
+
+    def _set_cookie(self, response, value):
+        response.set_signed_cookie(
+            GUEST_CART_COOKIE,
+            value,
+            salt=GUEST_CART_SALT,
+            max_age=settings.SESSION_COOKIE_AGE,
+            secure=settings.SESSION_COOKIE_SECURE,
+            httponly=True,
+            samesite=settings.SESSION_COOKIE_SAMESITE,
+        )
+
+    def _read_cookie(self):
+        try:
+            return self.request.get_signed_cookie(
+                GUEST_CART_COOKIE, default=None, salt=GUEST_CART_SALT,
+                max_age=settings.SESSION_COOKIE_AGE,
+            )
+        except BadSignature:
+            return None
+
+
+class CookieCartStorage(GuestCartStorage):
+    """Guest cart serialized into a signed cookie"""
+
+    def _load(self):
+        value = self._read_cookie()
+        if not value:
+            return {}
+        try:
+            data = json.loads(value)
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _save(self, response, lines):
+        if lines:
+            self._set_cookie(response, json.dumps(lines, separators=(',', ':')))
+        else:
+            response.delete_cookie(GUEST_CART_COOKIE, samesite=settings.SESSION_COOKIE_SAMESITE)
+
+
+class CacheCartStorage(GuestCartStorage):
+    """Guest cart kept in the cache under a token stored in a signed cookie"""
+
+    @cached_property
+    def token(self):
+        return self._read_cookie()
+
+    def _cache_key(self, token):
+        return f'cart:{token}'
+
+    def _load(self):
+        if not self.token:
+            return {}
+        data = cache.get(self._cache_key(self.token))
+        return data if isinstance(data, dict) else {}
+
+    def _save(self, response, lines):
+        if not lines:
+            if self.token:
+                cache.delete(self._cache_key(self.token))
+                response.delete_cookie(GUEST_CART_COOKIE, samesite=settings.SESSION_COOKIE_SAMESITE)
+            return
+        token = self.token or secrets.token_urlsafe(24)
+        cache.set(self._cache_key(token), lines, settings.SESSION_COOKIE_AGE)
+        if token != self.token:
+            self._set_cookie(response, token)
+            self.__dict__['token'] = token
+
+
+GUEST_STORAGE_BACKENDS = {
+    'database': DatabaseCartStorage,
+    'cookie': CookieCartStorage,
+    'cache': CacheCartStorage,
+}
+
+
+def get_guest_cart_storage(request):
+    """Storage configured for anonymous carts, shared for the whole request"""
+    if not hasattr(request, '_guest_cart_storage'):
+        mode = getattr(settings, 'CART_ANONYMOUS_STORAGE', 'database')
+        request._guest_cart_storage = GUEST_STORAGE_BACKENDS[mode](request)
+    return request._guest_cart_storage
+
+
+def get_cart_storage(request):
+    """Cart storage for the current visitor"""
+    if request.user.is_authenticated:
+        if not hasattr(request, '_cart_storage'):
+            request._cart_storage = DatabaseCartStorage(request)
+        return request._cart_storage
+    return get_guest_cart_storage(request)
@@ -1,3 +1,135 @@
-from django.test import TestCase
+import json
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from cart.models import Cart, CartItem
+from products.models import Category, Product
+from users.models import Producer
+
+
+class GuestCartTests:
+    """Cart behaviour shared by every guest storage backend"""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create(username='producer')
+        producer = Producer.objects.create(user=user, name='Бренд', description='-', region='naryn')
+        category = Category.objects.create(name='Молочное', slug='dairy')
+        self.products = [
+            Product.objects.create(
+                producer=producer, category=category, name=name, description='-',
+                price=Decimal(price), image='product_images/test.jpg',
+            )
+            for name, price in (('Курут', '150.00'), ('Айран', '80.00'), ('Кымыз', '200.00'))
+        ]
+
+    def post(self, name, data):
+        return self.client.post(reverse(name), json.dumps(data), content_type='application/json').json()
+
+    def add(self, product, quantity=1):
+        return self.post('add_to_cart', {'product_id': product.pk, 'quantity': quantity})
+
+    def count(self):
+        data = self.client.get(reverse('cart_count')).json()
+        return data['count'], Decimal(str(data['total']))
+
+    def item_id(self, product):
+        # Guest lines are identified by the product id, database lines by their own id
+        item = CartItem.objects.filter(product=product).first()
+        return item.pk if item else product.pk
+
+    def test_add_update_remove(self):
+        self.assertTrue(self.add(self.products[0], 2)['success'])
+        self.assertTrue(self.add(self.products[0])['success'])
+        self.assertTrue(self.add(self.products[1])['success'])
+        self.assertEqual(self.count(), (4, Decimal('530')))
+
+        data = self.post('update_cart_item', {'item_id': self.item_id(self.products[0]), 'quantity': 1})
+        self.assertEqual((data['cart_count'], data['cart_total']), (2, 230.0))
+
+        data = self.post('remove_from_cart', {'item_id': self.item_id(self.products[1])})
+        self.assertEqual((data['cart_count'], data['cart_total']), (1, 150.0))
+
+        self.client.get(reverse('clear_cart'))
+        self.assertEqual(self.count(), (0, Decimal('0')))
+
+    def test_bulk_add(self):
+        data = self.post('add_to_cart_bulk', {'items': [
+            {'product_id': self.products[0].pk, 'quantity': 2},
+            {'product_id': self.products[0].pk, 'quantity': 1},
+            {'product_id': self.products[2].pk},
+            {'product_id': 999999, 'quantity': 1},
+        ]})
+        self.assertTrue(data['success'])
+        self.assertEqual(data['unavailable_ids'], [999999])
+        self.assertEqual(self.count(), (4, Decimal('650')))
+
+    def test_non_positive_quantities_are_rejected(self):
+        self.add(self.products[0], 2)
+        for quantity in (0, -1):
+            self.assertFalse(self.add(self.products[0], quantity)['success'])
+            self.assertFalse(self.post('add_to_cart_bulk', {'items': [
+                {'product_id': self.products[0].pk, 'quantity': quantity},
+            ]})['success'])
+        self.assertEqual(self.count(), (2, Decimal('300')))
+
+    def test_login_merges_guest_cart(self):
+        buyer = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+        user_cart = Cart.objects.create(user=buyer)
+        CartItem.objects.create(cart=user_cart, product=self.products[0], quantity=1)
+        self.add(self.products[0], 2)
+        self.add(self.products[1], 3)
+
+        response = self.client.post(reverse('login'), {'username': 'buyer', 'password': 'password'})
+        self.assertEqual(response.status_code, 302)
+
+        self.assertEqual(
+            dict(CartItem.objects.filter(cart__user=buyer).values_list('product_id', 'quantity')),
+            {self.products[0].pk: 3, self.products[1].pk: 3},
+        )
+        self.assertFalse(Cart.objects.filter(user__isnull=True).exists())
+        self.client.logout()
+        self.assertEqual(self.count(), (0, Decimal('0')))
+
+    def test_page_views_do_not_create_carts(self):
+        self.client.get(reverse('cart_view'))
+        self.client.get(reverse('cart_count'))
+        self.assertFalse(Cart.objects.exists())
+        self.assertNotIn('sessionid', self.client.cookies)
+
+
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+@override_settings(CART_ANONYMOUS_STORAGE='cookie', PASSWORD_HASHERS=FAST_HASHERS)
+class CookieCartTests(GuestCartTests, TestCase):
+
+    def test_cart_is_kept_in_a_signed_cookie(self):
+        self.add(self.products[0], 2)
+        self.assertFalse(Cart.objects.exists())
+        self.assertIn('tanda_cart', self.client.cookies)
+
+        self.client.cookies['tanda_cart'] = 'tampered'
+        self.assertEqual(self.count(), (0, Decimal('0')))
+
+
+@override_settings(CART_ANONYMOUS_STORAGE='cache', PASSWORD_HASHERS=FAST_HASHERS)
+class CacheCartTests(GuestCartTests, TestCase):
+
+    def test_cart_is_kept_in_the_cache(self):
+        self.add(self.products[0], 2)
+        self.assertFalse(Cart.objects.exists())
+        token = self.client.cookies['tanda_cart'].value.split(':')[0]
+        self.assertEqual(cache.get(f'cart:{token}'), {self.products[0].pk: 2})
+
+
+@override_settings(CART_ANONYMOUS_STORAGE='database', PASSWORD_HASHERS=FAST_HASHERS)
+class DatabaseCartTests(GuestCartTests, TestCase):
+
+    def test_cart_is_kept_in_the_database(self):
+        self.add(self.products[0], 2)
+        self.assertEqual(CartItem.objects.get(cart__session_key__isnull=False).quantity, 2)
@@ -4,30 +4,21 @@ from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.views.decorators.csrf import csrf_exempt
+from django.utils.functional import SimpleLazyObject
+from django.db import transaction
+from django.db.models import Q
 import json
 from decimal import Decimal
 
 from .models import Cart, CartItem
+from .storage import CART_SESSION_KEY, GuestCartStorage, get_cart_storage, get_guest_cart_storage
 from products.models import Product
 
 
-def get_or_create_cart(request):
-    """Get or create cart for user or session"""
-    if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
-    else:
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.create()
-            session_key = request.session.session_key
-        cart, created = Cart.objects.get_or_create(session_key=session_key)
-    return cart
-
-
 def cart_view(request):
     """Display cart contents"""
-    cart = get_or_create_cart(request)
-    cart_items = cart.items.select_related('product', 'product__producer').all()
+    cart = get_cart_storage(request)
+    cart_items = cart.items()
     
     context = {
         'cart': cart,
@@ -52,20 +43,15 @@ def add_to_cart(request):
                 'message': 'ID товара не указан'
             })
         
-        product = get_object_or_404(Product, id=product_id, is_active=True)
-        cart = get_or_create_cart(request)
-        
-        # Get or create cart item
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={'quantity': quantity}
-        )
+        if quantity < 1:
+            return JsonResponse({
+                'success': False,
+                'message': 'Количество должно быть больше нуля'
+            })
         
-        if not created:
-            # Item already exists, increase quantity
-            cart_item.quantity += quantity
-            cart_item.save()
+        product = get_object_or_404(Product, id=product_id, is_active=True)
+        cart = get_cart_storage(request)
+        cart_item = cart.add(product, quantity)
         
         return JsonResponse({
             'success': True,
@@ -87,6 +73,87 @@ def add_to_cart(request):
         })
 
 
+# Upper bound on distinct products accepted by add_to_cart_bulk
+CART_BULK_MAX_ITEMS = 100
+
+
+def parse_cart_lines(items):
+    """Validate ``[{product_id, quantity}, ...]`` into ``{product_id: quantity}``
+
+    Quantities of repeated products are summed. Raises ValueError with a
+    message for the user when the payload is malformed.
+    """
+    if not isinstance(items, list) or not items:
+        raise ValueError('Список товаров не указан')
+    quantities = {}
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError('Неверный формат данных')
+        try:
+            product_id = int(item.get('product_id'))
+            quantity = int(item.get('quantity', 1))
+        except (TypeError, ValueError):
+            raise ValueError('Неверный формат данных')
+        if quantity < 1:
+            raise ValueError('Количество должно быть больше нуля')
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    if len(quantities) > CART_BULK_MAX_ITEMS:
+        raise ValueError(f'Можно добавить не более {CART_BULK_MAX_ITEMS} товаров за раз')
+    return quantities
+
+
+@require_POST
+def add_to_cart_bulk(request):
+    """AJAX endpoint to add several products to cart in one request
+
+    Expects ``{"items": [{"product_id": 1, "quantity": 2}, ...]}``. Products
+    that are missing or inactive are skipped and reported in
+    ``unavailable_ids``; everything else is added in one transaction.
+    """
+    try:
+        data = json.loads(request.body)
+        try:
+            quantities = parse_cart_lines(data.get('items'))
+        except ValueError as e:
+            return JsonResponse({
+                'success': False,
+                'message': str(e)
+            })
+        
+        products = Product.objects.filter(pk__in=quantities, is_active=True).in_bulk()
+        unavailable_ids = [product_id for product_id in quantities if product_id not in products]
+        if not products:
+            return JsonResponse({
+                'success': False,
+                'message': 'Товары недоступны',
+                'unavailable_ids': unavailable_ids
+            })
+        
+        cart = get_cart_storage(request)
+        cart.add_many({products[product_id]: quantity
+                       for product_id, quantity in quantities.items() if product_id in products})
+        
+        return JsonResponse({
+            'success': True,
+            'message': f'Добавлено в корзину товаров: {len(products)}',
+            'added_count': len(products),
+            'unavailable_ids': unavailable_ids,
+            'cart_count': cart.total_items,
+            'cart_total': float(cart.total_price)
+        })
+        
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'success': False,
+            'message': 'Неверный формат данных'
+        })
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': f'Ошибка: {str(e)}'
+        })
+
+
 @require_POST
 def update_cart_item(request):
     """AJAX endpoint to update cart item quantity"""
@@ -101,19 +168,9 @@ def update_cart_item(request):
                 'message': 'ID товара не указан'
             })
         
-        cart = get_or_create_cart(request)
-        cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
-        
-        if quantity > 0:
-            cart_item.quantity = quantity
-            cart_item.save()
-            item_total = float(cart_item.get_total_price())
-        else:
-            cart_item.delete()
-            item_total = 0
-        
-        # Refresh cart to get updated totals
-        cart.refresh_from_db()
+        cart = get_cart_storage(request)
+        cart_item = cart.update(item_id, quantity)
+        item_total = float(cart_item.get_total_price()) if cart_item else 0
         
         return JsonResponse({
             'success': True,
@@ -148,13 +205,9 @@ def remove_from_cart(request):
                 'message': 'ID товара не указан'
             })
         
-        cart = get_or_create_cart(request)
-        cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
+        cart = get_cart_storage(request)
+        cart_item = cart.remove(item_id)
         product_name = cart_item.product.name
-        cart_item.delete()
-        
-        # Refresh cart to get updated totals
-        cart.refresh_from_db()
         
         return JsonResponse({
             'success': True,
@@ -178,7 +231,7 @@ def remove_from_cart(request):
 def cart_count(request):
     """AJAX endpoint to get cart count"""
     try:
-        cart = get_or_create_cart(request)
+        cart = get_cart_storage(request)
         return JsonResponse({
             'count': cart.total_items,
             'total': float(cart.total_price)
@@ -192,7 +245,7 @@ def cart_count(request):
 
 def clear_cart(request):
     """Clear all items from cart"""
-    cart = get_or_create_cart(request)
+    cart = get_cart_storage(request)
     cart.clear()
     messages.success(request, 'Корзина очищена')
     return redirect('cart_view')
@@ -200,45 +253,77 @@ def clear_cart(request):
 
 # Context processor for global cart access
 def cart_context(request):
-    """Add cart info to all templates"""
-    try:
-        cart = get_or_create_cart(request)
-        return {
-            'cart': cart,
-            'cart_count': cart.total_items,
-            'cart_total': cart.total_price
-        }
-    except:
-        return {
-            'cart': None,
-            'cart_count': 0,
-            'cart_total': 0
-        }
+    """Add lazy cart info to all templates
+
+    Nothing is queried (and no cart or session is created) unless a template
+    actually reads one of these variables.
+    """
+    cart = get_cart_storage(request)
+    return {
+        'cart': cart,
+        'cart_count': SimpleLazyObject(lambda: cart.total_items),
+        'cart_total': SimpleLazyObject(lambda: cart.total_price),
+    }
 
 
 # Merge carts when user logs in
-def merge_carts(user, session_key):
-    """Merge anonymous cart with user cart when user logs in"""
-    try:
-        # Get session cart
-        session_cart = Cart.objects.get(session_key=session_key)
-        
-        # Get or create user cart
-        user_cart, created = Cart.objects.get_or_create(user=user)
-        
-        # Move items from session cart to user cart
-        for item in session_cart.items.all():
-            user_item, created = CartItem.objects.get_or_create(
-                cart=user_cart,
-                product=item.product,
-                defaults={'quantity': item.quantity}
-            )
-            if not created:
-                user_item.quantity += item.quantity
-                user_item.save()
+def merge_carts(user, session_key=None, lines=None):
+    """Merge anonymous cart with user cart when user logs in
+
+    ``session_key`` selects a guest cart stored in the database and ``lines``
+    is an extra ``{product_id: quantity}`` mapping from a cookie or cache cart.
+    Both carts are read with one query and written back with one bulk_create
+    and one bulk_update inside a transaction.
+    """
+    lines = dict(lines or {})
+    if not session_key and not lines:
+        return
+    
+    with transaction.atomic():
+        owners = Q(cart__user=user)
+        if session_key:
+            owners |= Q(cart__session_key=session_key, cart__user__isnull=True)
         
-        # Delete session cart
-        session_cart.delete()
+        user_cart_id = None
+        user_items = {}
+        for item in CartItem.objects.select_for_update().filter(owners).select_related('cart'):
+            if item.cart.user_id == user.pk:
+                user_cart_id = item.cart_id
+                user_items[item.product_id] = item
+            else:
+                lines[item.product_id] = lines.get(item.product_id, 0) + item.quantity
+        
+        if lines:
+            if user_cart_id is None:
+                user_cart_id = Cart.objects.get_or_create(user=user)[0].pk
+            
+            new_items = []
+            changed_items = []
+            for product_id, quantity in lines.items():
+                if product_id in user_items:
+                    user_items[product_id].quantity += quantity
+                    changed_items.append(user_items[product_id])
+                else:
+                    new_items.append(CartItem(cart_id=user_cart_id, product_id=product_id, quantity=quantity))
+            CartItem.objects.bulk_create(new_items)
+            CartItem.objects.bulk_update(changed_items, ['quantity'])
         
-    except Cart.DoesNotExist:
-        pass  # No session cart to merge
\ No newline at end of file
+        # Delete session cart
+        if session_key:
+            Cart.objects.filter(session_key=session_key, user__isnull=True).delete()
+
+
+def merge_guest_cart(request, user):
+    """Move the visitor's guest cart (any storage backend) into the user's cart"""
+    storage = get_guest_cart_storage(request)
+    lines = {}
+    if isinstance(storage, GuestCartStorage) and storage.lines:
+        # items() drops products that were removed or deactivated meanwhile
+        lines = {item.id: item.quantity for item in storage.items()}
+    
+    # Guest carts stored in the database are keyed by the pre-login session
+    session_key = request.session.pop(CART_SESSION_KEY, None)
+    merge_carts(user, session_key, lines)
+    
+    if isinstance(storage, GuestCartStorage) and storage.lines:
+        storage.clear()
@@ -6,5 +6,6 @@ urlpatterns = [
     path('products/', views.products, name='products'),
     path('producers/', views.producers, name='producers'),
     path('product/<int:pk>/', views.product_detail, name='product_detail'),
+    path('product/<int:pk>/reviews/', views.product_reviews, name='product_reviews'),
     path('producer/<int:pk>/', views.producer_detail, name='producer_detail'),
 ]
\ No newline at end of file
@@ -1,7 +1,18 @@
 from django.shortcuts import render, get_object_or_404
-from django.db.models import Q, Avg
-from products.models import Product, Category
-from users.models import Producer
+from django.http import JsonResponse
+from django.utils import timezone
+from products.cache import cached_queryset, cached_value
+from products.models import Product, Category, Review
+from products.pagination import KeysetPaginator
+from products.search import search_products
+from users.models import Producer, favorite_product_ids
+
+
+PRODUCTS_PER_PAGE = 24
+REVIEWS_PER_PAGE = 10
+
+# Models shown on a product card, cached product lists depend on all of them
+CARD_MODELS = [Product, Producer, Category]
 
 
 def home(request):
@@ -10,17 +21,25 @@ def home(request):
     # Получаем данные из базы или используем заглушки
     try:
         # Популярные товары
-        popular_products = Product.objects.filter(is_active=True).order_by('-num_sales')[:8]
+        popular_products = cached_queryset(
+            'home_popular', CARD_MODELS,
+            Product.objects.filter(is_active=True).select_related('producer', 'category').order_by('-num_sales')[:8]
+        )
         
         # Новые товары
-        new_products = Product.objects.filter(is_active=True).order_by('-created_at')[:8]
+        new_products = cached_queryset(
+            'home_new', CARD_MODELS,
+            Product.objects.filter(is_active=True).select_related('producer', 'category').order_by('-created_at')[:8]
+        )
         
         # Категории
-        categories = Category.objects.all()[:6]
+        categories = cached_queryset('home_categories', [Category], Category.objects.all()[:6])
         
         # Статистика
-        total_products = Product.objects.filter(is_active=True).count()
-        total_producers = Producer.objects.filter(is_verified=True).count()
+        total_products, total_producers = cached_value('home_totals', [Product, Producer], lambda: (
+            Product.objects.filter(is_active=True).count(),
+            Producer.objects.filter(is_verified=True).count(),
+        ))
         
     except Exception:
         # Если таблицы еще не созданы, используем пустые данные
@@ -33,6 +52,7 @@ def home(request):
     context = {
         'popular_products': popular_products,
         'new_products': new_products,
+        'favorite_ids': favorite_product_ids(request.user, popular_products + new_products),
         'categories': categories,
         'total_products': total_products,
         'total_producers': total_producers,
@@ -49,7 +69,7 @@ def products(request):
         category_filter = request.GET.get('category')
         region_filter = request.GET.get('region')
         search_query = request.GET.get('search')
-        sort_by = request.GET.get('sort', 'newest')
+        sort_by = request.GET.get('sort') or ('relevance' if search_query else 'newest')
         
         # Применяем фильтры
         if category_filter:
@@ -59,31 +79,34 @@ def products(request):
             products_list = products_list.filter(producer__region=region_filter)
         
         if search_query:
-            products_list = products_list.filter(
-                Q(name__icontains=search_query) |
-                Q(description__icontains=search_query) |
-                Q(producer__name__icontains=search_query)
-            )
+            products_list = search_products(products_list, search_query)
         
         # Сортировка
-        if sort_by == 'popular':
-            products_list = products_list.order_by('-num_sales')
+        if sort_by == 'relevance' and search_query:
+            ordering = ['search_rank']
+        elif sort_by == 'popular':
+            ordering = ['-num_sales']
         elif sort_by == 'rating':
-            products_list = products_list.annotate(avg_rating=Avg('reviews__rating')).order_by('-avg_rating')
+            ordering = ['-avg_rating']
         elif sort_by == 'price_low':
-            products_list = products_list.order_by('price')
+            ordering = ['price']
         elif sort_by == 'price_high':
-            products_list = products_list.order_by('-price')
+            ordering = ['-price']
         else:  # newest
-            products_list = products_list.order_by('-created_at')
+            ordering = ['-created_at']
+        
+        # Постраничная навигация по курсору
+        total_count = products_list.count()
+        page = KeysetPaginator(products_list, ordering, per_page=PRODUCTS_PER_PAGE).paginate_request(request)
         
         # Данные для фильтров
-        categories = Category.objects.all()
+        categories = cached_queryset('categories', [Category], Category.objects.all())
         regions = Producer.REGIONS
         
     except Exception:
         # Если таблицы еще не созданы
-        products_list = []
+        page = []
+        total_count = 0
         categories = []
         regions = []
         category_filter = None
@@ -92,7 +115,10 @@ def products(request):
         sort_by = 'newest'
 
     context = {
-        'products': products_list,
+        'products': page,
+        'page': page,
+        'total_count': total_count,
+        'favorite_ids': favorite_product_ids(request.user, page),
         'categories': categories,
         'regions': regions,
         'current_category': category_filter,
@@ -107,7 +133,6 @@ def product_detail(request, pk):
     """Детальная страница товара"""
     try:
         product = get_object_or_404(Product, pk=pk, is_active=True)
-        reviews = product.reviews.all().select_related('user').order_by('-created_at')
         
         # Похожие товары
         similar_products = Product.objects.filter(
@@ -117,7 +142,8 @@ def product_detail(request, pk):
         
         context = {
             'product': product,
-            'reviews': reviews,
+            'rating_histogram': product.rating_histogram(),
+            'favorite_ids': favorite_product_ids(request.user, [product]),
             'similar_products': similar_products,
         }
         return render(request, 'frontend/product_detail.html', context)
@@ -126,6 +152,29 @@ def product_detail(request, pk):
         return render(request, 'frontend/404.html', status=404)
 
 
+def product_reviews(request, pk):
+    """JSON со страницей отзывов товара (подгружается на детальной странице)"""
+    reviews = Review.objects.filter(product_id=pk, product__is_active=True).select_related('user')
+    page = KeysetPaginator(reviews, ['-created_at'], per_page=REVIEWS_PER_PAGE).get_page(request.GET.get('cursor'))
+    
+    return JsonResponse({
+        'success': True,
+        'reviews': [
+            {
+                'id': review.id,
+                'author': review.user.get_full_name() or review.user.username,
+                'rating': review.rating,
+                'text': review.text,
+                'created_at': timezone.localtime(review.created_at).strftime('%d.%m.%Y'),
+                'is_own': review.user_id == request.user.id,
+            }
+            for review in page
+        ],
+        'next_cursor': page.next_cursor,
+        'has_next': page.has_next,
+    })
+
+
 def producers(request):
     """Список производителей"""
     try:
@@ -155,12 +204,16 @@ def producer_detail(request, pk):
     """Детальная страница производителя"""
     try:
         producer = get_object_or_404(Producer, pk=pk, is_verified=True)
-        products_list = producer.products.filter(is_active=True).order_by('-created_at')
+        products_list = producer.products.filter(is_active=True).select_related('producer', 'category')
+        page = KeysetPaginator(products_list, ['-created_at'], per_page=PRODUCTS_PER_PAGE).paginate_request(request)
         store_locations = producer.store_locations.all()
         
         context = {
             'producer': producer,
-            'products': products_list,
+            'products': page,
+            'page': page,
+            'total_count': products_list.count(),
+            'favorite_ids': favorite_product_ids(request.user, page),
             'store_locations': store_locations,
         }
         return render(request, 'frontend/producer_detail.html', context)
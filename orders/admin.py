@@ -1,45 +1,92 @@
 from django.contrib import admin
-from django.utils.html import format_html
-from django.db.models import Count, Sum, Q
-from django.urls import path
+from django.utils.html import format_html, format_html_join
+from django.db.models import Sum, Q
+from django.urls import path, reverse
 from django.shortcuts import render
-from django.http import HttpResponse
-from .models import Order
+from django.utils import timezone
+from users.models import Producer
+from users.stats import REVENUE_STATUSES
+from .exports import queue_export, should_run_in_background, streaming_export_response
+from .models import (
+    ArchivedOrder, ArchivedOrderLine, Checkout, DailyCategoryStats, DailyOrderStats, Order, OrderExport,
+    OrderLine, Notification,
+)
+from .transitions import transition_orders
+
+
+# Days shown on the revenue chart of the analytics page by default
+ANALYTICS_DAYS = 30
+
+
+def export_selection(request, queryset):
+    """``queue_export`` inputs for an export action applied to ``queryset``
+
+    "Select all" exports keep the changelist parameters and are filtered again
+    by the worker; otherwise the checked ids (one page at most) are kept.
+    """
+    if request.POST.get('select_across') == '1':
+        return {'filters': dict(request.GET.lists())}
+    return {'order_ids': list(queryset.values_list('pk', flat=True))}
+
+
+class OrderLineInline(admin.TabularInline):
+    model = OrderLine
+    extra = 0
+    fields = ['product', 'quantity', 'price']
+    readonly_fields = ['product']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product', 'product__producer')
+    
+    def has_add_permission(self, request, obj=None):
+        # Lines are created at checkout together with the order total
+        return False
+
+
+class OrderInline(admin.TabularInline):
+    model = Order
+    extra = 0
+    fields = ['producer', 'total_price', 'status', 'created_at']
+    readonly_fields = ['producer', 'total_price', 'created_at']
+    show_change_link = True
+
+
+@admin.register(Checkout)
+class CheckoutAdmin(admin.ModelAdmin):
+    list_display = ['id', 'buyer_name', 'buyer_phone', 'user', 'total_price', 'created_at']
+    list_filter = ['created_at']
+    search_fields = ['buyer_name', 'buyer_phone', 'buyer_email', 'user__username']
+    readonly_fields = ['created_at', 'total_price']
+    list_select_related = ['user']
+    date_hierarchy = 'created_at'
+    inlines = [OrderInline]
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = [
-        'id', 'product_name', 'producer_name', 'buyer_info', 'quantity', 
+        'id', 'product_name', 'producer_name', 'buyer_info', 'total_quantity', 
         'total_price', 'status', 'days_old', 'created_at'
     ]
     list_filter = [
-        'status', 'created_at', 'product__category', 'product__producer__region',
-        'product__producer__is_verified'
+        'status', 'created_at', 'lines__product__category', 'producer__region',
+        'producer__is_verified'
     ]
     search_fields = [
-        'product__name', 'user__username', 'user__first_name', 'user__last_name',
-        'buyer_name', 'buyer_phone', 'buyer_email', 'product__producer__name'
+        'lines__product__name', 'checkout__user__username', 'checkout__user__first_name',
+        'checkout__user__last_name', 'checkout__buyer_name', 'checkout__buyer_phone',
+        'checkout__buyer_email', 'producer__name'
     ]
     readonly_fields = ['created_at', 'updated_at', 'total_price']
+    raw_id_fields = ['checkout']
     list_editable = ['status']  # Now matches the field in list_display
     list_per_page = 25
     date_hierarchy = 'created_at'
+    inlines = [OrderLineInline]
     
     fieldsets = (
         ('Информация о заказе', {
-            'fields': ('user', 'product', 'quantity', 'total_price', 'status')
-        }),
-        ('Контакты покупателя', {
-            'fields': ('buyer_name', 'buyer_phone', 'buyer_email')
-        }),
-        ('Доставка', {
-            'fields': ('delivery_address', 'delivery_notes'),
-            'classes': ('collapse',)
-        }),
-        ('Управление производителем', {
-            'fields': ('producer_notes', 'estimated_ready_date', 'completed_at'),
-            'classes': ('collapse',)
+            'fields': ('checkout', 'producer', 'total_price', 'status')
         }),
         ('Даты', {
             'fields': ('created_at', 'updated_at'),
@@ -49,37 +96,43 @@ class OrderAdmin(admin.ModelAdmin):
     
     def get_queryset(self, request):
         return super().get_queryset(request).select_related(
-            'product', 'product__producer', 'user'
-        ).prefetch_related('product__category')
+            'producer', 'checkout', 'checkout__user'
+        ).prefetch_related('lines__product')
     
     def product_name(self, obj):
-        return format_html(
-            '<a href="/admin/products/product/{}/change/" target="_blank">{}</a>',
-            obj.product.id,
-            obj.product.name[:40] + ('...' if len(obj.product.name) > 40 else '')
+        return format_html_join(
+            format_html('<br/>'),
+            '<a href="/admin/products/product/{}/change/" target="_blank">{}</a> × {}',
+            (
+                (line.product.id, line.product.name[:40] + ('...' if len(line.product.name) > 40 else ''), line.quantity)
+                for line in obj.lines.all()
+            )
         )
-    product_name.short_description = 'Товар'
-    product_name.admin_order_field = 'product__name'
+    product_name.short_description = 'Товары'
     
     def producer_name(self, obj):
         return format_html(
             '<a href="/admin/users/producer/{}/change/" target="_blank">{}</a>{}',
-            obj.product.producer.id,
-            obj.product.producer.name[:20] + ('...' if len(obj.product.producer.name) > 20 else ''),
-            ' ✓' if obj.product.producer.is_verified else ' ⏳'
+            obj.producer.id,
+            obj.producer.name[:20] + ('...' if len(obj.producer.name) > 20 else ''),
+            ' ✓' if obj.producer.is_verified else ' ⏳'
         )
     producer_name.short_description = 'Производитель'
-    producer_name.admin_order_field = 'product__producer__name'
+    producer_name.admin_order_field = 'producer__name'
     
     def buyer_info(self, obj):
         return format_html(
             '<strong>{}</strong><br/><small>{}</small>{}',
-            obj.buyer_name,
-            obj.user.username,
-            f'<br/><small>{obj.buyer_phone}</small>' if obj.buyer_phone else ''
+            obj.checkout.buyer_name,
+            obj.checkout.user.username,
+            format_html('<br/><small>{}</small>', obj.checkout.buyer_phone) if obj.checkout.buyer_phone else ''
         )
     buyer_info.short_description = 'Покупатель'
     
+    def total_quantity(self, obj):
+        return obj.total_quantity
+    total_quantity.short_description = 'Количество'
+    
     def days_old(self, obj):
         days = obj.days_since_created
         if days == 0:
@@ -98,40 +151,97 @@ class OrderAdmin(admin.ModelAdmin):
         return custom_urls + urls
     
     def analytics_view(self, request):
-        """Custom analytics view for orders"""
-        from datetime import datetime, timedelta
+        """Custom analytics view for orders, read from the daily rollups"""
+        from datetime import timedelta
+        
+        try:
+            days = min(max(int(request.GET.get('days', ANALYTICS_DAYS)), 1), 366)
+        except ValueError:
+            days = ANALYTICS_DAYS
+        today = timezone.localdate()
+        period_start = today - timedelta(days=days - 1)
+        revenue = Sum('revenue', filter=Q(status__in=REVENUE_STATUSES))
         
         # Get analytics data
-        total_orders = Order.objects.count()
-        recent_orders = Order.objects.filter(created_at__gte=datetime.now() - timedelta(days=7)).count()
+        totals = DailyOrderStats.objects.aggregate(total_orders=Sum('orders'), total_revenue=revenue)
+        recent_orders = DailyOrderStats.objects.filter(
+            date__gt=today - timedelta(days=7)
+        ).aggregate(count=Sum('orders'))['count'] or 0
         
         # Orders by status
-        status_stats = Order.objects.values('status').annotate(
-            count=Count('id'),
-            total_revenue=Sum('total_price')
-        ).order_by('status')
+        status_names = dict(Order.STATUS_CHOICES)
+        status_stats = [
+            dict(row, status_display=status_names.get(row['status'], row['status']))
+            for row in DailyOrderStats.objects.values('status').annotate(
+                count=Sum('orders'),
+                total_revenue=Sum('revenue')
+            ).order_by('status')
+        ]
         
         # Top producers by orders
-        top_producers = Order.objects.values(
-            'product__producer__name',
-            'product__producer__id'
+        top_producers = DailyOrderStats.objects.values(
+            'producer__name',
+            'producer__id'
         ).annotate(
-            order_count=Count('id'),
-            total_revenue=Sum('total_price')
+            order_count=Sum('orders'),
+            total_revenue=Sum('revenue')
         ).order_by('-order_count')[:10]
         
-        # Orders needing attention
+        # Orders and revenue by producer region
+        region_names = dict(Producer.REGIONS)
+        region_stats = [
+            dict(row, region_display=region_names.get(row['producer__region'], row['producer__region']))
+            for row in DailyOrderStats.objects.values('producer__region').annotate(
+                order_count=Sum('orders'),
+                total_revenue=revenue
+            ).order_by('-order_count')
+        ]
+        
+        # Sold products by category
+        category_stats = DailyCategoryStats.objects.values('category__name').annotate(
+            order_count=Sum('orders'),
+            quantity=Sum('quantity', filter=Q(status__in=REVENUE_STATUSES)),
+            total_revenue=revenue
+        ).order_by('-order_count')
+        
+        # Revenue over the period, one row per day (days without orders included)
+        per_day = {
+            row['date']: row
+            for row in DailyOrderStats.objects.filter(date__gte=period_start).values('date').annotate(
+                order_count=Sum('orders'),
+                total_revenue=revenue
+            ).order_by()
+        }
+        daily_revenue = [
+            per_day.get(period_start + timedelta(days=offset), {
+                'date': period_start + timedelta(days=offset), 'order_count': 0, 'total_revenue': None,
+            })
+            for offset in range(days)
+        ]
+        max_revenue = max((row['total_revenue'] or 0 for row in daily_revenue), default=0)
+        for row in daily_revenue:
+            row['percent'] = round(100 * (row['total_revenue'] or 0) / max_revenue) if max_revenue else 0
+        
+        # Orders needing attention (served by order_status_created_idx)
+        now = timezone.now()
         attention_orders = Order.objects.filter(
-            Q(status='pending', created_at__lt=datetime.now() - timedelta(days=3)) |
-            Q(status='paid', created_at__lt=datetime.now() - timedelta(days=7))
-        ).select_related('product', 'product__producer', 'user')[:20]
+            Q(status='pending', created_at__lt=now - timedelta(days=3)) |
+            Q(status='paid', created_at__lt=now - timedelta(days=7))
+        ).select_related('producer', 'checkout', 'checkout__user').order_by('created_at')[:20]
         
         context = {
+            **self.admin_site.each_context(request),
             'title': 'Аналитика заказов',
-            'total_orders': total_orders,
+            'opts': self.model._meta,
+            'days': days,
+            'total_orders': totals['total_orders'] or 0,
+            'total_revenue': totals['total_revenue'] or 0,
             'recent_orders': recent_orders,
             'status_stats': status_stats,
             'top_producers': top_producers,
+            'region_stats': region_stats,
+            'category_stats': category_stats,
+            'daily_revenue': daily_revenue,
             'attention_orders': attention_orders,
         }
         
@@ -141,71 +251,133 @@ class OrderAdmin(admin.ModelAdmin):
     actions = ['mark_as_paid', 'mark_as_completed', 'mark_as_cancelled', 'export_orders']
     
     def mark_as_paid(self, request, queryset):
-        updated = queryset.filter(status='pending').update(status='paid')
-        self.message_user(request, f'{updated} заказов отмечено как оплаченные.')
+        updated = transition_orders(queryset, 'paid', forward_only=True)
+        self.message_user(request, f'{len(updated)} заказов отмечено как оплаченные.')
     mark_as_paid.short_description = "Отметить как оплаченные"
     
     def mark_as_completed(self, request, queryset):
-        updated = 0
-        for order in queryset.filter(status='paid'):
-            order.status = 'completed'
-            order.save()  # This will trigger the save method to update sales
-            updated += 1
-        self.message_user(request, f'{updated} заказов отмечено как завершенные.')
+        updated = transition_orders(queryset, 'completed', forward_only=True)
+        self.message_user(request, f'{len(updated)} заказов отмечено как завершенные.')
     mark_as_completed.short_description = "Отметить как завершенные"
     
     def mark_as_cancelled(self, request, queryset):
-        updated = queryset.filter(status__in=['pending', 'paid']).update(status='cancelled')
-        self.message_user(request, f'{updated} заказов отменено.')
+        updated = transition_orders(queryset, 'cancelled', forward_only=True)
+        self.message_user(request, f'{len(updated)} заказов отменено.')
     mark_as_cancelled.short_description = "Отменить заказы"
     
     def export_orders(self, request, queryset):
-        """Export selected orders to CSV"""
-        import csv
-        from django.http import HttpResponse
-        
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="orders.csv"'
-        response.write('\ufeff')  # BOM for Excel UTF-8 support
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'ID заказа', 'Дата', 'Товар', 'Производитель', 'Покупатель', 
-            'Телефон', 'Email', 'Количество', 'Цена за шт', 'Общая сумма', 'Статус'
-        ])
-        
-        for order in queryset.select_related('product', 'product__producer', 'user'):
-            writer.writerow([
-                order.id,
-                order.created_at.strftime('%d.%m.%Y %H:%M'),
-                order.product.name,
-                order.product.producer.name,
-                order.buyer_name,
-                order.buyer_phone,
-                order.buyer_email,
-                order.quantity,
-                float(order.product.price),
-                float(order.total_price),
-                order.get_status_display()
-            ])
-        
-        return response
+        """Export selected orders to CSV (streamed, or queued when large)"""
+        if should_run_in_background(queryset):
+            export = queue_export(request.user, 'orders', **export_selection(request, queryset))
+            self.message_user(request, format_html(
+                'Заказов слишком много для выгрузки сразу: <a href="{}">выгрузка #{}</a> поставлена в очередь, '
+                'ссылка на файл появится, когда она будет готова.',
+                reverse('admin:orders_orderexport_change', args=[export.pk]), export.pk,
+            ))
+            return None
+        return streaming_export_response(queryset)
     export_orders.short_description = "Экспорт в CSV"
     
     # Override changelist view to show summary
     def changelist_view(self, request, extra_context=None):
         extra_context = extra_context or {}
         
-        # Add summary statistics
-        summary = Order.objects.aggregate(
-            total_orders=Count('id'),
-            total_revenue=Sum('total_price'),
-            pending_orders=Count('id', filter=Q(status='pending')),
-            paid_orders=Count('id', filter=Q(status='paid')),
-            completed_orders=Count('id', filter=Q(status='completed')),
+        # Add summary statistics (from the daily rollups)
+        summary = DailyOrderStats.objects.aggregate(
+            total_orders=Sum('orders'),
+            total_revenue=Sum('revenue'),
+            pending_orders=Sum('orders', filter=Q(status='pending')),
+            paid_orders=Sum('orders', filter=Q(status='paid')),
+            completed_orders=Sum('orders', filter=Q(status='completed')),
         )
         
         extra_context['summary'] = summary
-        extra_context['analytics_url'] = '/admin/orders/order/analytics/'
+        extra_context['analytics_url'] = reverse('admin:orders_analytics')
         
-        return super().changelist_view(request, extra_context)
\ No newline at end of file
+        return super().changelist_view(request, extra_context)
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'recipient', 'producer', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['recipient', 'subject', 'producer__name']
+    readonly_fields = ['created_at', 'sent_at', 'attempts', 'last_error']
+    list_select_related = ['producer']
+    actions = ['retry_notifications']
+    
+    def retry_notifications(self, request, queryset):
+        updated = queryset.exclude(status__in=('sent', 'sending')).update(
+            status='pending', attempts=0, next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f'{updated} уведомлений поставлено в очередь повторно.')
+    retry_notifications.short_description = "Отправить повторно"
+
+
+class ArchivedOrderLineInline(admin.TabularInline):
+    model = ArchivedOrderLine
+    extra = 0
+    fields = ['product_name', 'quantity', 'price']
+    readonly_fields = fields
+    can_delete = False
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    """Read-only view of orders moved by the archive_orders command"""
+    list_display = ['id', 'producer_name', 'buyer_name', 'total_price', 'status', 'created_at', 'archived_at']
+    list_filter = ['status', 'created_at', 'producer__region']
+    search_fields = ['id', 'producer_name', 'checkout__buyer_name', 'checkout__buyer_phone', 'lines__product_name']
+    list_select_related = ['checkout']
+    date_hierarchy = 'created_at'
+    inlines = [ArchivedOrderLineInline]
+    actions = ['export_orders']
+    
+    def buyer_name(self, obj):
+        return obj.checkout.buyer_name
+    buyer_name.short_description = 'Покупатель'
+    buyer_name.admin_order_field = 'checkout__buyer_name'
+    
+    def export_orders(self, request, queryset):
+        """Export selected archived orders to CSV (streamed, or queued when large)"""
+        orders = Order.objects.none()
+        if should_run_in_background(orders, queryset):
+            export = queue_export(request.user, 'archive', **export_selection(request, queryset))
+            self.message_user(request, format_html(
+                'Заказов слишком много для выгрузки сразу: <a href="{}">выгрузка #{}</a> поставлена в очередь.',
+                reverse('admin:orders_orderexport_change', args=[export.pk]), export.pk,
+            ))
+            return None
+        return streaming_export_response(orders, filename='archived-orders.csv', archived=queryset)
+    export_orders.short_description = "Экспорт в CSV"
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(OrderExport)
+class OrderExportAdmin(admin.ModelAdmin):
+    list_display = ['id', 'requested_by', 'producer', 'status', 'rows', 'created_at', 'finished_at', 'download_link']
+    list_filter = ['status', 'created_at']
+    list_select_related = ['requested_by', 'producer']
+    fields = ['requested_by', 'producer', 'status', 'attempts', 'rows', 'error', 'created_at', 'finished_at', 'download_link']
+    readonly_fields = fields
+    
+    def download_link(self, obj):
+        if obj.status != 'done':
+            return '-'
+        return format_html('<a href="{}">Скачать</a>', reverse('order_export_download', args=[obj.pk]))
+    download_link.short_description = 'Файл'
+    
+    def has_add_permission(self, request):
+        # Exports are queued from the order list action
+        return False
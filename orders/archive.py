@@ -0,0 +1,97 @@
+"""
+Archive of old orders.
+
+Completed and cancelled orders that were created, and last changed, more than
+``ORDER_ARCHIVE_AFTER_DAYS`` days ago are moved by the ``archive_orders``
+management command into ``ArchivedOrder``/``ArchivedOrderLine``, in batches
+of one transaction each. The archive keeps the order ids, so links such as
+"order #123" stay valid, and stores the producer and product names.
+
+Live tables then only hold recent and open orders. Code that shows history
+reads both: the daily rollups, producer stats, the buyer's order list, the
+producer's order list and the CSV exports union the archive.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedOrderLine, Order, OrderLine
+from .rollups import rollups_unchanged
+
+
+# Defaults, overridable in settings
+ORDER_ARCHIVE_AFTER_DAYS = 180
+
+# Orders in these statuses no longer change and can be archived
+ARCHIVE_STATUSES = ('completed', 'cancelled')
+
+
+def _setting(name):
+    return getattr(settings, name, globals()[name])
+
+
+def archive_cutoff(days=None):
+    """Orders older than this moment may be archived"""
+    if days is None:
+        days = _setting('ORDER_ARCHIVE_AFTER_DAYS')
+    return timezone.now() - timedelta(days=days)
+
+
+def archivable_orders(cutoff):
+    return Order.objects.filter(
+        status__in=ARCHIVE_STATUSES, created_at__lt=cutoff, updated_at__lt=cutoff
+    )
+
+
+def archive_batch(cutoff, batch_size=1000):
+    """Move one batch of archivable orders; return the number of orders moved"""
+    with transaction.atomic():
+        orders = list(
+            archivable_orders(cutoff)
+            .select_for_update(of=('self',))
+            .order_by('created_at', 'pk')
+            .values(
+                'pk', 'checkout_id', 'producer_id', 'producer__name', 'total_price', 'status',
+                'created_at', 'updated_at', 'search_phone', 'search_text',
+            )[:batch_size]
+        )
+        if not orders:
+            return 0
+        order_ids = [order['pk'] for order in orders]
+
+        ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(
+                id=order['pk'],
+                checkout_id=order['checkout_id'],
+                producer_id=order['producer_id'],
+                producer_name=order['producer__name'],
+                total_price=order['total_price'],
+                status=order['status'],
+                created_at=order['created_at'],
+                updated_at=order['updated_at'],
+                search_phone=order['search_phone'],
+                search_text=order['search_text'],
+            )
+            for order in orders
+        ])
+        ArchivedOrderLine.objects.bulk_create([
+            ArchivedOrderLine(
+                order_id=order_id, product_id=product_id, product_name=product_name,
+                quantity=quantity, price=price,
+            )
+            for order_id, product_id, product_name, quantity, price in (
+                OrderLine.objects.filter(order_id__in=order_ids)
+                .order_by('order_id', 'pk')
+                .values_list('order_id', 'product_id', 'product__name', 'quantity', 'price')
+            )
+        ])
+
+        # The rollups count the archive too, so moving orders changes no totals
+        with rollups_unchanged():
+            Order.objects.filter(pk__in=order_ids).delete()
+
+    return len(order_ids)
+
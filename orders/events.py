@@ -0,0 +1,248 @@
+"""
+Live order events over Server-Sent Events.
+
+Order creation and status changes are published, once the transaction
+commits, to the channels ``producer:<id>`` and ``user:<id>`` (the buyer).
+The streaming views subscribe to one channel and forward its events to the
+browser; an idle connection only costs a keep-alive comment every
+``ORDER_EVENTS_KEEPALIVE`` seconds.
+
+The broker is selected by ``settings.ORDER_EVENTS_BROKER`` (dotted path):
+
+* ``orders.events.LocalBroker`` (default) - in-process queues, enough for a
+  single ASGI worker process;
+* ``orders.events.DatabaseBroker`` - events are also written to the
+  ``OrderEvent`` table and every process polls it once per
+  ``ORDER_EVENTS_POLL_INTERVAL`` seconds, so several worker processes share
+  events without an external service.
+
+Streams need an ASGI server; under WSGI the views answer 204, which tells
+``EventSource`` not to reconnect and the pages fall back to polling.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Order, OrderEvent
+
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable in settings
+ORDER_EVENTS_BROKER = 'orders.events.LocalBroker'
+ORDER_EVENTS_KEEPALIVE = 15  # seconds between keep-alive comments
+ORDER_EVENTS_POLL_INTERVAL = 1  # seconds, DatabaseBroker only
+ORDER_EVENTS_RETENTION = 60 * 60  # seconds an OrderEvent row is kept
+ORDER_EVENTS_PRUNE_INTERVAL = 5 * 60  # seconds between deletes of old rows
+
+STATUS_NAMES = dict(Order.STATUS_CHOICES)
+
+
+def _setting(name):
+    return getattr(settings, name, globals()[name])
+
+
+def producer_channel(producer_id):
+    return f'producer:{producer_id}'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+class LocalBroker:
+    """Fan events out to subscribers of the current process
+
+    ``publish`` may be called from any thread; events are handed to each
+    subscriber's event loop with ``call_soon_threadsafe``.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, event):
+        self.dispatch(channel, event)
+
+    def dispatch(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # The subscriber's loop is already closed
+                pass
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        """Queue receiving the events of ``channel`` while the block runs"""
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers[channel].add(subscriber)
+        await self._subscribed()
+        try:
+            yield subscriber[1]
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(subscriber)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+            await self._unsubscribed()
+
+    async def _subscribed(self):
+        pass
+
+    async def _unsubscribed(self):
+        pass
+
+
+class DatabaseBroker(LocalBroker):
+    """Share events between processes through the ``OrderEvent`` table
+
+    Publishing inserts a row. While the process has subscribers, one task per
+    process reads the rows added since its last poll and dispatches them
+    locally, so the database load does not depend on the number of clients.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._poller = None
+        self._last_id = None
+        self._pruned_at = None
+
+    def publish(self, channel, event):
+        OrderEvent.objects.create(channel=channel, payload=event)
+
+    async def _subscribed(self):
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.get_running_loop().create_task(self._poll())
+
+    async def _unsubscribed(self):
+        with self._lock:
+            idle = not self._subscribers
+        if idle and self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+            # Nobody was listening in between, the next poller starts from the end
+            self._last_id = None
+
+    def _prune_events(self):
+        now = timezone.now()
+        if self._pruned_at is not None and now - self._pruned_at < timedelta(
+            seconds=_setting('ORDER_EVENTS_PRUNE_INTERVAL')
+        ):
+            return
+        self._pruned_at = now
+        OrderEvent.objects.filter(
+            created_at__lt=now - timedelta(seconds=_setting('ORDER_EVENTS_RETENTION'))
+        ).delete()
+
+    def _read_events(self):
+        self._prune_events()
+        if self._last_id is None:
+            last = OrderEvent.objects.order_by('-pk').values_list('pk', flat=True).first()
+            self._last_id = last or 0
+            return []
+        events = list(
+            OrderEvent.objects.filter(pk__gt=self._last_id)
+            .order_by('pk')
+            .values_list('pk', 'channel', 'payload')
+        )
+        if events:
+            self._last_id = events[-1][0]
+        return events
+
+    async def _poll(self):
+        interval = _setting('ORDER_EVENTS_POLL_INTERVAL')
+        while True:
+            try:
+                events = await sync_to_async(self._read_events, thread_sensitive=False)()
+            except Exception:
+                logger.exception('Failed to read order events')
+                events = []
+            for _, channel, payload in events:
+                self.dispatch(channel, payload)
+            await asyncio.sleep(interval)
+
+
+_broker = None
+
+
+def get_broker():
+    """Return the configured broker instance"""
+    global _broker
+    if _broker is None:
+        _broker = import_string(_setting('ORDER_EVENTS_BROKER'))()
+    return _broker
+
+
+def order_event(event_type, order_id, status, producer_id, user_id):
+    """Event payload plus the channels it is published to"""
+    return {
+        'type': event_type,
+        'order_id': order_id,
+        'status': status,
+        'status_display': STATUS_NAMES.get(status, status),
+        'channels': [producer_channel(producer_id), user_channel(user_id)],
+    }
+
+
+def publish_order_events(events):
+    """Publish events built by ``order_event`` after the transaction commits"""
+    if not events:
+        return
+
+    def publish():
+        broker = get_broker()
+        for event in events:
+            payload = {key: value for key, value in event.items() if key != 'channels'}
+            for channel in event['channels']:
+                try:
+                    broker.publish(channel, payload)
+                except Exception:
+                    logger.exception('Failed to publish order event to %s', channel)
+
+    transaction.on_commit(publish)
+
+
+def format_event(event):
+    return f'event: {event["type"]}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n'
+
+
+async def _event_stream(channel):
+    keepalive = _setting('ORDER_EVENTS_KEEPALIVE')
+    async with get_broker().subscribe(channel) as queue:
+        # Reconnect after 5 seconds if the connection drops
+        yield 'retry: 5000\n\n'
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            yield format_event(event)
+
+
+def event_stream_response(request, channel):
+    """SSE response streaming ``channel``; 204 when not served over ASGI"""
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(_event_stream(channel), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Tell nginx not to buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,268 @@
+"""
+CSV export of orders, one row per order line.
+
+Rows are read with ``values_list`` (only the exported columns) through a
+chunked server-side iterator and written straight to the client with a
+``StreamingHttpResponse``, so memory use does not depend on the size of the
+export. Archived orders are read from the archive tables (which store the
+product and producer names) and merged into the same date order.
+
+Exports of more than ``ORDER_EXPORT_STREAM_MAX_ORDERS`` orders are not run
+inside the request: ``queue_export`` stores the filter inputs of the export
+(the producer page filters, the admin changelist parameters or the selected
+order ids) in an ``OrderExport`` row, and the ``run_order_exports``
+management command rebuilds the orders from them and writes a gzipped CSV file that the user downloads through
+``order_export_download``. A worker claims an export with a conditional
+UPDATE and holds it for ``ORDER_EXPORT_TIMEOUT`` seconds; an export whose
+worker died is picked up again after that, up to
+``ORDER_EXPORT_MAX_ATTEMPTS`` times. Finished files are deleted after
+``ORDER_EXPORT_RETENTION`` days.
+"""
+
+import csv
+import gzip
+import heapq
+import io
+import logging
+import secrets
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import F, Q
+from django.http import HttpRequest, QueryDict, StreamingHttpResponse
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedOrderLine, Order, OrderExport, OrderLine
+from .search import producer_order_querysets
+
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable in settings
+ORDER_EXPORT_STREAM_MAX_ORDERS = 20000  # larger exports run in the background
+ORDER_EXPORT_CHUNK_SIZE = 2000  # rows fetched from the database at a time
+ORDER_EXPORT_RETENTION = 7  # days a finished export file is kept
+ORDER_EXPORT_TIMEOUT = 60 * 60  # seconds before a running export is taken over
+ORDER_EXPORT_MAX_ATTEMPTS = 3
+
+EXPORT_HEADER = [
+    'ID заказа', 'Дата', 'Товар', 'Производитель', 'Покупатель',
+    'Телефон', 'Email', 'Количество', 'Цена за шт', 'Общая сумма', 'Статус'
+]
+
+EXPORT_COLUMNS = [
+    'order_id', 'order__created_at', 'product__name', 'order__producer__name',
+    'order__checkout__buyer_name', 'order__checkout__buyer_phone', 'order__checkout__buyer_email',
+    'quantity', 'price', 'order__status', 'pk',
+]
+
+# Archive lines carry the names themselves
+ARCHIVE_EXPORT_COLUMNS = [
+    'order_id', 'order__created_at', 'product_name', 'order__producer_name',
+    'order__checkout__buyer_name', 'order__checkout__buyer_phone', 'order__checkout__buyer_email',
+    'quantity', 'price', 'order__status', 'pk',
+]
+
+STATUS_NAMES = dict(Order.STATUS_CHOICES)
+
+
+def _setting(name):
+    return getattr(settings, name, globals()[name])
+
+
+def _export_lines(line_model, orders, columns):
+    lines = line_model.objects.filter(order__in=orders.order_by().values('pk')).order_by(
+        '-order__created_at', 'order_id', 'pk'
+    ).values_list(*columns)
+    return lines.iterator(chunk_size=_setting('ORDER_EXPORT_CHUNK_SIZE'))
+
+
+def _line_sort_key(line):
+    # Newest orders first, then order id and line id, as in the queries
+    return -line[1].timestamp(), line[0], line[-1]
+
+
+def export_rows(orders, archived=None):
+    """CSV rows (without the header) of the lines of the ``orders`` queryset
+
+    Lines of the ``archived`` ArchivedOrder queryset, if given, are merged in.
+    """
+    lines = _export_lines(OrderLine, orders, EXPORT_COLUMNS)
+    if archived is not None:
+        lines = heapq.merge(
+            lines, _export_lines(ArchivedOrderLine, archived, ARCHIVE_EXPORT_COLUMNS), key=_line_sort_key
+        )
+    for (order_id, created_at, product, producer, buyer_name, buyer_phone, buyer_email,
+         quantity, price, status, _) in lines:
+        yield [
+            order_id,
+            timezone.localtime(created_at).strftime('%d.%m.%Y %H:%M'),
+            product,
+            producer,
+            buyer_name,
+            buyer_phone,
+            buyer_email,
+            quantity,
+            float(price),
+            float(price * quantity),
+            STATUS_NAMES.get(status, status),
+        ]
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(orders, archived):
+    writer = csv.writer(_Echo())
+    yield '\ufeff'  # BOM for Excel UTF-8 support
+    yield writer.writerow(EXPORT_HEADER)
+    for row in export_rows(orders, archived):
+        yield writer.writerow(row)
+
+
+def streaming_export_response(orders, filename='orders.csv', archived=None):
+    """CSV of ``orders`` (and ``archived`` orders) streamed to the client while it is read"""
+    response = StreamingHttpResponse(_csv_lines(orders, archived), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def should_run_in_background(orders, archived=None):
+    """Whether the export of ``orders`` is too large to stream from the request"""
+    count = orders.order_by().count()
+    if archived is not None:
+        count += archived.order_by().count()
+    return count > _setting('ORDER_EXPORT_STREAM_MAX_ORDERS')
+
+
+def queue_export(user, source, producer=None, filters=None, order_ids=None):
+    """Queue a background export of the orders selected by the given inputs
+
+    ``source`` is ``OrderExport.SOURCE_CHOICES``: the producer's order page
+    (``filters`` holds its ``status`` and ``search``), or the order or
+    archive admin changelist (``filters`` holds the changelist parameters,
+    ``order_ids`` the selected ids when the action was not applied to every
+    matching order).
+    """
+    return OrderExport.objects.create(
+        requested_by=user,
+        producer=producer,
+        source=source,
+        filters=filters or {},
+        order_ids=order_ids,
+    )
+
+
+def changelist_queryset(model, params, user):
+    """Queryset the admin changelist of ``model`` shows ``user`` for ``params``"""
+    from django.contrib import admin
+    
+    request = HttpRequest()
+    request.method = 'GET'
+    request.user = user
+    request.GET = QueryDict(mutable=True)
+    for key, values in params.items():
+        request.GET.setlist(key, values)
+    return admin.site.get_model_admin(model).get_changelist_instance(request).queryset
+
+
+def export_querysets(export):
+    """(orders, archived orders or None) selected by an ``OrderExport``"""
+    if export.source == 'producer':
+        return producer_order_querysets(
+            export.producer, export.filters.get('status'), export.filters.get('search', '')
+        )
+    model = ArchivedOrder if export.source == 'archive' else Order
+    if export.order_ids is not None:
+        queryset = model.objects.filter(pk__in=export.order_ids)
+    else:
+        queryset = changelist_queryset(model, export.filters, export.requested_by)
+    if model is ArchivedOrder:
+        return Order.objects.none(), queryset
+    return queryset, None
+
+
+def write_export(export):
+    """Write the gzipped CSV file of ``export`` and mark it done"""
+    rows = 0
+    with tempfile.TemporaryFile() as tmp:
+        with gzip.GzipFile(fileobj=tmp, mode='wb') as compressed:
+            text = io.TextIOWrapper(compressed, encoding='utf-8-sig', newline='')
+            writer = csv.writer(text)
+            writer.writerow(EXPORT_HEADER)
+            for row in export_rows(*export_querysets(export)):
+                writer.writerow(row)
+                rows += 1
+            text.flush()
+            text.detach()
+        tmp.seek(0)
+        # Unguessable name, the file must only be reachable through the download view
+        export.file.save(f'orders-{export.pk}-{secrets.token_urlsafe(16)}.csv.gz', File(tmp), save=False)
+    export.rows = rows
+    export.status = 'done'
+    export.finished_at = timezone.now()
+    export.save(update_fields=['file', 'rows', 'status', 'finished_at'])
+
+
+def claim_export():
+    """Claim the oldest queued export for this worker; return it or None
+
+    The export is moved to ``running`` with a conditional UPDATE on the
+    values just read, so of two workers only one gets it without any row
+    locks. Running exports whose lease has expired are claimed again, or
+    failed once they used up ``ORDER_EXPORT_MAX_ATTEMPTS``.
+    """
+    now = timezone.now()
+    lease_until = now + timedelta(seconds=_setting('ORDER_EXPORT_TIMEOUT'))
+    max_attempts = _setting('ORDER_EXPORT_MAX_ATTEMPTS')
+    candidates = (
+        OrderExport.objects.filter(Q(status='pending') | Q(status='running', lease_expires_at__lte=now))
+        .order_by('created_at', 'pk')
+        .values_list('pk', 'status', 'lease_expires_at', 'attempts')
+    )
+    for pk, status, lease_expires_at, attempts in candidates[:10]:
+        claim = OrderExport.objects.filter(pk=pk, status=status, lease_expires_at=lease_expires_at)
+        if attempts >= max_attempts:
+            claim.update(status='failed', error='Выгрузка прервалась, запросите ее заново', finished_at=now)
+            continue
+        if claim.update(status='running', lease_expires_at=lease_until, attempts=F('attempts') + 1):
+            return OrderExport.objects.get(pk=pk)
+    return None
+
+
+def run_next_export():
+    """Claim and run the oldest queued export; return it, or None if the queue is empty"""
+    export = claim_export()
+    if export is None:
+        return None
+
+    try:
+        write_export(export)
+    except Exception as e:
+        logger.exception('Order export %s failed', export.pk)
+        export.status = 'failed'
+        export.error = str(e)
+        export.finished_at = timezone.now()
+        export.save(update_fields=['status', 'error', 'finished_at'])
+    return export
+
+
+def delete_expired_exports():
+    """Remove finished exports (and their files) older than the retention period"""
+    expired = OrderExport.objects.filter(
+        status__in=['done', 'failed'],
+        finished_at__lt=timezone.now() - timedelta(days=_setting('ORDER_EXPORT_RETENTION')),
+    )
+    count = 0
+    for export in expired:
+        if export.file:
+            export.file.delete(save=False)
+        export.delete()
+        count += 1
+    return count
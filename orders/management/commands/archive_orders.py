@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.archive import archivable_orders, archive_batch, archive_cutoff
+
+
+class Command(BaseCommand):
+    help = (
+        'Move completed and cancelled orders older than ORDER_ARCHIVE_AFTER_DAYS '
+        '(or --days) into the archive tables, in batches'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Archive orders created and last changed more than this many days ago',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of orders moved per transaction',
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            default=None,
+            help='Stop after this many batches (to spread a large backlog over several runs)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many orders would be archived',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff(options['days'])
+        if options['dry_run']:
+            count = archivable_orders(cutoff).count()
+            self.stdout.write(f'{count} orders created before {cutoff:%Y-%m-%d %H:%M} would be archived')
+            return
+
+        started = time.perf_counter()
+        moved = batches = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            count = archive_batch(cutoff, options['batch_size'])
+            if not count:
+                break
+            moved += count
+            batches += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {moved} orders archived')
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {moved} orders in {batches} batches ({time.perf_counter() - started:.1f}s)'
+        ))
@@ -0,0 +1,179 @@
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+
+from orders.models import Checkout, Order, OrderLine
+from products.cache import bump_generations
+from products.models import Category, Product
+from users.models import Producer
+
+
+BATCH_SIZE = 10000
+ORDERS_PER_CHECKOUT = 5
+PRODUCTS_PER_PRODUCER = 20
+STATUSES = [status for status, _ in Order.STATUS_CHOICES]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare producer-scoped order queries that join through order lines and '
+        'products with the same queries on the Order.producer column'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--orders',
+            type=int,
+            default=1000000,
+            help='Number of synthetic orders to generate',
+        )
+        parser.add_argument(
+            '--producers',
+            type=int,
+            default=500,
+            help='Number of synthetic producers the orders are spread over',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='How many times each query is run for the timing',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the generated data instead of rolling it back',
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        try:
+            with transaction.atomic():
+                producer = self.generate(options['orders'], options['producers'])
+                self.compare(producer, options['repeat'])
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            self.stdout.write('Generated data rolled back')
+
+    def generate(self, total_orders, total_producers):
+        """Create producers, products, checkouts, orders and one line per order"""
+        started = time.perf_counter()
+        rng = random.Random(42)
+        suffix = rng.randrange(10 ** 8)
+
+        users = User.objects.bulk_create([
+            User(username=f'bench-{suffix}-{number}') for number in range(total_producers + 1)
+        ])
+        buyer = users.pop()
+        producers = Producer.objects.bulk_create([
+            Producer(user=user, name=f'Benchmark {number}', description='-', region='bishkek')
+            for number, user in enumerate(users)
+        ])
+        category = Category.objects.create(name=f'Benchmark {suffix}', slug=f'benchmark-{suffix}')
+        products = Product.objects.bulk_create([
+            Product(
+                producer=producer, category=category, name=f'{producer.name} / {number}',
+                description='-', price=Decimal(rng.randint(10, 500)), image='benchmark.jpg',
+            )
+            for producer in producers
+            for number in range(PRODUCTS_PER_PRODUCER)
+        ], batch_size=BATCH_SIZE)
+        # bulk_create sends no signals; only takes effect if the data is kept
+        bump_generations(Producer, Product)
+        products_by_producer = {}
+        for product in products:
+            products_by_producer.setdefault(product.producer_id, []).append(product)
+
+        created = 0
+        while created < total_orders:
+            size = min(BATCH_SIZE, total_orders - created)
+            checkouts = Checkout.objects.bulk_create([
+                Checkout(user=buyer, buyer_name='Benchmark', buyer_phone='0')
+                for _ in range(-(-size // ORDERS_PER_CHECKOUT))
+            ])
+            picked = []
+            for number in range(size):
+                producer = rng.choice(producers)
+                product = rng.choice(products_by_producer[producer.pk])
+                quantity = rng.randint(1, 5)
+                picked.append((product, quantity))
+            orders = Order.objects.bulk_create([
+                Order(
+                    checkout=checkouts[number // ORDERS_PER_CHECKOUT],
+                    producer_id=product.producer_id,
+                    total_price=product.price * quantity,
+                    status=rng.choice(STATUSES),
+                )
+                for number, (product, quantity) in enumerate(picked)
+            ])
+            OrderLine.objects.bulk_create([
+                OrderLine(order=order, product=product, quantity=quantity, price=product.price)
+                for order, (product, quantity) in zip(orders, picked)
+            ])
+            created += size
+            if self.verbosity > 1:
+                self.stdout.write(f'  {created} orders')
+
+        if connection.vendor in ('postgresql', 'sqlite'):
+            # Fresh statistics, otherwise the planner may ignore the new indexes
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        self.stdout.write(
+            f'Generated {total_orders} orders for {total_producers} producers '
+            f'in {time.perf_counter() - started:.1f}s'
+        )
+        return producers[0]
+
+    def compare(self, producer, repeat):
+        queries = {
+            'recent orders': (
+                lambda: Order.objects.filter(lines__product__producer=producer).distinct().order_by('-created_at', '-pk')[:20],
+                lambda: Order.objects.filter(producer=producer).order_by('-created_at', '-pk')[:20],
+            ),
+            'status counts and revenue': (
+                lambda: Order.objects.filter(
+                    pk__in=OrderLine.objects.filter(product__producer=producer).values('order_id')
+                ).values('status').annotate(count=Count('id'), revenue=Sum('total_price')).order_by(),
+                lambda: Order.objects.filter(producer=producer).values('status').annotate(
+                    count=Count('id'), revenue=Sum('total_price')
+                ).order_by(),
+            ),
+            'top producers': (
+                lambda: OrderLine.objects.values('product__producer_id').annotate(
+                    orders=Count('order_id', distinct=True),
+                    revenue=Sum('order__total_price', filter=Q(order__status__in=['paid', 'completed'])),
+                ).order_by('-orders', 'product__producer_id')[:10],
+                lambda: Order.objects.values('producer_id').annotate(
+                    orders=Count('id'),
+                    revenue=Sum('total_price', filter=Q(status__in=['paid', 'completed'])),
+                ).order_by('-orders', 'producer_id')[:10],
+            ),
+        }
+        for title, variants in queries.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n{title}'))
+            results = []
+            for label, build in zip(('join via products', 'producer column'), variants):
+                queryset = build()
+                timings = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    rows = list(build())
+                    timings.append(time.perf_counter() - started)
+                results.append([
+                    tuple(row.values()) if isinstance(row, dict) else row.pk for row in rows
+                ])
+                self.stdout.write(f'{label}: {min(timings) * 1000:.1f} ms (best of {repeat})')
+                self.stdout.write(queryset.explain())
+            if sorted(results[0]) != sorted(results[1]):
+                self.stdout.write(self.style.WARNING('Results differ between the two queries'))
@@ -0,0 +1,38 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from orders.rollups import rebuild_daily_stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the daily order rollups used by the admin analytics '
+        '(all days, or only the last --days)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Only refresh this many most recent days (including today)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of (day, producer) buckets refreshed per transaction',
+        )
+
+    def handle(self, *args, **options):
+        start = None
+        if options['days'] is not None:
+            start = timezone.localdate() - timedelta(days=max(options['days'], 1) - 1)
+        started = time.perf_counter()
+        buckets = rebuild_daily_stats(start=start, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {buckets} day/producer buckets in {time.perf_counter() - started:.1f}s'
+        ))
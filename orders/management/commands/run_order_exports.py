@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.exports import delete_expired_exports, run_next_export
+
+
+class Command(BaseCommand):
+    help = 'Write queued background order exports to gzipped CSV files (run continuously with --loop)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling the queue instead of exiting when it is empty',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=10,
+            help='Seconds to sleep between polls when the queue is empty (with --loop)',
+        )
+
+    def handle(self, *args, **options):
+        done = failed = 0
+        try:
+            while True:
+                export = run_next_export()
+                if export is not None:
+                    if export.status == 'done':
+                        done += 1
+                        self.stdout.write(f'Export #{export.pk}: {export.rows} rows')
+                    else:
+                        failed += 1
+                        self.stdout.write(self.style.ERROR(f'Export #{export.pk} failed: {export.error}'))
+                    continue
+                expired = delete_expired_exports()
+                if expired:
+                    self.stdout.write(f'Deleted {expired} expired exports')
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Done: {done} exported, {failed} failed'))
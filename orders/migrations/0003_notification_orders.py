@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-16 20:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='orders',
+            field=models.ManyToManyField(blank=True, related_name='notifications', to='orders.order', verbose_name='Заказы'),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='body',
+            field=models.TextField(blank=True, verbose_name='Текст'),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='subject',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Тема'),
+        ),
+    ]
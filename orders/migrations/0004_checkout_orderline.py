@@ -0,0 +1,166 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+BATCH_SIZE = 1000
+
+# Orders of the same buyer created this close to each other came from one checkout
+CHECKOUT_GAP = timedelta(seconds=5)
+
+
+def split_orders(apps, schema_editor):
+    """Give every existing order a checkout header, a producer and one line"""
+    Checkout = apps.get_model('orders', 'Checkout')
+    Order = apps.get_model('orders', 'Order')
+    OrderLine = apps.get_model('orders', 'OrderLine')
+
+    # Group orders into checkouts: same buyer, created within CHECKOUT_GAP
+    groups = []
+    previous = None
+    orders = Order.objects.select_related('product').order_by('user_id', 'created_at', 'pk')
+    for order in orders.iterator(chunk_size=BATCH_SIZE):
+        if (previous is None or previous.user_id != order.user_id
+                or order.created_at - previous.created_at > CHECKOUT_GAP):
+            groups.append((order, []))
+        groups[-1][1].append((order.pk, order.product.producer_id, order.product_id, order.quantity, order.total_price))
+        previous = order
+
+    for start in range(0, len(groups), BATCH_SIZE):
+        batch = groups[start:start + BATCH_SIZE]
+        checkouts = Checkout.objects.bulk_create([
+            Checkout(
+                user_id=first.user_id,
+                total_price=sum(row[4] for row in rows),
+                buyer_name=first.buyer_name,
+                buyer_phone=first.buyer_phone,
+                buyer_email=first.buyer_email,
+                delivery_address=first.delivery_address,
+                delivery_notes=first.delivery_notes,
+            )
+            for first, rows in batch
+        ])
+        updated_orders = []
+        lines = []
+        for checkout, (first, rows) in zip(checkouts, batch):
+            for order_id, producer_id, product_id, quantity, total_price in rows:
+                updated_orders.append(Order(pk=order_id, checkout_id=checkout.pk, producer_id=producer_id))
+                price = total_price / quantity if quantity else total_price
+                lines.append(OrderLine(
+                    order_id=order_id,
+                    product_id=product_id,
+                    quantity=quantity,
+                    price=price.quantize(Decimal('0.01')),
+                ))
+        Order.objects.bulk_update(updated_orders, ['checkout', 'producer'])
+        OrderLine.objects.bulk_create(lines)
+
+    # auto_now_add stamped the migration time; use the first order's time instead
+    Checkout.objects.update(created_at=Subquery(
+        Order.objects.filter(checkout=OuterRef('pk')).order_by('created_at').values('created_at')[:1]
+    ))
+
+
+def merge_orders(apps, schema_editor):
+    """Copy the checkout and first line back onto the order"""
+    Order = apps.get_model('orders', 'Order')
+    for order in Order.objects.select_related('checkout').prefetch_related('lines').iterator(chunk_size=1000):
+        line = order.lines.all()[0]
+        Order.objects.filter(pk=order.pk).update(
+            user_id=order.checkout.user_id,
+            product_id=line.product_id,
+            quantity=line.quantity,
+            buyer_name=order.checkout.buyer_name,
+            buyer_phone=order.checkout.buyer_phone,
+            buyer_email=order.checkout.buyer_email,
+            delivery_address=order.checkout.delivery_address,
+            delivery_notes=order.checkout.delivery_notes,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_notification_orders'),
+        ('products', '0004_product_rating_histogram'),
+        ('users', '0003_userprofile_favorite'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Checkout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_price', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Общая стоимость')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('buyer_name', models.CharField(max_length=100, verbose_name='Имя покупателя')),
+                ('buyer_phone', models.CharField(max_length=20, verbose_name='Телефон покупателя')),
+                ('buyer_email', models.EmailField(blank=True, max_length=254, verbose_name='Email покупателя')),
+                ('delivery_address', models.TextField(blank=True, verbose_name='Адрес доставки')),
+                ('delivery_notes', models.TextField(blank=True, verbose_name='Примечания к доставке')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkouts', to=settings.AUTH_USER_MODEL, verbose_name='Покупатель')),
+            ],
+            options={
+                'verbose_name': 'Оформление заказа',
+                'verbose_name_plural': 'Оформления заказов',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1, verbose_name='Количество')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена за шт')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='orders.order', verbose_name='Заказ')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_lines', to='products.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Товар в заказе',
+                'verbose_name_plural': 'Товары в заказе',
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='checkout',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='orders.checkout', verbose_name='Оформление'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='producer',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='users.producer', verbose_name='Производитель'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Общая стоимость'),
+        ),
+        # Relax the per-order buyer fields so that 0005 can drop them and,
+        # on the way back, re-add them before merge_orders fills them in
+        migrations.AlterField(
+            model_name='order',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='orders', to=settings.AUTH_USER_MODEL, verbose_name='Покупатель'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='product',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='products.product', verbose_name='Товар'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='buyer_name',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Имя покупателя'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='buyer_phone',
+            field=models.CharField(blank=True, max_length=20, verbose_name='Телефон покупателя'),
+        ),
+        migrations.RunPython(split_orders, merge_orders),
+    ]
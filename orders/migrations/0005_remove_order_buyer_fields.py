@@ -0,0 +1,54 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_checkout_orderline'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='order',
+            name='user',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='product',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='quantity',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='buyer_name',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='buyer_phone',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='buyer_email',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='delivery_address',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='delivery_notes',
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='checkout',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='orders.checkout', verbose_name='Оформление'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='producer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='users.producer', verbose_name='Производитель'),
+        ),
+    ]
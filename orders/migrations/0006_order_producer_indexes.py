@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-16 21:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_remove_order_buyer_fields'),
+        ('users', '0003_userprofile_favorite'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='producer',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='users.producer', verbose_name='Производитель'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['producer', 'status', 'total_price'], name='order_producer_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['producer', '-created_at', '-id'], name='order_producer_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-16 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_order_producer_indexes'),
+        ('users', '0003_userprofile_favorite'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['producer', 'updated_at'], name='order_producer_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2 on 2026-10-16 21:10
+
+import re
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 1000
+
+CHAR_FOLDING = str.maketrans({'ё': 'е', 'ө': 'о', 'ү': 'у', 'ң': 'н'})
+
+
+def normalize(text):
+    return (text or '').casefold().translate(CHAR_FOLDING)
+
+
+def normalize_phone(value):
+    digits = re.sub(r'\D', '', value or '')
+    if digits.startswith('996') and (len(digits) > 9 or (value or '').lstrip().startswith('+')):
+        digits = digits[3:]
+    return digits.lstrip('0')
+
+
+def fill_search_fields(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderLine = apps.get_model('orders', 'OrderLine')
+
+    orders = Order.objects.select_related('checkout__user').order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(orders.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        names = {}
+        for order_id, name in OrderLine.objects.filter(order__in=batch).values_list('order_id', 'product__name'):
+            names.setdefault(order_id, []).append(name)
+        for order in batch:
+            checkout, user = order.checkout, order.checkout.user
+            parts = [checkout.buyer_name, user.username, user.first_name, user.last_name]
+            parts.extend(names.get(order.pk, []))
+            order.search_phone = normalize_phone(checkout.buyer_phone)
+            order.search_text = normalize(' '.join(part for part in parts if part))
+        Order.objects.bulk_update(batch, ['search_phone', 'search_text'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_orderevent'),
+        ('users', '0003_userprofile_favorite'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='search_phone',
+            field=models.CharField(blank=True, default='', editable=False, max_length=20, verbose_name='Телефон для поиска'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Текст для поиска'),
+        ),
+        migrations.RunPython(fill_search_fields, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['producer', 'status', '-created_at', '-id'], name='order_producer_status_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['producer', 'search_phone'], name='order_producer_phone_idx'),
+        ),
+    ]
@@ -0,0 +1,123 @@
+# Generated by Django 5.2 on 2026-10-16 21:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def fill_daily_stats(apps, schema_editor):
+    OrderLine = apps.get_model('orders', 'OrderLine')
+    Order = apps.get_model('orders', 'Order')
+    DailyOrderStats = apps.get_model('orders', 'DailyOrderStats')
+    DailyCategoryStats = apps.get_model('orders', 'DailyCategoryStats')
+
+    rows = (
+        Order.objects.annotate(day=TruncDate('created_at'))
+        .values('day', 'producer_id', 'status')
+        .annotate(count=Count('id'), revenue=Sum('total_price'))
+        .order_by()
+    )
+    DailyOrderStats.objects.bulk_create([
+        DailyOrderStats(
+            date=row['day'], producer_id=row['producer_id'], status=row['status'],
+            orders=row['count'], revenue=row['revenue'] or 0,
+        )
+        for row in rows
+    ], batch_size=1000)
+
+    rows = (
+        OrderLine.objects.annotate(day=TruncDate('order__created_at'))
+        .values('day', 'order__producer_id', 'product__category_id', 'order__status')
+        .annotate(
+            count=Count('order_id', distinct=True),
+            sold=Sum('quantity'),
+            amount=Sum(F('price') * F('quantity')),
+        )
+        .order_by()
+    )
+    DailyCategoryStats.objects.bulk_create([
+        DailyCategoryStats(
+            date=row['day'], producer_id=row['order__producer_id'],
+            category_id=row['product__category_id'], status=row['order__status'],
+            orders=row['count'], quantity=row['sold'], revenue=row['amount'] or 0,
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_order_search_fields'),
+        ('products', '0004_product_rating_histogram'),
+        ('users', '0003_userprofile_favorite'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCategoryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает оплаты'), ('paid', 'Оплачен'), ('completed', 'Завершен'), ('cancelled', 'Отменен')], max_length=20, verbose_name='Статус')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='Заказов')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма')),
+            ],
+            options={
+                'verbose_name': 'Дневная сводка по категориям',
+                'verbose_name_plural': 'Дневные сводки по категориям',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyOrderStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает оплаты'), ('paid', 'Оплачен'), ('completed', 'Завершен'), ('cancelled', 'Отменен')], max_length=20, verbose_name='Статус')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='Заказов')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма')),
+            ],
+            options={
+                'verbose_name': 'Дневная сводка заказов',
+                'verbose_name_plural': 'Дневные сводки заказов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='dailycategorystats',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_order_stats', to='products.category', verbose_name='Категория'),
+        ),
+        migrations.AddField(
+            model_name='dailycategorystats',
+            name='producer',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_category_stats', to='users.producer', verbose_name='Производитель'),
+        ),
+        migrations.AddField(
+            model_name='dailyorderstats',
+            name='producer',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_order_stats', to='users.producer', verbose_name='Производитель'),
+        ),
+        migrations.AddIndex(
+            model_name='dailycategorystats',
+            index=models.Index(fields=['date'], name='daily_category_stats_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailycategorystats',
+            constraint=models.UniqueConstraint(fields=('producer', 'date', 'category', 'status'), name='daily_category_stats_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyorderstats',
+            index=models.Index(fields=['date'], name='daily_order_stats_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyorderstats',
+            constraint=models.UniqueConstraint(fields=('producer', 'date', 'status'), name='daily_order_stats_unique'),
+        ),
+        migrations.RunPython(fill_daily_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2 on 2026-10-16 21:18
+
+import django.db.models.deletion
+import orders.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_orderexport'),
+        ('products', '0004_product_rating_histogram'),
+        ('users', '0003_userprofile_favorite'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderexport',
+            name='archive_query',
+            field=models.BinaryField(blank=True, null=True, verbose_name='Запрос к архиву'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('producer_name', models.CharField(max_length=200, verbose_name='Название производителя')),
+                ('total_price', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Общая стоимость')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает оплаты'), ('paid', 'Оплачен'), ('completed', 'Завершен'), ('cancelled', 'Отменен')], max_length=20, verbose_name='Статус')),
+                ('created_at', models.DateTimeField(verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(verbose_name='Дата обновления')),
+                ('search_phone', models.CharField(blank=True, default='', max_length=20, verbose_name='Телефон для поиска')),
+                ('search_text', models.TextField(blank=True, default='', verbose_name='Текст для поиска')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')),
+                ('checkout', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to='orders.checkout', verbose_name='Оформление')),
+                ('producer', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to='users.producer', verbose_name='Производитель')),
+            ],
+            options={
+                'verbose_name': 'Архивный заказ',
+                'verbose_name_plural': 'Архивные заказы',
+                'ordering': ['-created_at'],
+            },
+            bases=(orders.models.OrderDisplayMixin, models.Model),
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_name', models.CharField(max_length=200, verbose_name='Название товара')),
+                ('quantity', models.PositiveIntegerField(default=1, verbose_name='Количество')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена за шт')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='orders.archivedorder', verbose_name='Заказ')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_order_lines', to='products.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Товар архивного заказа',
+                'verbose_name_plural': 'Товары архивных заказов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['producer', 'status', 'total_price'], name='archived_producer_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['producer', '-created_at', '-id'], name='archived_producer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['producer', 'search_phone'], name='archived_producer_phone_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['created_at'], name='archived_order_created_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-16 22:40
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fail_queued_exports(apps, schema_editor):
+    # Queued exports only stored a pickled query, which can no longer be run
+    OrderExport = apps.get_model('orders', 'OrderExport')
+    OrderExport.objects.filter(status__in=['pending', 'running']).update(
+        status='failed',
+        error='Выгрузка устарела, запросите ее заново',
+        finished_at=timezone.now(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_notification_sending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderexport',
+            name='source',
+            field=models.CharField(choices=[('producer', 'Заказы производителя'), ('orders', 'Заказы (админка)'), ('archive', 'Архив заказов (админка)')], default='orders', max_length=20, verbose_name='Источник'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='orderexport',
+            name='filters',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Фильтры'),
+        ),
+        migrations.AddField(
+            model_name='orderexport',
+            name='order_ids',
+            field=models.JSONField(blank=True, null=True, verbose_name='Выбранные заказы'),
+        ),
+        migrations.RunPython(fail_queued_exports, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='orderexport',
+            name='query',
+        ),
+        migrations.RemoveField(
+            model_name='orderexport',
+            name='archive_query',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-16 23:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0014_orderexport_filters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderexport',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Занята до'),
+        ),
+        migrations.AddField(
+            model_name='orderexport',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Попыток'),
+        ),
+    ]
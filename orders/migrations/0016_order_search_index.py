@@ -0,0 +1,64 @@
+from django.db import migrations
+
+
+SEARCH_TABLE = 'orders_order_search'
+
+BATCH_SIZE = 1000
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5('
+            f"search_text, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        insert = f'INSERT INTO {SEARCH_TABLE} (rowid, search_text) VALUES (%s, %s)'
+    elif vendor == 'postgresql':
+        # No foreign key: archived orders keep their rows under the same id
+        schema_editor.execute(
+            f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+            f'order_id bigint PRIMARY KEY, document tsvector NOT NULL)'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_idx '
+            f'ON {SEARCH_TABLE} USING GIN (document)'
+        )
+        insert = (
+            f"INSERT INTO {SEARCH_TABLE} (order_id, document) VALUES (%s, to_tsvector('simple', %s)) "
+            f'ON CONFLICT (order_id) DO NOTHING'
+        )
+    else:
+        return
+
+    for model_name in ('Order', 'ArchivedOrder'):
+        rows = (
+            apps.get_model('orders', model_name).objects.exclude(search_text='')
+            .order_by('pk').values_list('pk', 'search_text')
+        )
+        batch = []
+        with schema_editor.connection.cursor() as cursor:
+            for row in rows.iterator(chunk_size=BATCH_SIZE):
+                batch.append(row)
+                if len(batch) >= BATCH_SIZE:
+                    cursor.executemany(insert, batch)
+                    batch = []
+            if batch:
+                cursor.executemany(insert, batch)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0015_orderexport_lease'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,26 +1,23 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth.models import User
 from django.utils import timezone
-from products.models import Product
+from products.cache import bump_generations
+from products.models import Category, Product
+from users.models import Producer
 
 
-class Order(models.Model):
-    """Модель заказа (для отслеживания покупок через QR)"""
-    
-    STATUS_CHOICES = [
-        ('pending', 'Ожидает оплаты'),
-        ('paid', 'Оплачен'),
-        ('completed', 'Завершен'),
-        ('cancelled', 'Отменен'),
-    ]
+class Checkout(models.Model):
+    """Оформление заказа: покупатель и доставка, общие для всех заказов из одной корзины
+
+    Товары корзины разбиваются на заказы (Order) по производителям: каждый
+    производитель оплачивается и обрабатывает свой заказ отдельно.
+    """
     
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders', verbose_name='Покупатель')
-    product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name='Товар')
-    quantity = models.PositiveIntegerField(default=1, verbose_name='Количество')
-    total_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Общая стоимость')
-    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='Статус')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='checkouts', verbose_name='Покупатель')
+    total_price = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='Общая стоимость')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
-    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
     
     # Контактная информация покупателя
     buyer_name = models.CharField(max_length=100, verbose_name='Имя покупателя')
@@ -32,17 +29,24 @@ class Order(models.Model):
     delivery_notes = models.TextField(blank=True, verbose_name='Примечания к доставке')
     
     class Meta:
-        verbose_name = 'Заказ'
-        verbose_name_plural = 'Заказы'
+        verbose_name = 'Оформление заказа'
+        verbose_name_plural = 'Оформления заказов'
         ordering = ['-created_at']
-        
+    
     def __str__(self):
-        return f"Заказ #{self.id} - {self.product.name} ({self.get_status_display()})"
+        return f"Оформление #{self.id} - {self.buyer_name} ({self.total_price} сом)"
+
+
+class OrderDisplayMixin:
+    """Свойства для отображения, общие для заказов и архивных заказов"""
+    
+    # Архивные заказы только для чтения
+    is_archived = False
     
     @property
-    def producer(self):
-        """Get the producer of this order's product"""
-        return self.product.producer
+    def total_quantity(self):
+        """Total number of items in order (uses prefetched lines)"""
+        return sum(line.quantity for line in self.lines.all())
     
     @property
     def days_since_created(self):
@@ -59,44 +63,6 @@ class Order(models.Model):
         """Check if order needs attention (pending for more than 3 days)"""
         return self.status == 'pending' and self.days_since_created > 3
     
-    def save(self, *args, **kwargs):
-        """Автоматически рассчитывать общую стоимость и обновлять статистику"""
-        # Calculate total price if not set
-        if not self.total_price:
-            self.total_price = self.product.price * self.quantity
-        
-        # Track status changes
-        old_status = None
-        if self.pk:
-            try:
-                old_order = Order.objects.get(pk=self.pk)
-                old_status = old_order.status
-            except Order.DoesNotExist:
-                pass
-        
-        super().save(*args, **kwargs)
-        
-        # Update product sales count when status changes to completed
-        if old_status != 'completed' and self.status == 'completed':
-            self.product.num_sales += self.quantity
-            self.product.save()
-        elif old_status == 'completed' and self.status != 'completed':
-            # Decrease sales if order was completed but now changed
-            self.product.num_sales = max(0, self.product.num_sales - self.quantity)
-            self.product.save()
-    
-    def can_be_cancelled(self):
-        """Check if order can be cancelled"""
-        return self.status in ['pending', 'paid']
-    
-    def can_be_marked_paid(self):
-        """Check if order can be marked as paid"""
-        return self.status == 'pending'
-    
-    def can_be_completed(self):
-        """Check if order can be completed"""
-        return self.status == 'paid'
-    
     def get_status_color(self):
         """Get bootstrap color class for status"""
         status_colors = {
@@ -115,4 +81,382 @@ class Order(models.Model):
             'completed': 'bi-check-circle',
             'cancelled': 'bi-x-circle'
         }
-        return status_icons.get(self.status, 'bi-question-circle')
\ No newline at end of file
+        return status_icons.get(self.status, 'bi-question-circle')
+
+
+class Order(OrderDisplayMixin, models.Model):
+    """Заказ у одного производителя (для отслеживания покупок через QR)"""
+    
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает оплаты'),
+        ('paid', 'Оплачен'),
+        ('completed', 'Завершен'),
+        ('cancelled', 'Отменен'),
+    ]
+    
+    # Допустимые переходы статусов (включая исправление ошибочно выставленного статуса)
+    STATUS_TRANSITIONS = {
+        'pending': ('paid', 'cancelled'),
+        'paid': ('completed', 'cancelled', 'pending'),
+        'completed': ('paid',),
+        'cancelled': ('pending',),
+    }
+    
+    checkout = models.ForeignKey(Checkout, on_delete=models.CASCADE, related_name='orders', verbose_name='Оформление')
+    # Отдельный индекс не нужен: producer - первый столбец составных индексов ниже
+    producer = models.ForeignKey(Producer, on_delete=models.CASCADE, related_name='orders', db_index=False, verbose_name='Производитель')
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Общая стоимость')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='Статус')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+    
+    # Поля для поиска заказов производителем (заполняются при оформлении, см. orders.search)
+    search_phone = models.CharField(max_length=20, blank=True, default='', editable=False,
+                                    verbose_name='Телефон для поиска')
+    search_text = models.TextField(blank=True, default='', editable=False, verbose_name='Текст для поиска')
+    
+    class Meta:
+        verbose_name = 'Заказ'
+        verbose_name_plural = 'Заказы'
+        ordering = ['-created_at']
+        indexes = [
+            # Счетчики по статусам и выручка производителя читаются только из индекса
+            models.Index(fields=['producer', 'status', 'total_price'], name='order_producer_status_idx'),
+            # Список заказов производителя, новые сверху
+            models.Index(fields=['producer', '-created_at', '-id'], name='order_producer_created_idx'),
+            # Опрос изменений заказов с панели производителя
+            models.Index(fields=['producer', 'updated_at'], name='order_producer_updated_idx'),
+            # Список заказов производителя с фильтром по статусу
+            models.Index(fields=['producer', 'status', '-created_at', '-id'], name='order_producer_status_new_idx'),
+            # Поиск по началу номера телефона
+            models.Index(fields=['producer', 'search_phone'], name='order_producer_phone_idx'),
+            # Давно не обработанные заказы (аналитика в админке)
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+        ]
+        
+    def __str__(self):
+        return f"Заказ #{self.id} - {self.producer.name} ({self.get_status_display()})"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем статус из БД, чтобы не перечитывать заказ при сохранении
+        if 'status' in instance.__dict__:
+            instance._loaded_status = instance.status
+        return instance
+    
+    def save(self, *args, **kwargs):
+        """Сохранить заказ и обновить статистику продаж при смене статуса"""
+        # Track status changes
+        if self._state.adding:
+            old_status = None
+        elif hasattr(self, '_loaded_status'):
+            old_status = self._loaded_status
+        else:
+            # Статус не был загружен (например, .only()/.defer())
+            old_status = Order.objects.filter(pk=self.pk).values_list('status', flat=True).first()
+        
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            
+            # Update product sales count when status changes to/from completed
+            if old_status != 'completed' and self.status == 'completed':
+                adjust_sales_for_orders([self.pk], 1)
+            elif old_status == 'completed' and self.status != 'completed':
+                adjust_sales_for_orders([self.pk], -1)
+            
+            if old_status != self.status:
+                from .events import order_event, publish_order_events
+                publish_order_events([order_event(
+                    'order.created' if old_status is None else 'order.status',
+                    self.pk, self.status, self.producer_id, self._buyer_id(),
+                )])
+        
+        self._loaded_status = self.status
+    
+    def _buyer_id(self):
+        """Id покупателя без загрузки всего оформления, если оно еще не загружено"""
+        if Order.checkout.is_cached(self):
+            return self.checkout.user_id
+        return Checkout.objects.filter(pk=self.checkout_id).values_list('user_id', flat=True).first()
+    
+    def can_change_status_to(self, status):
+        """Check if order may move from its current status to ``status``"""
+        return status in self.STATUS_TRANSITIONS.get(self.status, ())
+    
+    def can_be_cancelled(self):
+        """Check if order can be cancelled"""
+        return self.status in ['pending', 'paid']
+    
+    def can_be_marked_paid(self):
+        """Check if order can be marked as paid"""
+        return self.status == 'pending'
+    
+    def can_be_completed(self):
+        """Check if order can be completed"""
+        return self.status == 'paid'
+
+
+class OrderLine(models.Model):
+    """Товар в заказе"""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='lines', verbose_name='Заказ')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='order_lines', verbose_name='Товар')
+    quantity = models.PositiveIntegerField(default=1, verbose_name='Количество')
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Цена за шт')
+    
+    class Meta:
+        verbose_name = 'Товар в заказе'
+        verbose_name_plural = 'Товары в заказе'
+    
+    def __str__(self):
+        return f"{self.quantity} x {self.product.name}"
+    
+    @property
+    def total_price(self):
+        """Total price for this order line"""
+        return self.price * self.quantity
+
+
+def adjust_sales_for_orders(order_ids, sign):
+    """Add (sign=1) or subtract (sign=-1) the orders' line quantities to num_sales
+
+    One UPDATE: the per-product sum comes from a correlated subquery, and only
+    the counter column is written, so concurrent edits of the products and
+    their ``updated_at`` are left alone. Counters never drop below 0.
+    """
+    order_ids = list(order_ids)
+    if not order_ids:
+        return
+    lines = OrderLine.objects.filter(order_id__in=order_ids)
+    sold = lines.filter(product=OuterRef('pk')).order_by().values('product').annotate(
+        total=Sum('quantity')
+    ).values('total')
+    Product.objects.filter(pk__in=lines.values('product_id')).update(
+        num_sales=Greatest(F('num_sales') + sign * Coalesce(Subquery(sold), 0), 0)
+    )
+    bump_generations(Product)
+
+
+class ArchivedOrder(OrderDisplayMixin, models.Model):
+    """Архивный заказ: завершенный или отмененный заказ, перенесенный командой archive_orders
+
+    Хранит те же поля (и тот же id), что и заказ, плюс название производителя,
+    чтобы история и выгрузки читались без соединений. Только для чтения.
+    """
+    
+    is_archived = True
+    STATUS_CHOICES = Order.STATUS_CHOICES
+    
+    id = models.BigIntegerField(primary_key=True, verbose_name='ID')
+    checkout = models.ForeignKey(Checkout, on_delete=models.CASCADE, related_name='archived_orders', verbose_name='Оформление')
+    producer = models.ForeignKey(Producer, on_delete=models.CASCADE, related_name='archived_orders', db_index=False, verbose_name='Производитель')
+    producer_name = models.CharField(max_length=200, verbose_name='Название производителя')
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Общая стоимость')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, verbose_name='Статус')
+    created_at = models.DateTimeField(verbose_name='Дата создания')
+    updated_at = models.DateTimeField(verbose_name='Дата обновления')
+    search_phone = models.CharField(max_length=20, blank=True, default='', verbose_name='Телефон для поиска')
+    search_text = models.TextField(blank=True, default='', verbose_name='Текст для поиска')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')
+    
+    class Meta:
+        verbose_name = 'Архивный заказ'
+        verbose_name_plural = 'Архивные заказы'
+        ordering = ['-created_at']
+        indexes = [
+            # Те же запросы производителя, что и по заказам
+            models.Index(fields=['producer', 'status', 'total_price'], name='archived_producer_status_idx'),
+            models.Index(fields=['producer', '-created_at', '-id'], name='archived_producer_created_idx'),
+            models.Index(fields=['producer', 'search_phone'], name='archived_producer_phone_idx'),
+            models.Index(fields=['created_at'], name='archived_order_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Архивный заказ #{self.id} - {self.producer_name} ({self.get_status_display()})"
+
+
+class ArchivedOrderLine(models.Model):
+    """Товар архивного заказа"""
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='lines', verbose_name='Заказ')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='archived_order_lines', verbose_name='Товар')
+    product_name = models.CharField(max_length=200, verbose_name='Название товара')
+    quantity = models.PositiveIntegerField(default=1, verbose_name='Количество')
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Цена за шт')
+    
+    class Meta:
+        verbose_name = 'Товар архивного заказа'
+        verbose_name_plural = 'Товары архивных заказов'
+    
+    def __str__(self):
+        return f"{self.quantity} x {self.product_name}"
+    
+    @property
+    def total_price(self):
+        """Total price for this order line"""
+        return self.price * self.quantity
+
+
+class Notification(models.Model):
+    """Исходящее уведомление (outbox), отправляется командой send_notifications"""
+    
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает отправки'),
+        ('sending', 'Отправляется'),
+        ('sent', 'Отправлено'),
+        ('failed', 'Не удалось отправить'),
+    ]
+    
+    producer = models.ForeignKey(Producer, on_delete=models.CASCADE, null=True, blank=True,
+                                 related_name='notifications', verbose_name='Производитель')
+    recipient = models.EmailField(verbose_name='Получатель')
+    # Заказы, собранные в сводку; тема и текст сводки формируются при отправке
+    orders = models.ManyToManyField(Order, blank=True, related_name='notifications', verbose_name='Заказы')
+    subject = models.CharField(max_length=255, blank=True, verbose_name='Тема')
+    body = models.TextField(blank=True, verbose_name='Текст')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='Статус')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Попыток отправки')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Следующая попытка')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата отправки')
+    
+    class Meta:
+        verbose_name = 'Уведомление'
+        verbose_name_plural = 'Уведомления'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='notification_queue_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.subject or 'Сводка заказов'} → {self.recipient} ({self.get_status_display()})"
+
+
+class OrderEvent(models.Model):
+    """Событие заказа для живых обновлений (используется DatabaseBroker)
+
+    Каждый процесс читает новые строки по возрастанию id и раздает их своим
+    подписчикам; старые строки удаляются через ORDER_EVENTS_RETENTION секунд.
+    """
+    
+    channel = models.CharField(max_length=50, verbose_name='Канал')
+    payload = models.JSONField(verbose_name='Данные')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата создания')
+    
+    class Meta:
+        verbose_name = 'Событие заказа'
+        verbose_name_plural = 'События заказов'
+    
+    def __str__(self):
+        return f"{self.channel}: {self.payload}"
+
+
+class DailyOrderStats(models.Model):
+    """Сводка заказов производителя за день по статусам (для аналитики в админке)
+
+    Строки обновляются при изменении заказов (orders.rollups) и пересчитываются
+    командой refresh_order_stats, поэтому аналитика не читает всю таблицу заказов.
+    """
+    
+    date = models.DateField(verbose_name='Дата')
+    # Отдельный индекс не нужен: producer - первый столбец уникального ограничения
+    producer = models.ForeignKey(Producer, on_delete=models.CASCADE, related_name='daily_order_stats',
+                                 db_index=False, verbose_name='Производитель')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name='Статус')
+    orders = models.PositiveIntegerField(default=0, verbose_name='Заказов')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Сумма')
+    
+    class Meta:
+        verbose_name = 'Дневная сводка заказов'
+        verbose_name_plural = 'Дневные сводки заказов'
+        constraints = [
+            models.UniqueConstraint(fields=['producer', 'date', 'status'], name='daily_order_stats_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='daily_order_stats_date_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} - {self.producer_id} ({self.status}): {self.orders}"
+
+
+class DailyCategoryStats(models.Model):
+    """Сводка проданных товаров производителя за день по категориям и статусам"""
+    
+    date = models.DateField(verbose_name='Дата')
+    producer = models.ForeignKey(Producer, on_delete=models.CASCADE, related_name='daily_category_stats',
+                                 db_index=False, verbose_name='Производитель')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_order_stats',
+                                 verbose_name='Категория')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name='Статус')
+    # Заказы с товарами категории; заказ с несколькими категориями учитывается в каждой
+    orders = models.PositiveIntegerField(default=0, verbose_name='Заказов')
+    quantity = models.PositiveIntegerField(default=0, verbose_name='Количество')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Сумма')
+    
+    class Meta:
+        verbose_name = 'Дневная сводка по категориям'
+        verbose_name_plural = 'Дневные сводки по категориям'
+        constraints = [
+            models.UniqueConstraint(fields=['producer', 'date', 'category', 'status'],
+                                    name='daily_category_stats_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='daily_category_stats_date_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} - {self.producer_id} / {self.category_id} ({self.status}): {self.quantity}"
+
+
+class OrderExport(models.Model):
+    """Выгрузка заказов в CSV, которая формируется в фоне (команда run_order_exports)
+
+    Большие выгрузки не отдаются потоком из запроса: в очередь ставятся
+    фильтры выгрузки, по которым заказы выбираются заново при ее формировании,
+    а готовый сжатый файл скачивается по ссылке.
+    """
+    
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('running', 'Формируется'),
+        ('done', 'Готово'),
+        ('failed', 'Ошибка'),
+    ]
+    
+    SOURCE_CHOICES = [
+        ('producer', 'Заказы производителя'),
+        ('orders', 'Заказы (админка)'),
+        ('archive', 'Архив заказов (админка)'),
+    ]
+    
+    requested_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='order_exports',
+                                     verbose_name='Кто запросил')
+    # Пусто для выгрузок из админки (заказы всех производителей)
+    producer = models.ForeignKey(Producer, on_delete=models.CASCADE, null=True, blank=True,
+                                 related_name='order_exports', verbose_name='Производитель')
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, verbose_name='Источник')
+    # Фильтры страницы заказов производителя или параметры списка в админке
+    filters = models.JSONField(default=dict, blank=True, verbose_name='Фильтры')
+    # Выбранные в админке заказы; пусто, если действие применено ко всем найденным
+    order_ids = models.JSONField(null=True, blank=True, verbose_name='Выбранные заказы')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='Статус')
+    # Срок, до которого выгрузка занята воркером; после него ее может взять другой
+    lease_expires_at = models.DateTimeField(null=True, blank=True, verbose_name='Занята до')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')
+    file = models.FileField(upload_to='exports/', blank=True, verbose_name='Файл')
+    rows = models.PositiveIntegerField(default=0, verbose_name='Строк')
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата готовности')
+    
+    class Meta:
+        verbose_name = 'Выгрузка заказов'
+        verbose_name_plural = 'Выгрузки заказов'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='order_export_queue_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Выгрузка #{self.id} ({self.get_status_display()})"
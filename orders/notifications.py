@@ -0,0 +1,220 @@
+"""
+Notification outbox.
+
+Checkout only writes ``Notification`` rows, in the same transaction as the
+orders, so it never waits for the mail server. New orders of a producer are
+collected into one pending digest for ``NOTIFICATION_DIGEST_WINDOW`` minutes
+after the first of them, and the digest is rendered from
+``orders/emails/new_orders_digest.txt`` when it is sent.
+
+The ``send_notifications`` management command drains the outbox: due messages
+are claimed (status ``sending``) and sent in batches over a single SMTP
+connection outside any transaction, failures are retried with exponential
+backoff and give up after ``NOTIFICATION_MAX_ATTEMPTS``.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Notification, Order
+
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable in settings
+NOTIFICATION_MAX_ATTEMPTS = 5
+NOTIFICATION_RETRY_DELAY = 60  # seconds before the first retry, doubled every attempt
+NOTIFICATION_MAX_RETRY_DELAY = 6 * 60 * 60
+NOTIFICATION_DIGEST_WINDOW = 10  # minutes; 0 sends every checkout separately
+NOTIFICATION_SENDING_TIMEOUT = 10 * 60  # seconds before a claimed batch is retried
+SITE_URL = 'https://tanda.kg'
+
+
+def _setting(name):
+    return getattr(settings, name, globals()[name])
+
+
+def render_order_digest(producer, orders):
+    """Subject and text of the email telling a producer about new orders"""
+    subject = f'Новые заказы на Tanda.kg - {len(orders)} шт.'
+    body = render_to_string('orders/emails/new_orders_digest.txt', {
+        'producer': producer,
+        'orders': orders,
+        'total_amount': sum(order.total_price for order in orders),
+        'dashboard_url': _setting('SITE_URL') + reverse('producer_dashboard'),
+    })
+    return subject, body
+
+
+def notify_producers_about_orders(orders):
+    """Queue the given new orders for their producers' digest emails
+
+    Orders are added to the producer's open digest if there is one, otherwise
+    a digest due at the end of the coalescing window is created. Orders must
+    have ``producer__user`` loaded. Call inside the transaction that
+    creates the orders so both are committed together.
+    """
+    # Group orders by producer
+    orders_by_producer = {}
+    for order in orders:
+        producer = order.producer
+        if producer.user.email:
+            orders_by_producer.setdefault(producer, []).append(order)
+    if not orders_by_producer:
+        return []
+    
+    now = timezone.now()
+    # Digests still collecting orders: not due yet and never attempted
+    digests = {
+        notification.producer_id: notification
+        for notification in Notification.objects.select_for_update().filter(
+            producer__in=orders_by_producer, status='pending', attempts=0, next_attempt_at__gt=now
+        ).order_by('next_attempt_at')
+    }
+    
+    window = timedelta(minutes=_setting('NOTIFICATION_DIGEST_WINDOW'))
+    new_digests = Notification.objects.bulk_create([
+        Notification(producer=producer, recipient=producer.user.email, next_attempt_at=now + window)
+        for producer in orders_by_producer if producer.pk not in digests
+    ])
+    digests.update({notification.producer_id: notification for notification in new_digests})
+    
+    Notification.orders.through.objects.bulk_create([
+        Notification.orders.through(notification_id=digests[producer.pk].pk, order_id=order.pk)
+        for producer, producer_orders in orders_by_producer.items()
+        for order in producer_orders
+    ])
+    return list(digests.values())
+
+
+def retry_delay(attempts):
+    """Backoff before the next try after ``attempts`` failed attempts"""
+    delay = _setting('NOTIFICATION_RETRY_DELAY') * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(delay, _setting('NOTIFICATION_MAX_RETRY_DELAY')))
+
+
+def _mark_failed(notification, error, max_attempts):
+    logger.warning('Failed to send notification %s to %s: %s',
+                   notification.pk, notification.recipient, error)
+    notification.attempts += 1
+    notification.last_error = str(error)
+    if notification.attempts >= max_attempts:
+        notification.status = 'failed'
+    else:
+        notification.status = 'pending'
+        notification.next_attempt_at = timezone.now() + retry_delay(notification.attempts)
+
+
+def _mark_sent(notification):
+    notification.attempts += 1
+    notification.status = 'sent'
+    notification.sent_at = timezone.now()
+    notification.last_error = ''
+
+
+def claim_notifications(batch_size):
+    """Claim up to ``batch_size`` due notifications for this worker
+
+    Each row is moved to ``sending`` with a conditional UPDATE on the values
+    just read, so of two workers racing for a row only one gets it; no row
+    locks are needed. The claim is a lease: rows of a worker that died while
+    sending are due again after ``NOTIFICATION_SENDING_TIMEOUT`` seconds.
+    Returns the ids of the claimed rows.
+    """
+    now = timezone.now()
+    lease_until = now + timedelta(seconds=_setting('NOTIFICATION_SENDING_TIMEOUT'))
+    candidates = list(
+        Notification.objects.filter(status__in=('pending', 'sending'), next_attempt_at__lte=now)
+        .order_by('next_attempt_at', 'pk')
+        .values_list('pk', 'status', 'next_attempt_at')[:batch_size]
+    )
+    claimed = []
+    with transaction.atomic():
+        for pk, status, next_attempt_at in candidates:
+            if Notification.objects.filter(
+                pk=pk, status=status, next_attempt_at=next_attempt_at
+            ).update(status='sending', next_attempt_at=lease_until):
+                claimed.append(pk)
+    return claimed
+
+
+def send_pending_notifications(batch_size=50):
+    """Send one batch of due notifications; return (sent, failed) counts
+
+    The batch is claimed in a short transaction, sent without holding any
+    transaction open and the results are written in a second short one, so
+    checkout is never blocked by the mail server and several workers can run
+    at once.
+    """
+    max_attempts = _setting('NOTIFICATION_MAX_ATTEMPTS')
+    from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@tanda.kg')
+    sent = failed = 0
+    
+    claimed = claim_notifications(batch_size)
+    if not claimed:
+        return sent, failed
+    
+    batch = list(
+        Notification.objects.filter(pk__in=claimed)
+        .select_related('producer')
+        .prefetch_related(Prefetch(
+            'orders', queryset=Order.objects.select_related('checkout').order_by('pk')
+        ), 'orders__lines__product')
+        .order_by('next_attempt_at', 'pk')
+    )
+    
+    # Digests are rendered when sent, so they include every coalesced order
+    outgoing = []
+    for notification in batch:
+        orders = list(notification.orders.all())
+        if orders:
+            notification.subject, notification.body = render_order_digest(notification.producer, orders)
+        if notification.body:
+            outgoing.append(notification)
+        else:
+            # All orders of the digest were deleted meanwhile
+            notification.status = 'failed'
+            notification.last_error = 'Нет данных для отправки'
+    
+    # One SMTP connection for the whole batch
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        for notification in outgoing:
+            _mark_failed(notification, e, max_attempts)
+        failed = len(outgoing)
+    else:
+        try:
+            for notification in outgoing:
+                try:
+                    EmailMessage(
+                        subject=notification.subject,
+                        body=notification.body,
+                        from_email=from_email,
+                        to=[notification.recipient],
+                        connection=connection,
+                    ).send()
+                except Exception as e:
+                    _mark_failed(notification, e, max_attempts)
+                    failed += 1
+                else:
+                    _mark_sent(notification)
+                    sent += 1
+        finally:
+            connection.close()
+    
+    with transaction.atomic():
+        Notification.objects.bulk_update(
+            batch, ['subject', 'body', 'status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+        )
+    
+    return sent, failed
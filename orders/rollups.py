@@ -0,0 +1,254 @@
+"""
+Daily order rollups for the admin analytics.
+
+``DailyOrderStats`` holds the number and total of a producer's orders per day
+and status, ``DailyCategoryStats`` the same per category with the quantity
+sold. A day is the order's creation date in the current time zone.
+
+Order writes adjust the rollups inside the same transaction by the changed
+orders' own share (``adjust_orders_stats``): it is subtracted before the
+change and added back after it with F() increments, so checkout and status
+changes only touch the rows of their orders. Edits of single order lines in
+the admin recompute the whole (date, producer) bucket from the orders
+(``refresh_orders_stats``). The ``refresh_order_stats`` command recomputes
+whole date ranges the same way, for the initial fill and as a catch-up job
+that repairs any drift. Archived orders (``orders.archive``) are counted
+together with live ones.
+"""
+
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+
+from users.models import Producer
+from .models import ArchivedOrder, ArchivedOrderLine, DailyCategoryStats, DailyOrderStats, Order, OrderLine
+
+
+# (orders, lines) models whose rows are counted
+SOURCES = [(Order, OrderLine), (ArchivedOrder, ArchivedOrderLine)]
+
+_suppressed = ContextVar('order_rollups_suppressed', default=False)
+
+
+@contextmanager
+def rollups_unchanged():
+    """Skip refreshes for writes that leave the totals as they are (archiving)"""
+    token = _suppressed.set(True)
+    try:
+        yield
+    finally:
+        _suppressed.reset(token)
+
+
+def order_day(created_at):
+    """Rollup date of an order created at ``created_at``"""
+    return timezone.localdate(created_at)
+
+
+def _day_range(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
+
+
+def _producers_by_day(keys):
+    producers_by_day = defaultdict(set)
+    for day, producer_id in keys:
+        producers_by_day[day].add(producer_id)
+    return producers_by_day.items()
+
+
+def _orders_filter(keys, prefix=''):
+    """Q object selecting orders of the given (date, producer_id) buckets"""
+    condition = Q()
+    for day, producer_ids in _producers_by_day(keys):
+        start, end = _day_range(day)
+        condition |= Q(**{
+            f'{prefix}created_at__gte': start,
+            f'{prefix}created_at__lt': end,
+            f'{prefix}producer_id__in': producer_ids,
+        })
+    return condition
+
+
+def _stats_filter(keys):
+    """Q object selecting rollup rows of the given buckets"""
+    condition = Q()
+    for day, producer_ids in _producers_by_day(keys):
+        condition |= Q(date=day, producer_id__in=producer_ids)
+    return condition
+
+
+def _collect(sources, order_filter, line_filter):
+    """Rollup values of the matching orders, keyed like the rollup rows
+
+    Returns {(date, producer_id, status): (orders, revenue)} and
+    {(date, producer_id, category_id, status): (orders, quantity, revenue)}.
+    """
+    order_counts, order_revenue = Counter(), defaultdict(Decimal)
+    line_counts, line_quantity, line_revenue = Counter(), Counter(), defaultdict(Decimal)
+    for order_model, line_model in sources:
+        rows = (
+            order_model.objects.filter(order_filter)
+            .annotate(day=TruncDate('created_at'))
+            .values('day', 'producer_id', 'status')
+            .annotate(count=Count('id'), revenue=Sum('total_price'))
+            .order_by()
+        )
+        for row in rows:
+            key = (row['day'], row['producer_id'], row['status'])
+            order_counts[key] += row['count']
+            order_revenue[key] += row['revenue'] or 0
+
+        rows = (
+            line_model.objects.filter(line_filter)
+            .annotate(day=TruncDate('order__created_at'))
+            .values('day', 'order__producer_id', 'product__category_id', 'order__status')
+            .annotate(
+                count=Count('order_id', distinct=True),
+                sold=Sum('quantity'),
+                amount=Sum(F('price') * F('quantity')),
+            )
+            .order_by()
+        )
+        for row in rows:
+            key = (row['day'], row['order__producer_id'], row['product__category_id'], row['order__status'])
+            line_counts[key] += row['count']
+            line_quantity[key] += row['sold']
+            line_revenue[key] += row['amount'] or 0
+
+    order_rows = {key: (count, order_revenue[key]) for key, count in order_counts.items()}
+    category_rows = {
+        key: (count, line_quantity[key], line_revenue[key]) for key, count in line_counts.items()
+    }
+    return order_rows, category_rows
+
+
+def refresh_daily_stats(keys):
+    """Recompute the rollup rows of the given (date, producer_id) buckets
+
+    The producers are locked first, so concurrent refreshes of the same
+    buckets run one after another instead of inserting duplicate rows.
+    """
+    keys = set(keys)
+    if not keys:
+        return
+    with transaction.atomic():
+        list(
+            Producer.objects.select_for_update()
+            .filter(pk__in={producer_id for _, producer_id in keys})
+            .order_by('pk')
+            .values_list('pk', flat=True)
+        )
+        DailyOrderStats.objects.filter(_stats_filter(keys)).delete()
+        DailyCategoryStats.objects.filter(_stats_filter(keys)).delete()
+
+        order_rows, category_rows = _collect(SOURCES, _orders_filter(keys), _orders_filter(keys, prefix='order__'))
+        DailyOrderStats.objects.bulk_create([
+            DailyOrderStats(date=day, producer_id=producer_id, status=status, orders=count, revenue=revenue)
+            for (day, producer_id, status), (count, revenue) in order_rows.items()
+        ])
+        DailyCategoryStats.objects.bulk_create([
+            DailyCategoryStats(
+                date=day, producer_id=producer_id, category_id=category_id, status=status,
+                orders=count, quantity=quantity, revenue=revenue,
+            )
+            for (day, producer_id, category_id, status), (count, quantity, revenue) in category_rows.items()
+        ])
+
+
+def refresh_orders_stats(orders):
+    """Refresh the buckets of the given orders (instances or (created_at, producer_id) pairs)"""
+    if _suppressed.get():
+        return
+    keys = set()
+    for order in orders:
+        if isinstance(order, (Order, ArchivedOrder)):
+            created_at, producer_id = order.created_at, order.producer_id
+        else:
+            created_at, producer_id = order
+        keys.add((order_day(created_at), producer_id))
+    refresh_daily_stats(keys)
+
+
+def _add_to_rows(model, rows, sign):
+    """Add ``sign`` times the values to the rollup rows, given as (lookup, values) pairs"""
+    if sign > 0:
+        # Make sure every row exists; rows a concurrent write created are kept
+        model.objects.bulk_create([model(**lookup) for lookup, _ in rows], ignore_conflicts=True)
+    for lookup, values in rows:
+        # A missing row has nothing to subtract from; the catch-up job repairs it
+        model.objects.filter(**lookup).update(**{
+            field: Greatest(F(field) + sign * value, Value(0, output_field=model._meta.get_field(field)))
+            for field, value in values.items()
+        })
+
+
+def adjust_orders_stats(order_ids, sign, order_model=Order):
+    """Add (``sign`` 1) or subtract (-1) the given orders' share of the rollups
+
+    Only the rows the orders count in are touched, with F() increments, so
+    the cost does not depend on how many other orders the producer has that
+    day and concurrent writes only contend on the rows they change. Call with
+    -1 before the orders change and with 1 afterwards.
+    """
+    if _suppressed.get() or not order_ids:
+        return
+    line_model = OrderLine if order_model is Order else ArchivedOrderLine
+    order_rows, category_rows = _collect(
+        [(order_model, line_model)], Q(pk__in=order_ids), Q(order_id__in=order_ids)
+    )
+    with transaction.atomic():
+        _add_to_rows(DailyOrderStats, [
+            ({'date': day, 'producer_id': producer_id, 'status': status}, {'orders': count, 'revenue': revenue})
+            for (day, producer_id, status), (count, revenue) in sorted(order_rows.items())
+        ], sign)
+        _add_to_rows(DailyCategoryStats, [
+            (
+                {'date': day, 'producer_id': producer_id, 'category_id': category_id, 'status': status},
+                {'orders': count, 'quantity': quantity, 'revenue': revenue},
+            )
+            for (day, producer_id, category_id, status), (count, quantity, revenue) in sorted(category_rows.items())
+        ], sign)
+        if sign < 0:
+            # Keep the tables as a full refresh leaves them, without empty rows
+            keys = {(day, producer_id) for day, producer_id, _ in order_rows}
+            keys.update((day, producer_id) for day, producer_id, _, _ in category_rows)
+            if keys:
+                DailyOrderStats.objects.filter(_stats_filter(keys), orders=0).delete()
+                DailyCategoryStats.objects.filter(_stats_filter(keys), orders=0).delete()
+
+
+def rebuild_daily_stats(start=None, end=None, batch_size=500):
+    """Recompute every bucket with orders or rollup rows between the dates
+
+    Returns the number of buckets refreshed.
+    """
+    keys = set()
+    for order_model, _ in SOURCES:
+        orders = order_model.objects.all()
+        if start is not None:
+            orders = orders.filter(created_at__gte=_day_range(start)[0])
+        if end is not None:
+            orders = orders.filter(created_at__lt=_day_range(end)[1])
+        keys.update(
+            orders.annotate(day=TruncDate('created_at')).values_list('day', 'producer_id').distinct().order_by()
+        )
+    # Buckets whose orders are all gone still have rows to remove
+    stats = DailyOrderStats.objects.all()
+    if start is not None:
+        stats = stats.filter(date__gte=start)
+    if end is not None:
+        stats = stats.filter(date__lte=end)
+    keys.update(stats.values_list('date', 'producer_id').distinct().order_by())
+    keys = sorted(keys)
+    for offset in range(0, len(keys), batch_size):
+        refresh_daily_stats(keys[offset:offset + batch_size])
+    return len(keys)
@@ -0,0 +1,136 @@
+"""
+Search over a producer's orders.
+
+Every order keeps two denormalized columns, filled at checkout:
+
+* ``search_phone`` - the buyer's phone reduced to its national digits, so
+  "+996 777 12-34-56", "0777123456" and "777123456" are the same number;
+* ``search_text`` - buyer name, username and product names folded with
+  ``products.search.normalize_search_text``.
+
+Phone queries are prefix matches answered by ``order_producer_phone_idx``.
+Text queries match word prefixes through a full-text index of
+``search_text`` keyed by order id (FTS5 on SQLite, a ``tsvector`` table with
+a GIN index on PostgreSQL; other databases fall back to substring matches).
+Orders are indexed at checkout; an archived order keeps the id and text of
+the order it was moved from, so the same index serves the archive.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from products.search import normalize_search_text, search_tokens
+from .archive import ARCHIVE_STATUSES
+from .models import ArchivedOrder, Order
+
+
+COUNTRY_CODE = '996'
+NATIONAL_NUMBER_LENGTH = 9
+
+# A query made only of these characters with enough digits is a phone number
+_PHONE_QUERY_RE = re.compile(r'^[\d\s()+\-.]+$')
+PHONE_QUERY_MIN_DIGITS = 3
+
+SEARCH_TABLE = 'orders_order_search'
+
+
+def normalize_phone(value):
+    """Digits of a phone number without the country code or trunk prefix"""
+    digits = re.sub(r'\D', '', value or '')
+    if digits.startswith(COUNTRY_CODE) and (
+        len(digits) > NATIONAL_NUMBER_LENGTH or (value or '').lstrip().startswith('+')
+    ):
+        digits = digits[len(COUNTRY_CODE):]
+    return digits.lstrip('0')
+
+
+def order_search_text(checkout, products):
+    """Folded text an order is searched by"""
+    user = checkout.user
+    parts = [checkout.buyer_name, user.username, user.first_name, user.last_name]
+    parts.extend(product.name for product in products)
+    return normalize_search_text(' '.join(part for part in parts if part))
+
+
+def set_search_fields(order, checkout, products):
+    """Fill ``search_phone`` and ``search_text`` of an unsaved order"""
+    order.search_phone = normalize_phone(checkout.buyer_phone)
+    order.search_text = order_search_text(checkout, products)
+
+
+def index_orders(orders):
+    """Add the ``search_text`` of saved orders to the full-text index
+
+    Rows of deleted orders stay in the index; order ids are never reused, so
+    they match nothing.
+    """
+    rows = [(order.pk, order.search_text) for order in orders if order.search_text]
+    if not rows:
+        return
+    if connection.vendor == 'sqlite':
+        sql = f'INSERT INTO {SEARCH_TABLE} (rowid, search_text) VALUES (%s, %s)'
+    elif connection.vendor == 'postgresql':
+        sql = (
+            f"INSERT INTO {SEARCH_TABLE} (order_id, document) VALUES (%s, to_tsvector('simple', %s)) "
+            f'ON CONFLICT (order_id) DO UPDATE SET document = EXCLUDED.document'
+        )
+    else:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def _text_filter(tokens):
+    # Every token is matched as a word prefix
+    if connection.vendor == 'sqlite':
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        return Q(pk__in=RawSQL(f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [match]))
+    if connection.vendor == 'postgresql':
+        tsquery = ' & '.join(f'{token}:*' for token in tokens)
+        return Q(pk__in=RawSQL(
+            f"SELECT order_id FROM {SEARCH_TABLE} WHERE document @@ to_tsquery('simple', %s)", [tsquery]
+        ))
+    condition = Q()
+    for token in tokens:
+        condition &= Q(search_text__contains=token)
+    return condition
+
+
+def order_search_filter(query):
+    """Q object matching orders by phone prefix or by every word of ``query``"""
+    query = (query or '').strip()
+    if _PHONE_QUERY_RE.match(query):
+        digits = normalize_phone(query)
+        if len(digits) >= PHONE_QUERY_MIN_DIGITS:
+            # A range instead of LIKE 'prefix%' so that every backend uses the index
+            return Q(search_phone__gte=digits, search_phone__lt=digits + ':')
+    tokens = search_tokens(query)
+    if not tokens:
+        return Q()
+    return _text_filter(tokens)
+
+
+def producer_order_querysets(producer, status=None, search=''):
+    """Producer's live and archived orders filtered by ``status`` and ``search``
+
+    Returns (orders, archived_orders); archived_orders is None when the
+    status filter excludes the archive. Used by the order list page and to
+    rebuild the orders of a queued export.
+    """
+    orders = Order.objects.filter(producer=producer)
+    archived_orders = ArchivedOrder.objects.filter(producer=producer)
+    
+    if status and status in dict(Order.STATUS_CHOICES):
+        orders = orders.filter(status=status)
+        archived_orders = archived_orders.filter(status=status) if status in ARCHIVE_STATUSES else None
+    
+    # Search by phone prefix or buyer/product words (indexed search columns)
+    if search:
+        orders = orders.filter(order_search_filter(search))
+        if archived_orders is not None:
+            archived_orders = archived_orders.filter(order_search_filter(search))
+    
+    return orders, archived_orders
@@ -0,0 +1,56 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import ArchivedOrder, Order, OrderLine
+from .rollups import adjust_orders_stats, refresh_orders_stats
+
+
+# Fields of an order that the daily rollups depend on
+ROLLUP_FIELDS = {'status', 'total_price', 'producer', 'producer_id', 'created_at'}
+
+
+def _changes_rollups(update_fields):
+    return update_fields is None or bool(ROLLUP_FIELDS.intersection(update_fields))
+
+
+@receiver(pre_save, sender=Order)
+def remove_saved_order_stats(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Take the stored order out of the daily rollups before it is saved (admin)"""
+    if raw or instance._state.adding or not _changes_rollups(update_fields):
+        return
+    adjust_orders_stats([instance.pk], -1)
+
+
+@receiver(post_save, sender=Order)
+def add_saved_order_stats(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Count the saved order in the daily rollups again"""
+    if raw or not _changes_rollups(update_fields):
+        return
+    adjust_orders_stats([instance.pk], 1)
+
+
+@receiver(pre_delete, sender=Order)
+@receiver(pre_delete, sender=ArchivedOrder)
+def remove_deleted_order_stats(sender, instance, **kwargs):
+    # Runs while the lines still exist
+    adjust_orders_stats([instance.pk], -1, order_model=sender)
+
+
+@receiver(post_save, sender=OrderLine)
+@receiver(post_delete, sender=OrderLine)
+def refresh_order_line_stats(sender, instance, raw=False, origin=None, **kwargs):
+    """Category rollups count line quantities
+
+    Lines deleted together with their order are covered by the order's
+    own pre_delete.
+    """
+    if raw:
+        return
+    if origin is not None:
+        origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+        if origin_model is not OrderLine:
+            return
+    refresh_orders_stats(
+        Order.objects.filter(pk=instance.order_id).values_list('created_at', 'producer_id')
+    )
@@ -1,3 +1,643 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core import mail
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from cart.models import Cart, CartItem
+from products.models import Category, Product
+from users.models import Producer, UserProfile
+from users.stats import ProducerStats
+from orders.archive import archive_batch, archive_cutoff
+from orders.events import DatabaseBroker
+from orders.models import (
+    ArchivedOrder, Checkout, DailyCategoryStats, DailyOrderStats, Notification, Order, OrderEvent, OrderExport, OrderLine,
+)
+from orders.exports import claim_export, queue_export, run_next_export
+from orders.notifications import claim_notifications, send_pending_notifications
+from orders.rollups import rebuild_daily_stats
+from orders.search import normalize_phone, producer_order_querysets
+from orders.transitions import FORWARD_STATUS_TRANSITIONS, transition_orders
+from orders.views import checkout_cart
+
+
+def create_producer(username):
+    user = User.objects.create(username=username, email=f'{username}@example.com')
+    return Producer.objects.create(user=user, name=f'Бренд {username}', description='-', region='bishkek')
+
+
+def create_product(producer, category, name, price='100.00'):
+    return Product.objects.create(
+        producer=producer, category=category, name=name, description='-',
+        price=Decimal(price), image='product_images/test.jpg',
+    )
+
+
+class OrderTestCase(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Мед', slug='honey')
+        self.producers = [create_producer('producer1'), create_producer('producer2')]
+        self.products = [
+            create_product(self.producers[0], self.category, 'Мед горный', '500.00'),
+            create_product(self.producers[0], self.category, 'Мед цветочный', '400.00'),
+            create_product(self.producers[1], self.category, 'Курут', '150.00'),
+        ]
+        self.buyer = User.objects.create(username='buyer', email='buyer@example.com')
+
+    def fill_cart(self, user, quantities):
+        cart, _ = Cart.objects.get_or_create(user=user)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=quantity) for product, quantity in quantities.items()
+        ])
+        return cart
+
+
+class CheckoutTests(OrderTestCase):
+
+    def test_checkout_splits_cart_by_producer(self):
+        self.fill_cart(self.buyer, {self.products[0]: 2, self.products[1]: 1, self.products[2]: 3})
+
+        orders = checkout_cart(self.buyer)
+
+        self.assertEqual(len(orders), 2)
+        checkout = Checkout.objects.get(user=self.buyer)
+        self.assertEqual(checkout.total_price, Decimal('1850.00'))
+        totals = dict(Order.objects.filter(checkout=checkout).values_list('producer_id', 'total_price'))
+        self.assertEqual(totals, {self.producers[0].pk: Decimal('1400.00'), self.producers[1].pk: Decimal('450.00')})
+        self.assertEqual(OrderLine.objects.filter(order__checkout=checkout).count(), 3)
+        self.assertFalse(CartItem.objects.filter(cart__user=self.buyer).exists())
+        self.assertEqual(Notification.objects.filter(status='pending').count(), 2)
+
+    def test_empty_cart_creates_nothing(self):
+        self.assertEqual(checkout_cart(self.buyer), [])
+        self.assertFalse(Checkout.objects.exists())
+
+    def test_failure_rolls_back_everything(self):
+        self.fill_cart(self.buyer, {self.products[0]: 2, self.products[2]: 1})
+
+        with mock.patch('orders.views.notify_producers_about_orders', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                checkout_cart(self.buyer)
+
+        self.assertFalse(Checkout.objects.exists())
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderLine.objects.exists())
+        self.assertEqual(CartItem.objects.filter(cart__user=self.buyer).count(), 2)
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        small_buyer = User.objects.create(username='small', email='small@example.com')
+        self.fill_cart(small_buyer, {self.products[0]: 1, self.products[2]: 1})
+        self.fill_cart(self.buyer, {self.products[0]: 1, self.products[1]: 5, self.products[2]: 2})
+
+        with CaptureQueriesContext(connection) as small:
+            checkout_cart(small_buyer)
+        # Start the second checkout without open digests, like the first
+        Notification.objects.all().delete()
+        with CaptureQueriesContext(connection) as large:
+            checkout_cart(self.buyer)
+
+        self.assertEqual(len(small), len(large))
+
+
+class OrderStatusTests(OrderTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.fill_cart(self.buyer, {self.products[0]: 2, self.products[1]: 1})
+        self.order = checkout_cart(self.buyer)[0]
+
+    def sales(self):
+        return dict(Product.objects.filter(pk__in=[p.pk for p in self.products[:2]]).values_list('pk', 'num_sales'))
+
+    def test_completing_order_adds_sales(self):
+        order = Order.objects.get(pk=self.order.pk)
+        order.status = 'completed'
+        order.save()
+        self.assertEqual(self.sales(), {self.products[0].pk: 2, self.products[1].pk: 1})
+
+        order.status = 'paid'
+        order.save()
+        self.assertEqual(self.sales(), {self.products[0].pk: 0, self.products[1].pk: 0})
+
+    def test_save_does_not_reread_loaded_status(self):
+        order = Order.objects.select_related('checkout').get(pk=self.order.pk)
+        order.status = 'paid'
+        with CaptureQueriesContext(connection) as queries:
+            order.save()
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT "orders_order"."status"')])
+        self.assertFalse([q for q in queries if 'FROM "orders_checkout"' in q['sql']])
+
+    def test_save_without_cached_checkout_reads_only_buyer_id(self):
+        order = Order.objects.get(pk=self.order.pk)
+        order.status = 'paid'
+        with CaptureQueriesContext(connection) as queries:
+            order.save()
+        checkout_queries = [q['sql'] for q in queries if 'FROM "orders_checkout"' in q['sql']]
+        self.assertEqual(len(checkout_queries), 1)
+        self.assertIn('SELECT "orders_checkout"."user_id"', checkout_queries[0])
+
+
+class TransitionTests(OrderTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.orders = []
+        for quantity in (1, 2, 3):
+            buyer = User.objects.create(username=f'buyer{quantity}')
+            self.fill_cart(buyer, {self.products[0]: quantity, self.products[2]: 1})
+            self.orders.extend(checkout_cart(buyer))
+        self.queryset = Order.objects.filter(producer=self.producers[0])
+
+    def sales(self, product):
+        return Product.objects.values_list('num_sales', flat=True).get(pk=product.pk)
+
+    def test_bulk_transitions_keep_num_sales(self):
+        transition_orders(self.queryset, 'paid')
+        self.assertEqual(transition_orders(self.queryset, 'completed'), list(self.queryset.values_list('pk', flat=True)))
+        self.assertEqual(self.sales(self.products[0]), 6)
+        self.assertEqual(self.sales(self.products[2]), 0)
+
+        # Completing again changes nothing
+        self.assertEqual(transition_orders(self.queryset, 'completed'), [])
+        self.assertEqual(self.sales(self.products[0]), 6)
+
+        transition_orders(self.queryset.filter(lines__quantity=2), 'paid')
+        self.assertEqual(self.sales(self.products[0]), 4)
+
+    def test_disallowed_orders_are_left_alone(self):
+        first = self.queryset.order_by('pk').first()
+        transition_orders(Order.objects.filter(pk=first.pk), 'paid')
+
+        changed = transition_orders(self.queryset, 'completed')
+
+        self.assertEqual(changed, [first.pk])
+        self.assertEqual(self.queryset.filter(status='pending').count(), 2)
+        self.assertEqual(self.sales(self.products[0]), 1)
+
+    def test_forward_only_skips_corrective_transitions(self):
+        transition_orders(self.queryset, 'paid')
+        transition_orders(self.queryset, 'completed')
+
+        self.assertEqual(transition_orders(self.queryset, 'paid', forward_only=True), [])
+        self.assertEqual(self.sales(self.products[0]), 6)
+
+    def test_forward_transitions_are_allowed_transitions(self):
+        for source, targets in FORWARD_STATUS_TRANSITIONS.items():
+            self.assertLessEqual(set(targets), set(Order.STATUS_TRANSITIONS[source]))
+
+    def test_unknown_status_is_rejected(self):
+        with self.assertRaises(ValueError):
+            transition_orders(self.queryset, 'shipped')
+
+
+
+class RollupTests(OrderTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.products[1].category = Category.objects.create(name='Варенье', slug='jam')
+        self.products[1].save()
+        self.fill_cart(self.buyer, {self.products[0]: 2, self.products[1]: 1, self.products[2]: 3})
+        checkout_cart(self.buyer)
+        other = User.objects.create(username='other')
+        self.fill_cart(other, {self.products[0]: 1, self.products[1]: 4})
+        checkout_cart(other)
+        self.queryset = Order.objects.filter(producer=self.producers[0])
+
+    def rollups(self):
+        return (
+            sorted(DailyOrderStats.objects.values_list('date', 'producer_id', 'status', 'orders', 'revenue')),
+            sorted(DailyCategoryStats.objects.values_list(
+                'date', 'producer_id', 'category_id', 'status', 'orders', 'quantity', 'revenue'
+            )),
+        )
+
+    def assertRollupsMatchOrders(self):
+        rollups = self.rollups()
+        self.assertEqual(
+            sum(row[3] for row in rollups[0]), Order.objects.count() + ArchivedOrder.objects.count()
+        )
+        rebuild_daily_stats()
+        self.assertEqual(rollups, self.rollups())
+
+    def test_checkout(self):
+        self.assertEqual(
+            [row[2:] for row in self.rollups()[0]],
+            [('pending', 2, Decimal('3500.00')), ('pending', 1, Decimal('450.00'))],
+        )
+        self.assertRollupsMatchOrders()
+
+    def test_status_changes(self):
+        transition_orders(self.queryset.order_by('pk')[:1], 'paid')
+        self.assertRollupsMatchOrders()
+        transition_orders(self.queryset, 'paid')
+        transition_orders(self.queryset, 'completed')
+        self.assertRollupsMatchOrders()
+
+        order = Order.objects.get(producer=self.producers[1])
+        order.status = 'paid'
+        order.save()
+        self.assertRollupsMatchOrders()
+
+    def test_cancel(self):
+        transition_orders(Order.objects.all(), 'cancelled')
+        self.assertEqual({row[2] for row in self.rollups()[0]}, {'cancelled'})
+        self.assertRollupsMatchOrders()
+
+    def test_archive(self):
+        transition_orders(Order.objects.all(), 'paid')
+        transition_orders(self.queryset, 'completed')
+        old = timezone.now() - timedelta(days=365)
+        Order.objects.update(created_at=old, updated_at=old)
+        rebuild_daily_stats()
+
+        self.assertEqual(archive_batch(archive_cutoff()), 2)
+        self.assertRollupsMatchOrders()
+
+        ArchivedOrder.objects.first().delete()
+        self.assertRollupsMatchOrders()
+
+    def test_deleting_orders_and_lines(self):
+        OrderLine.objects.filter(product=self.products[1]).first().delete()
+        self.assertRollupsMatchOrders()
+        self.queryset.first().delete()
+        self.assertRollupsMatchOrders()
+
+
+class OrderSearchTests(OrderTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.buyer.first_name, self.buyer.last_name = 'Айгүл', 'Осмонова'
+        self.buyer.save()
+        UserProfile.objects.update_or_create(user=self.buyer, defaults={'phone_number': '+996 (777) 12-34-56'})
+        self.fill_cart(self.buyer, {self.products[0]: 1})
+        self.order = checkout_cart(self.buyer)[0]
+
+        other = User.objects.create(username='azamat', first_name='Азамат')
+        UserProfile.objects.update_or_create(user=other, defaults={'phone_number': '0555 98 76 54'})
+        self.fill_cart(other, {self.products[1]: 1})
+        self.other_order = checkout_cart(other)[0]
+
+    def search(self, query):
+        orders, archived = producer_order_querysets(self.producers[0], search=query)
+        return sorted([*orders.values_list('pk', flat=True), *archived.values_list('pk', flat=True)])
+
+    def test_phone_normalization(self):
+        for value in ('+996 777 12-34-56', '996777123456', '0777 123 456', '777123456', '(0777) 12.34.56'):
+            self.assertEqual(normalize_phone(value), '777123456', value)
+        # Nine digits starting with 996 are a national number, not a country code
+        self.assertEqual(normalize_phone('996123456'), '996123456')
+        self.assertEqual(normalize_phone(None), '')
+
+    def test_phone_prefix(self):
+        self.assertEqual(self.search('+996 777 12'), [self.order.pk])
+        self.assertEqual(self.search('0555-98'), [self.other_order.pk])
+        self.assertEqual(self.search('0333'), [])
+
+    def test_text_matches_word_prefixes(self):
+        self.assertEqual(self.search('айгуль'), [])
+        self.assertEqual(self.search('Айгул'), [self.order.pk])
+        self.assertEqual(self.search('осмон горн'), [self.order.pk])
+        self.assertEqual(self.search('азамат'), [self.other_order.pk])
+        self.assertEqual(self.search('мед'), [self.order.pk, self.other_order.pk])
+        self.assertEqual(self.search('азамат горный'), [])
+
+    def test_archived_orders_are_found(self):
+        transition_orders(Order.objects.filter(pk=self.order.pk), 'paid')
+        transition_orders(Order.objects.filter(pk=self.order.pk), 'completed')
+        old = timezone.now() - timedelta(days=365)
+        Order.objects.filter(pk=self.order.pk).update(created_at=old, updated_at=old)
+        archive_batch(archive_cutoff())
+
+        self.assertTrue(ArchivedOrder.objects.filter(pk=self.order.pk).exists())
+        self.assertEqual(self.search('осмонова'), [self.order.pk])
+
+@override_settings(NOTIFICATION_DIGEST_WINDOW=0)
+class NotificationTests(OrderTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.fill_cart(self.buyer, {self.products[0]: 1, self.products[2]: 1})
+        checkout_cart(self.buyer)
+
+    def test_due_digests_are_sent_once(self):
+        self.assertEqual(send_pending_notifications(), (2, 0))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(Notification.objects.filter(status='sent').count(), 2)
+
+        self.assertEqual(send_pending_notifications(), (0, 0))
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_claimed_rows_are_skipped_until_the_lease_expires(self):
+        claimed = claim_notifications(1)
+        self.assertEqual(len(claimed), 1)
+        self.assertEqual(Notification.objects.get(pk=claimed[0]).status, 'sending')
+
+        # Another worker only gets the unclaimed row
+        self.assertEqual(send_pending_notifications(), (1, 0))
+        self.assertEqual(Notification.objects.get(pk=claimed[0]).status, 'sending')
+
+        Notification.objects.filter(pk=claimed[0]).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(send_pending_notifications(), (1, 0))
+        self.assertFalse(Notification.objects.exclude(status='sent').exists())
+
+    def test_failed_send_is_retried_later(self):
+        with self.assertLogs('orders.notifications', 'WARNING'), \
+                mock.patch('orders.notifications.EmailMessage.send', side_effect=OSError('down')):
+            self.assertEqual(send_pending_notifications(), (0, 2))
+
+        notification = Notification.objects.first()
+        self.assertEqual(notification.status, 'pending')
+        self.assertEqual(notification.attempts, 1)
+        self.assertGreater(notification.next_attempt_at, timezone.now())
+
+
+
+@override_settings(NOTIFICATION_DIGEST_WINDOW=10)
+class DigestTests(OrderTestCase):
+
+    def checkout(self, username, quantities):
+        buyer = User.objects.create(username=username, email=f'{username}@example.com')
+        self.fill_cart(buyer, quantities)
+        return checkout_cart(buyer)
+
+    def send_due(self):
+        Notification.objects.filter(status='pending').update(next_attempt_at=timezone.now())
+        return send_pending_notifications()
+
+    def test_orders_within_the_window_share_one_digest(self):
+        orders = []
+        for n, quantity in enumerate((1, 2, 3)):
+            orders.extend(self.checkout(f'buyer{n}', {self.products[0]: quantity}))
+
+        # Nothing is due until the window closes
+        self.assertEqual(send_pending_notifications(), (0, 0))
+        digest = Notification.objects.get()
+        self.assertEqual(sorted(digest.orders.values_list('pk', flat=True)), [order.pk for order in orders])
+
+        self.assertEqual(self.send_due(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        message = mail.outbox[0]
+        self.assertEqual(message.to, ['producer1@example.com'])
+        self.assertIn('3 шт.', message.subject)
+        for order in orders:
+            self.assertIn(f'Заказ #{order.pk}:', message.body)
+        self.assertIn('Общая сумма: 3000 сом', message.body)
+
+    def test_each_producer_gets_its_own_digest(self):
+        self.checkout('buyer1', {self.products[0]: 1, self.products[2]: 1})
+        self.checkout('buyer2', {self.products[2]: 2})
+
+        self.assertEqual(
+            sorted(Notification.objects.values_list('producer_id', flat=True)),
+            sorted(producer.pk for producer in self.producers),
+        )
+        self.assertEqual(self.send_due(), (2, 0))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['producer1@example.com', 'producer2@example.com'])
+
+    def test_orders_after_the_digest_was_sent_start_a_new_one(self):
+        self.checkout('buyer1', {self.products[0]: 1})
+        self.send_due()
+        self.checkout('buyer2', {self.products[0]: 1})
+
+        self.assertEqual(Notification.objects.filter(status='pending').count(), 1)
+        self.assertEqual(self.send_due(), (1, 0))
+        self.assertEqual(len(mail.outbox), 2)
+
+class ExportTests(OrderTestCase):
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.fill_cart(self.buyer, {self.products[0]: 1, self.products[1]: 2, self.products[2]: 1})
+        self.orders = checkout_cart(self.buyer)
+        transition_orders(Order.objects.filter(producer=self.producers[1]), 'paid')
+
+    def exported_order_ids(self, export):
+        run_next_export()
+        export.refresh_from_db()
+        self.assertEqual(export.status, 'done', export.error)
+        with export.file.open('rb') as file:
+            rows = list(csv.reader(io.TextIOWrapper(gzip.GzipFile(fileobj=file), encoding='utf-8-sig')))
+        return [int(row[0]) for row in rows[1:]]
+
+    def test_producer_export_is_rebuilt_from_filters(self):
+        producer = self.producers[0]
+        export = queue_export(producer.user, 'producer', producer=producer, filters={'status': 'pending', 'search': ''})
+        order = Order.objects.get(producer=producer)
+        self.assertEqual(self.exported_order_ids(export), [order.pk, order.pk])
+
+        export = queue_export(producer.user, 'producer', producer=producer, filters={'status': 'paid', 'search': ''})
+        self.assertEqual(self.exported_order_ids(export), [])
+
+    def test_admin_export_of_selected_orders(self):
+        staff = User.objects.create(username='admin', is_staff=True, is_superuser=True)
+        order = Order.objects.get(producer=self.producers[1])
+        export = queue_export(staff, 'orders', order_ids=[order.pk])
+        self.assertEqual(self.exported_order_ids(export), [order.pk])
+
+    def test_admin_export_of_changelist_filters(self):
+        staff = User.objects.create(username='admin', is_staff=True, is_superuser=True)
+        order = Order.objects.get(producer=self.producers[1])
+        export = queue_export(staff, 'orders', filters={'status__exact': ['paid']})
+        self.assertEqual(self.exported_order_ids(export), [order.pk])
+
+
+    def test_claimed_export_is_skipped_until_the_lease_expires(self):
+        producer = self.producers[0]
+        export = queue_export(producer.user, 'producer', producer=producer, filters={'status': 'pending'})
+        self.assertEqual(claim_export(), export)
+        self.assertIsNone(claim_export())
+
+        # The worker died; another one takes the export over
+        OrderExport.objects.filter(pk=export.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(run_next_export(), export)
+        export.refresh_from_db()
+        self.assertEqual((export.status, export.attempts), ('done', 2))
+
+    @override_settings(ORDER_EXPORT_MAX_ATTEMPTS=1)
+    def test_export_is_failed_after_the_last_attempt(self):
+        producer = self.producers[0]
+        export = queue_export(producer.user, 'producer', producer=producer, filters={'status': 'pending'})
+        claim_export()
+        OrderExport.objects.filter(pk=export.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertIsNone(run_next_export())
+        export.refresh_from_db()
+        self.assertEqual(export.status, 'failed')
+
+class ArchiveTests(OrderTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.fill_cart(self.buyer, {self.products[0]: 2, self.products[2]: 1})
+        self.orders = checkout_cart(self.buyer)
+        transition_orders(Order.objects.all(), 'paid')
+        transition_orders(Order.objects.filter(producer=self.producers[0]), 'completed')
+        self.old = timezone.now() - timedelta(days=365)
+        Order.objects.update(created_at=self.old, updated_at=self.old)
+        rebuild_daily_stats()
+
+    def rollups(self):
+        return sorted(DailyOrderStats.objects.values_list('date', 'producer_id', 'status', 'orders', 'revenue'))
+
+    def test_archive_round_trip(self):
+        completed = Order.objects.get(producer=self.producers[0])
+        lines = list(completed.lines.values_list('product_id', 'quantity', 'price'))
+        stats = ProducerStats.for_producer(self.producers[0]).as_dict()
+        rollups = self.rollups()
+        self.assertTrue(rollups)
+
+        self.assertEqual(archive_batch(archive_cutoff()), 1)
+
+        # Only the completed order moved; paid orders stay live
+        self.assertFalse(Order.objects.filter(pk=completed.pk).exists())
+        self.assertTrue(Order.objects.filter(producer=self.producers[1]).exists())
+        archived = ArchivedOrder.objects.get(pk=completed.pk)
+        self.assertEqual(
+            (archived.checkout_id, archived.producer_name, archived.status, archived.total_price, archived.created_at),
+            (completed.checkout_id, self.producers[0].name, 'completed', completed.total_price, completed.created_at),
+        )
+        self.assertEqual(list(archived.lines.values_list('product_id', 'quantity', 'price')), lines)
+        self.assertEqual(list(archived.lines.values_list('product_name', flat=True)), [self.products[0].name])
+
+        # History readers see the same totals as before
+        self.assertEqual(ProducerStats.for_producer(self.producers[0]).as_dict(), stats)
+        self.assertEqual(self.rollups(), rollups)
+        rebuild_daily_stats()
+        self.assertEqual(self.rollups(), rollups)
+
+        self.assertEqual(archive_batch(archive_cutoff()), 0)
+
+    def test_recent_orders_are_not_archived(self):
+        Order.objects.update(updated_at=timezone.now())
+        self.assertEqual(archive_batch(archive_cutoff()), 0)
+
+
+class DatabaseBrokerTests(TestCase):
+
+    def setUp(self):
+        self.broker = DatabaseBroker()
+        self.broker._read_events()
+
+    def publish(self, age=0):
+        event = OrderEvent.objects.create(channel='user:1', payload={'type': 'order_status'})
+        OrderEvent.objects.filter(pk=event.pk).update(created_at=timezone.now() - timedelta(seconds=age))
+        return event
+
+    def test_old_events_are_pruned_while_polling(self):
+        old = self.publish(age=2 * 60 * 60)
+        new = self.publish()
+        self.assertEqual([row[0] for row in self.broker._read_events()], [old.pk, new.pk])
+        self.assertTrue(OrderEvent.objects.filter(pk=old.pk).exists())
+
+        self.broker._pruned_at -= timedelta(hours=1)
+        self.broker._read_events()
+        self.assertEqual(list(OrderEvent.objects.values_list('pk', flat=True)), [new.pk])
+
+    def test_restarted_poller_skips_events_published_while_idle(self):
+        async def listen():
+            async with self.broker.subscribe('user:1'):
+                pass
+
+        with mock.patch.object(DatabaseBroker, '_poll', mock.AsyncMock()):
+            async_to_sync(listen)()
+        self.publish()
+
+        self.assertIsNone(self.broker._poller)
+        self.assertEqual(self.broker._read_events(), [])
+        event = self.publish()
+        self.assertEqual([row[0] for row in self.broker._read_events()], [event.pk])
+
+
+class CheckoutMigrationTests(TransactionTestCase):
+    """0004 groups old single-product orders into checkouts and back"""
+
+    before = [('orders', '0003_notification_orders')]
+    after = [('orders', '0004_checkout_orderline')]
+
+    def setUp(self):
+        category = Category.objects.create(name='Мед', slug='honey')
+        producers = [create_producer('producer1'), create_producer('producer2')]
+        self.products = [
+            create_product(producers[0], category, 'Мед горный', '500.00'),
+            create_product(producers[1], category, 'Курут', '150.00'),
+        ]
+        self.buyers = [User.objects.create(username='buyer1'), User.objects.create(username='buyer2')]
+        self.migrate(self.before)
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def create_old_order(self, apps, buyer, product, quantity, created_at):
+        order = apps.get_model('orders', 'Order').objects.create(
+            user_id=buyer.pk, product_id=product.pk, quantity=quantity,
+            total_price=product.price * quantity, buyer_name=buyer.username, buyer_phone='0777123456',
+        )
+        apps.get_model('orders', 'Order').objects.filter(pk=order.pk).update(created_at=created_at)
+        return order.pk
+
+    def test_orders_are_grouped_into_checkouts_and_merged_back(self):
+        apps = MigrationExecutor(connection).loader.project_state(self.before).apps
+        start = timezone.now() - timedelta(days=30)
+        first, second = self.buyers
+        grouped = [
+            self.create_old_order(apps, first, self.products[0], 2, start),
+            self.create_old_order(apps, first, self.products[1], 1, start + timedelta(seconds=3)),
+        ]
+        later = self.create_old_order(apps, first, self.products[0], 1, start + timedelta(seconds=9))
+        other_buyer = self.create_old_order(apps, second, self.products[1], 4, start + timedelta(seconds=1))
+
+        apps = self.migrate(self.after)
+        Order = apps.get_model('orders', 'Order')
+        checkouts = {pk: checkout for pk, checkout in Order.objects.values_list('pk', 'checkout_id')}
+        self.assertEqual(checkouts[grouped[0]], checkouts[grouped[1]])
+        self.assertEqual(len({checkouts[later], checkouts[other_buyer], checkouts[grouped[0]]}), 3)
+
+        checkout = apps.get_model('orders', 'Checkout').objects.get(pk=checkouts[grouped[0]])
+        self.assertEqual((checkout.user_id, checkout.total_price), (first.pk, Decimal('1150.00')))
+        self.assertEqual(checkout.created_at, start)
+        self.assertEqual(
+            list(apps.get_model('orders', 'OrderLine').objects.filter(order_id=grouped[0])
+                 .values_list('product_id', 'quantity', 'price')),
+            [(self.products[0].pk, 2, Decimal('500.00'))],
+        )
+        self.assertEqual(Order.objects.get(pk=grouped[1]).producer_id, self.products[1].producer_id)
+
+        # An order with two lines, as checkouts create them after the migration
+        apps.get_model('orders', 'OrderLine').objects.create(
+            order_id=later, product_id=self.products[1].pk, quantity=5, price=Decimal('150.00')
+        )
+
+        apps = self.migrate(self.before)
+        rows = dict(
+            (pk, rest) for pk, *rest in apps.get_model('orders', 'Order').objects.values_list(
+                'pk', 'user_id', 'product_id', 'quantity', 'buyer_name'
+            )
+        )
+        self.assertEqual(rows[grouped[1]], [first.pk, self.products[1].pk, 1, 'buyer1'])
+        self.assertEqual(rows[other_buyer], [second.pk, self.products[1].pk, 4, 'buyer2'])
+        # Only the first line of a multi-line order survives the reverse migration
+        self.assertEqual(rows[later], [first.pk, self.products[0].pk, 1, 'buyer1'])
@@ -0,0 +1,71 @@
+"""
+Bulk order status transitions.
+
+``transition_orders`` moves many orders to a new status at once, following
+``Order.STATUS_TRANSITIONS``. Orders that may not make the transition are
+left untouched. The status change is one UPDATE and the ``num_sales``
+counters of the affected products are corrected with one grouped UPDATE
+(``adjust_sales_for_orders``), so the cost does not depend on how many orders
+are selected. The daily rollups are adjusted by the changed orders' share.
+"""
+
+from django.db import transaction
+from django.utils import timezone
+
+from .events import order_event, publish_order_events
+from .models import Order, adjust_sales_for_orders
+from .rollups import adjust_orders_stats
+
+
+# Normal progress of an order without the corrective moves backwards; source
+# status -> targets like Order.STATUS_TRANSITIONS, of which it is a subset
+FORWARD_STATUS_TRANSITIONS = {
+    'pending': ('paid', 'cancelled'),
+    'paid': ('completed', 'cancelled'),
+}
+
+# Statuses the producer's bulk action may move orders to
+FORWARD_STATUSES = {target for targets in FORWARD_STATUS_TRANSITIONS.values() for target in targets}
+
+
+def allowed_source_statuses(status, forward_only=False):
+    """Statuses from which an order may move to ``status``"""
+    transitions = FORWARD_STATUS_TRANSITIONS if forward_only else Order.STATUS_TRANSITIONS
+    return [source for source, targets in transitions.items() if status in targets]
+
+
+def transition_orders(queryset, status, forward_only=False):
+    """Move every order of ``queryset`` that is allowed to reach ``status``
+
+    With ``forward_only`` corrective transitions (e.g. completed -> paid)
+    are not applied. Returns the list of ids of the orders that were changed.
+    """
+    if status not in dict(Order.STATUS_CHOICES):
+        raise ValueError(f'Неверный статус: {status}')
+
+    with transaction.atomic():
+        rows = list(
+            Order.objects.select_for_update(of=('self',))
+            .filter(pk__in=queryset.values('pk'), status__in=allowed_source_statuses(status, forward_only))
+            .values_list('pk', 'status', 'producer_id', 'checkout__user_id')
+        )
+        if not rows:
+            return []
+
+        order_ids = [row[0] for row in rows]
+        adjust_orders_stats(order_ids, -1)
+        Order.objects.filter(pk__in=order_ids).update(status=status, updated_at=timezone.now())
+        adjust_orders_stats(order_ids, 1)
+
+        # Sales count only completed orders
+        if status == 'completed':
+            adjust_sales_for_orders(order_ids, 1)
+        else:
+            adjust_sales_for_orders([row[0] for row in rows if row[1] == 'completed'], -1)
+
+        publish_order_events([
+            order_event('order.status', pk, status, producer_id, user_id)
+            for pk, old_status, producer_id, user_id in rows
+        ])
+
+    return order_ids
@@ -5,7 +5,9 @@ urlpatterns = [
     # Customer order management
     path('create/', views.create_order, name='create_order'),
     path('my-orders/', views.my_orders, name='my_orders'),
+    path('events/', views.order_events, name='order_events'),
     path('success/', views.order_success, name='order_success'),
+    path('exports/<int:pk>/download/', views.order_export_download, name='order_export_download'),
     path('mark-paid/', views.mark_order_paid, name='mark_order_paid'),
     path('update-status/', views.update_order_status, name='update_order_status'),
 ]
\ No newline at end of file
@@ -1,18 +1,23 @@
 # orders/views.py - Complete working version
 
-from django.shortcuts import render, redirect
+from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import FileResponse, Http404, JsonResponse
 from django.views.decorators.http import require_POST
 from django.utils import timezone
-from django.core.mail import send_mail
-from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Prefetch, Q, Sum
 from datetime import timedelta
 import json
 
-from cart.views import get_or_create_cart
-from .models import Order
+from cart.models import CartItem
+from users.models import UserProfile
+from .models import ArchivedOrder, ArchivedOrderLine, Checkout, Order, OrderExport, OrderLine
+from .events import event_stream_response, order_event, publish_order_events, user_channel
+from .notifications import notify_producers_about_orders
+from .rollups import adjust_orders_stats
+from .search import index_orders, set_search_fields
 
 
 @login_required
@@ -20,51 +25,19 @@ from .models import Order
 def create_order(request):
     """Create order from cart items with producer notification"""
     try:
-        cart = get_or_create_cart(request)
+        orders_created = checkout_cart(request.user)
         
-        if not cart.items.exists():
+        if not orders_created:
             return JsonResponse({
                 'success': False,
                 'message': 'Корзина пуста'
             })
         
-        # Create orders for each cart item
-        orders_created = []
-        total_amount = 0
-        producers_to_notify = set()
-        
-        for cart_item in cart.items.all():
-            # Get user profile phone if available
-            user_phone = ''
-            try:
-                if hasattr(request.user, 'profile') and request.user.profile.phone_number:
-                    user_phone = request.user.profile.phone_number
-            except:
-                pass
-            
-            order = Order.objects.create(
-                user=request.user,
-                product=cart_item.product,
-                quantity=cart_item.quantity,
-                total_price=cart_item.get_total_price(),
-                buyer_name=f"{request.user.first_name} {request.user.last_name}".strip() or request.user.username,
-                buyer_email=request.user.email,
-                buyer_phone=user_phone,
-                status='pending'
-            )
-            orders_created.append(order)
-            total_amount += float(order.total_price)
-            producers_to_notify.add(cart_item.product.producer)
+        total_amount = sum(float(order.total_price) for order in orders_created)
         
         # Store order IDs in session for success page
         request.session['recent_order_ids'] = [order.id for order in orders_created]
         
-        # Send notifications to producers
-        notify_producers_about_orders(producers_to_notify, orders_created)
-        
-        # Clear cart after creating orders
-        cart.clear()
-        
         return JsonResponse({
             'success': True,
             'message': f'Заказ оформлен! Создано {len(orders_created)} заказов на сумму {total_amount:.0f} сом. Производители уведомлены.',
@@ -79,97 +52,135 @@ def create_order(request):
         })
 
 
-def notify_producers_about_orders(producers, orders):
-    """Send notifications to producers about new orders"""
-    from django.template.loader import render_to_string
-    
-    # Group orders by producer
-    orders_by_producer = {}
-    for order in orders:
-        producer = order.product.producer
-        if producer not in orders_by_producer:
-            orders_by_producer[producer] = []
-        orders_by_producer[producer].append(order)
-    
-    # Send notifications
-    for producer, producer_orders in orders_by_producer.items():
-        try:
-            # Email notification (if configured)
-            if hasattr(settings, 'EMAIL_HOST') and producer.user.email:
-                send_email_notification(producer, producer_orders)
-            
-            # You could add other notification methods here:
-            # - SMS notifications
-            # - Push notifications  
-            # - Telegram bot notifications
-            # - WhatsApp notifications
-            
-        except Exception as e:
-            print(f"Failed to notify producer {producer.name}: {e}")
-
+def checkout_cart(user):
+    """Turn the user's cart into a checkout with one order per producer
 
-def send_email_notification(producer, orders):
-    """Send email notification to producer about new orders"""
-    try:
-        subject = f'Новые заказы на Tanda.kg - {len(orders)} шт.'
+    The cart lines (with products and producers) are read once; the checkout,
+    the orders and their lines are written with one insert each and the
+    ordered cart lines are removed, all in one transaction, so a failure
+    leaves the cart untouched. Producer notifications are queued in the
+    outbox within the same transaction. Returns the created orders.
+    """
+    # Get user profile phone if available
+    buyer_phone = UserProfile.objects.filter(user=user).values_list('phone_number', flat=True).first() or ''
+    buyer_name = f"{user.first_name} {user.last_name}".strip() or user.username
+    
+    with transaction.atomic():
+        cart_items = list(
+            CartItem.objects.select_for_update(of=('self',))
+            .filter(cart__user=user)
+            .select_related('product__producer__user')
+            .order_by('pk')
+        )
+        if not cart_items:
+            return []
         
-        # Calculate total
-        total_amount = sum(float(order.total_price) for order in orders)
+        # Split the cart by producer
+        items_by_producer = {}
+        for cart_item in cart_items:
+            items_by_producer.setdefault(cart_item.product.producer, []).append(cart_item)
         
-        # Email content
-        message = f"""
-Здравствуйте, {producer.name}!
-
-У вас новые заказы на Tanda.kg:
-
-"""
-        for order in orders:
-            message += f"""
-Заказ #{order.id}:
-- Товар: {order.product.name}
-- Количество: {order.quantity} шт
-- Сумма: {order.total_price} сом
-- Покупатель: {order.buyer_name}
-- Телефон: {order.buyer_phone if order.buyer_phone else 'не указан'}
-- Email: {order.buyer_email if order.buyer_email else 'не указан'}
-
-"""
+        checkout = Checkout.objects.create(
+            user=user,
+            total_price=sum(cart_item.get_total_price() for cart_item in cart_items),
+            buyer_name=buyer_name,
+            buyer_email=user.email,
+            buyer_phone=buyer_phone,
+        )
+        orders = []
+        for producer, producer_items in items_by_producer.items():
+            order = Order(
+                checkout=checkout,
+                producer=producer,
+                total_price=sum(cart_item.get_total_price() for cart_item in producer_items),
+                status='pending'
+            )
+            set_search_fields(order, checkout, [cart_item.product for cart_item in producer_items])
+            orders.append(order)
+        orders = Order.objects.bulk_create(orders)
+        index_orders(orders)
+        OrderLine.objects.bulk_create([
+            OrderLine(
+                order=order,
+                product=cart_item.product,
+                quantity=cart_item.quantity,
+                price=cart_item.product.price,
+            )
+            for order, producer_items in zip(orders, items_by_producer.values())
+            for cart_item in producer_items
+        ])
         
-        message += f"""
-Общая сумма: {total_amount:.0f} сом
-
-Для управления заказами войдите в панель производителя:
-https://tanda.kg/users/dashboard/
-
-С уважением,
-Команда Tanda.kg
-"""
+        # Clear only the lines that were ordered; anything added concurrently stays
+        CartItem.objects.filter(pk__in=[cart_item.pk for cart_item in cart_items]).delete()
         
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@tanda.kg'),
-            recipient_list=[producer.user.email],
-            fail_silently=True
-        )
+        # Daily rollups of the admin analytics
+        adjust_orders_stats([order.pk for order in orders], 1)
         
-    except Exception as e:
-        print(f"Failed to send email to {producer.name}: {e}")
+        # Queue notifications to producers; the send_notifications worker delivers them
+        notify_producers_about_orders(orders)
+        
+        # Live updates for open producer dashboards
+        publish_order_events([
+            order_event('order.created', order.pk, order.status, order.producer_id, user.pk)
+            for order in orders
+        ])
+    
+    return orders
 
 
 @login_required
 def my_orders(request):
-    """Display user's orders"""
-    orders = Order.objects.filter(user=request.user).select_related(
-        'product', 'product__producer'
-    ).order_by('-created_at')
+    """Display user's checkouts with their per-producer orders (archived ones included)"""
+    checkouts = list(Checkout.objects.filter(user=request.user).prefetch_related(
+        Prefetch('orders', queryset=Order.objects.select_related('producer').order_by('pk')),
+        Prefetch('orders__lines', queryset=OrderLine.objects.select_related('product').order_by('pk')),
+        Prefetch('archived_orders', queryset=ArchivedOrder.objects.select_related('producer').order_by('pk')),
+        Prefetch('archived_orders__lines', queryset=ArchivedOrderLine.objects.select_related('product').order_by('pk')),
+    ).order_by('-created_at'))
+    for checkout in checkouts:
+        checkout.order_list = sorted(
+            [*checkout.orders.all(), *checkout.archived_orders.all()], key=lambda order: order.pk
+        )
+    
+    summary = {}
+    for model in (Order, ArchivedOrder):
+        counts = model.objects.filter(checkout__user=request.user).aggregate(
+            orders_count=Count('id'),
+            pending_count=Count('id', filter=Q(status='pending')),
+            completed_count=Count('id', filter=Q(status='completed')),
+            total_amount=Sum('total_price', filter=~Q(status='cancelled')),
+        )
+        for name, value in counts.items():
+            summary[name] = summary.get(name, 0) + (value or 0)
     
     context = {
-        'orders': orders
+        'checkouts': checkouts,
+        'summary': summary,
     }
     return render(request, 'orders/my_orders.html', context)
 
 
+@login_required
+async def order_events(request):
+    """Server-Sent Events stream of status changes of the buyer's orders"""
+    user = await request.auser()
+    return event_stream_response(request, user_channel(user.pk))
+
+
+@login_required
+def order_export_download(request, pk):
+    """Download the file of a finished background order export"""
+    export = get_object_or_404(OrderExport, pk=pk, status='done')
+    if not (request.user.is_staff or export.requested_by_id == request.user.pk):
+        raise Http404('Выгрузка не найдена')
+    return FileResponse(
+        export.file.open('rb'),
+        as_attachment=True,
+        filename=f'orders-{export.pk}.csv.gz',
+        content_type='application/gzip',
+    )
+
+
 def order_success(request):
     """Order success page with recent orders"""
     recent_orders = []
@@ -180,8 +191,8 @@ def order_success(request):
     if recent_order_ids and request.user.is_authenticated:
         recent_orders = Order.objects.filter(
             id__in=recent_order_ids,
-            user=request.user
-        ).select_related('product', 'product__producer').order_by('-created_at')
+            checkout__user=request.user
+        ).select_related('producer').prefetch_related('lines__product').order_by('-created_at')
         
         # Clear the session data
         request.session.pop('recent_order_ids', None)
@@ -190,9 +201,9 @@ def order_success(request):
     if not recent_orders and request.user.is_authenticated:
         today = timezone.now().date()
         recent_orders = Order.objects.filter(
-            user=request.user,
+            checkout__user=request.user,
             created_at__date=today
-        ).select_related('product', 'product__producer').order_by('-created_at')[:5]
+        ).select_related('producer').prefetch_related('lines__product').order_by('-created_at')[:5]
     
     context = {
         'recent_orders': recent_orders
@@ -214,7 +225,7 @@ def mark_order_paid(request):
                 'message': 'ID заказа не указан'
             })
         
-        order = Order.objects.get(id=order_id, user=request.user)
+        order = Order.objects.get(id=order_id, checkout__user=request.user)
         
         if order.status != 'pending':
             return JsonResponse({
@@ -257,7 +268,7 @@ def update_order_status(request):
                 'message': 'Не все данные указаны'
             })
         
-        order = Order.objects.get(id=order_id, user=request.user)
+        order = Order.objects.get(id=order_id, checkout__user=request.user)
         
         # Customers can only mark orders as paid or cancelled
         if status not in ['paid', 'cancelled']:
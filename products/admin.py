@@ -20,7 +20,7 @@ class ProductAdmin(admin.ModelAdmin):
     list_filter = ['category', 'is_active', 'created_at', 'producer__is_verified']
     search_fields = ['name', 'producer__name', 'description']
     list_editable = ['is_active']
-    readonly_fields = ['created_at', 'updated_at', 'num_sales']
+    readonly_fields = ['created_at', 'updated_at', 'num_sales', 'rating_count', 'avg_rating']
     
     fieldsets = (
         ('Основная информация', {
@@ -30,17 +30,18 @@ class ProductAdmin(admin.ModelAdmin):
             'fields': ('price', 'image')
         }),
         ('Статус и статистика', {
-            'fields': ('is_active', 'num_sales', 'created_at', 'updated_at')
+            'fields': ('is_active', 'num_sales', 'rating_count', 'avg_rating', 'created_at', 'updated_at')
         }),
     )
     
     def average_rating_display(self, obj):
-        rating = obj.average_rating()
-        if rating:
+        rating = obj.avg_rating
+        if obj.rating_count:
             stars = '★' * int(rating) + '☆' * (5 - int(rating))
-            return format_html(f'<span title="{rating:.1f}">{stars}</span>')
+            return format_html('<span title="{}">{}</span>', f'{rating:.1f}', stars)
         return 'Нет оценок'
     average_rating_display.short_description = 'Рейтинг'
+    average_rating_display.admin_order_field = 'avg_rating'
     
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('producer', 'category')
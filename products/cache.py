@@ -0,0 +1,98 @@
+"""
+Versioned cache of catalogue data.
+
+Every cached model (``CACHED_MODELS``) has a generation stored in the cache.
+Cached querysets and fragments are keyed by the generations of the models
+they were built from, and ``products.signals`` bumps a model's generation on
+every ``post_save``/``post_delete``; code that writes these tables with
+``QuerySet.update()`` or ``bulk_create()`` bumps it itself. After a bump no
+key built from the old data is read again, so entries are never stale and
+``CATALOG_CACHE_TIMEOUT`` only limits how long unreachable entries use memory.
+
+Bumps run when the writing transaction commits: a request that read the
+generation before then stores its result under the old key. A bump writes a
+new random value rather than calling ``incr()``, which the file-based backend
+does not do atomically, so concurrent bumps are never lost.
+
+The backend is the ``default`` cache, chosen by ``CACHE_BACKEND`` in settings.
+"""
+
+import hashlib
+import secrets
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.safestring import mark_safe
+
+
+# Defaults, overridable in settings
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24  # seconds
+
+# Models whose writes bump their generation (see products.signals)
+CACHED_MODELS = ['products.Product', 'products.Category', 'users.Producer', 'products.Review']
+
+KEY_PREFIX = 'catalog'
+
+
+def _setting(name):
+    return getattr(settings, name, globals()[name])
+
+
+def _generation_key(model):
+    return f'{KEY_PREFIX}:generation:{model._meta.label_lower}'
+
+
+def _new_generation():
+    return secrets.token_hex(8)
+
+
+def get_generations(models):
+    """Current generations of ``models``, in the same order"""
+    keys = [_generation_key(model) for model in models]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            # Never set or evicted: anything cached under the old value is unreachable
+            cache.add(key, _new_generation(), timeout=None)
+            generations[key] = cache.get(key) or _new_generation()
+    return [generations[key] for key in keys]
+
+
+def bump_generations(*models):
+    """Invalidate every entry built from ``models`` once the current transaction commits"""
+    def bump():
+        cache.set_many({_generation_key(model): _new_generation() for model in models}, timeout=None)
+    transaction.on_commit(bump)
+
+
+def versioned_key(name, models, *vary_on):
+    """Cache key of ``name`` built from ``models`` at their current generations"""
+    key = ':'.join([KEY_PREFIX, name, *get_generations(models)])
+    if vary_on:
+        key += ':' + hashlib.md5(':'.join(str(value) for value in vary_on).encode()).hexdigest()
+    return key
+
+
+def cached_value(name, models, build, *vary_on):
+    """Value of ``build()``, cached until one of ``models`` changes"""
+    key = versioned_key(name, models, *vary_on)
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, _setting('CATALOG_CACHE_TIMEOUT'))
+    return value
+
+
+def cached_queryset(name, models, queryset, *vary_on):
+    """Rows of ``queryset`` as a list, cached until one of ``models`` changes
+
+    ``models`` must list every model whose fields the caller reads from the
+    rows, including ``select_related`` ones.
+    """
+    return cached_value(name, models, lambda: list(queryset), *vary_on)
+
+
+def cached_fragment(name, models, render, *vary_on):
+    """HTML returned by ``render()``, cached until one of ``models`` changes"""
+    return mark_safe(cached_value(f'fragment:{name}', models, lambda: str(render()), *vary_on))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from products.models import Product, recalculate_product_ratings, review_aggregate_subqueries
+
+
+class Command(BaseCommand):
+    help = 'Backfill or repair the stored rating aggregates on products'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report products whose aggregates are out of sync',
+        )
+
+    def handle(self, *args, **options):
+        aggregates = review_aggregate_subqueries()
+        # avg_rating is derived from sum and count, so comparing the integer
+        # columns is enough and avoids float equality checks
+        counters = [name for name in aggregates if name != 'avg_rating']
+        drift = Q()
+        for name in counters:
+            drift |= ~Q(**{name: F(f'actual_{name}')})
+        drifted = Product.objects.annotate(
+            **{f'actual_{name}': aggregates[name] for name in counters}
+        ).filter(drift)
+        drifted_ids = list(drifted.values_list('pk', flat=True))
+
+        if options['dry_run']:
+            self.stdout.write(f'{len(drifted_ids)} products have out-of-sync rating aggregates')
+            return
+
+        updated = recalculate_product_ratings(Product.objects.filter(pk__in=drifted_ids))
+        self.stdout.write(self.style.SUCCESS(f'Repaired rating aggregates for {updated} products'))
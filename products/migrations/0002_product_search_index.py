@@ -0,0 +1,67 @@
+from django.db import migrations
+
+
+SEARCH_TABLE = 'products_product_search'
+
+CHAR_FOLDING = str.maketrans({'ё': 'е', 'ө': 'о', 'ү': 'у', 'ң': 'н'})
+
+
+def normalize(text):
+    return (text or '').casefold().translate(CHAR_FOLDING)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    Product = apps.get_model('products', 'Product')
+
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5('
+            f"name, description, producer, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        insert = (
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, description, producer) '
+            f'VALUES (%s, %s, %s, %s)'
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+            f'product_id bigint PRIMARY KEY REFERENCES products_product (id) ON DELETE CASCADE, '
+            f'document tsvector NOT NULL)'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_idx '
+            f'ON {SEARCH_TABLE} USING GIN (document)'
+        )
+        insert = (
+            f'INSERT INTO {SEARCH_TABLE} (product_id, document) VALUES (%s, '
+            f"setweight(to_tsvector('simple', %s), 'A') || "
+            f"setweight(to_tsvector('simple', %s), 'C') || "
+            f"setweight(to_tsvector('simple', %s), 'B'))"
+        )
+    else:
+        return
+
+    rows = [
+        (product.pk, normalize(product.name), normalize(product.description), normalize(product.producer.name))
+        for product in Product.objects.select_related('producer')
+    ]
+    if rows:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(insert, rows)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,8 +1,11 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Avg, Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.core.validators import MinValueValidator, MaxValueValidator
 from users.models import Producer
+from .cache import bump_generations
 
 
 class Category(models.Model):
@@ -36,6 +39,18 @@ class Product(models.Model):
     num_sales = models.PositiveIntegerField(default=0, verbose_name='Количество продаж')
     is_active = models.BooleanField(default=True, verbose_name='Активен')
     
+    # Денормализованные агрегаты отзывов (обновляются при изменении Review)
+    rating_sum = models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')
+    rating_count = models.PositiveIntegerField(default=0, verbose_name='Количество отзывов')
+    avg_rating = models.FloatField(default=0, db_index=True, verbose_name='Средний рейтинг')
+    
+    # Распределение оценок по звёздам для гистограммы
+    rating_1_count = models.PositiveIntegerField(default=0, verbose_name='Оценок 1★')
+    rating_2_count = models.PositiveIntegerField(default=0, verbose_name='Оценок 2★')
+    rating_3_count = models.PositiveIntegerField(default=0, verbose_name='Оценок 3★')
+    rating_4_count = models.PositiveIntegerField(default=0, verbose_name='Оценок 4★')
+    rating_5_count = models.PositiveIntegerField(default=0, verbose_name='Оценок 5★')
+    
     class Meta:
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
@@ -49,14 +64,55 @@ class Product(models.Model):
     
     def average_rating(self):
         """Средний рейтинг товара"""
-        reviews = self.reviews.all()
-        if reviews:
-            return sum([review.rating for review in reviews]) / len(reviews)
-        return 0
+        return self.avg_rating
     
     def total_reviews(self):
         """Общее количество отзывов"""
-        return self.reviews.count()
+        return self.rating_count
+    
+    def rating_histogram(self):
+        """Распределение оценок от 5 до 1 звезды с долей в процентах"""
+        histogram = []
+        for stars in range(5, 0, -1):
+            count = getattr(self, f'rating_{stars}_count')
+            percent = round(count * 100 / self.rating_count) if self.rating_count else 0
+            histogram.append({'stars': stars, 'count': count, 'percent': percent})
+        return histogram
+    
+    def recalculate_rating(self):
+        """Пересчитать агрегаты отзывов по таблице Review"""
+        recalculate_product_ratings(Product.objects.filter(pk=self.pk))
+        self.refresh_from_db(fields=list(review_aggregate_subqueries()))
+
+
+def update_product_rating(product_id, added=None, removed=None):
+    """Atomically apply a review change to the stored rating aggregates
+
+    ``added`` is the rating that now counts towards the product and
+    ``removed`` the one that no longer does (either may be None). All SET
+    expressions read the pre-update row, so the new average is computed from
+    the new sum and count in the same UPDATE statement.
+    """
+    rating_delta = (added or 0) - (removed or 0)
+    count_delta = (added is not None) - (removed is not None)
+    new_sum = F('rating_sum') + rating_delta
+    new_count = F('rating_count') + count_delta
+    changes = {
+        'rating_sum': new_sum,
+        'rating_count': new_count,
+        'avg_rating': Case(
+            When(rating_count__lte=-count_delta, then=Value(0.0)),
+            default=Cast(new_sum, FloatField()) / Cast(new_count, FloatField()),
+            output_field=FloatField(),
+        ),
+    }
+    if added != removed:
+        if added is not None:
+            changes[f'rating_{added}_count'] = F(f'rating_{added}_count') + 1
+        if removed is not None:
+            changes[f'rating_{removed}_count'] = F(f'rating_{removed}_count') - 1
+    Product.objects.filter(pk=product_id).update(**changes)
+    bump_generations(Product)
 
 
 class Review(models.Model):
@@ -76,6 +132,64 @@ class Review(models.Model):
         verbose_name_plural = 'Отзывы'
         ordering = ['-created_at']
         unique_together = ('product', 'user')  # Один отзыв от пользователя на товар
+        indexes = [
+            # Постраничная выдача отзывов товара по дате
+            models.Index(fields=['product', '-created_at', '-id'], name='review_product_created_idx'),
+        ]
         
     def __str__(self):
-        return f"Отзыв от {self.user.username} на {self.product.name}"
\ No newline at end of file
+        return f"Отзыв от {self.user.username} на {self.product.name}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем загруженные значения, чтобы знать дельту при сохранении
+        instance._loaded_product_id = instance.__dict__.get('product_id')
+        instance._loaded_rating = instance.__dict__.get('rating')
+        return instance
+    
+    def save(self, *args, **kwargs):
+        """Сохранить отзыв и обновить агрегаты рейтинга товара в одной транзакции"""
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            old_product_id = getattr(self, '_loaded_product_id', None)
+            old_rating = getattr(self, '_loaded_rating', None)
+            if adding:
+                update_product_rating(self.product_id, added=self.rating)
+            elif old_rating is None:
+                # Отзыв загружен без поля rating - дельта неизвестна
+                self.product.recalculate_rating()
+            elif old_product_id != self.product_id:
+                update_product_rating(old_product_id, removed=old_rating)
+                update_product_rating(self.product_id, added=self.rating)
+            elif old_rating != self.rating:
+                update_product_rating(self.product_id, added=self.rating, removed=old_rating)
+        self._loaded_product_id = self.product_id
+        self._loaded_rating = self.rating
+
+
+def review_aggregate_subqueries():
+    """Correlated subqueries with the true rating aggregates of a product"""
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+
+    def subquery(aggregate, default):
+        return Coalesce(Subquery(reviews.annotate(value=aggregate).values('value')), default)
+
+    aggregates = {
+        'rating_sum': subquery(Sum('rating'), 0),
+        'rating_count': subquery(Count('id'), 0),
+        'avg_rating': subquery(Avg('rating'), 0.0),
+    }
+    for stars in range(1, 6):
+        aggregates[f'rating_{stars}_count'] = subquery(Count('id', filter=Q(rating=stars)), 0)
+    return aggregates
+
+
+def recalculate_product_ratings(queryset=None):
+    """Rebuild stored rating aggregates from Review rows in a single UPDATE"""
+    if queryset is None:
+        queryset = Product.objects.all()
+    updated = queryset.update(**review_aggregate_subqueries())
+    bump_generations(Product)
+    return updated
@@ -0,0 +1,210 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of OFFSET, every page is fetched with a WHERE clause that continues
+after (or before) the last row the client saw, so page N costs the same as
+page 1. Cursors are opaque URL-safe strings holding the ordering values of
+the boundary row.
+"""
+
+import base64
+import datetime
+import decimal
+import functools
+import json
+from urllib.parse import urlencode
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorEncoder(json.JSONEncoder):
+    """Like DjangoJSONEncoder, but keeps full microsecond precision"""
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.date)):
+            return o.isoformat()
+        if isinstance(o, decimal.Decimal):
+            return str(o)
+        return super().default(o)
+
+
+def encode_cursor(values, direction):
+    payload = json.dumps({'v': values, 'd': direction}, cls=CursorEncoder)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        values, direction = payload['v'], payload['d']
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor(cursor)
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return values, direction
+
+
+class KeysetPage:
+    """One page of results plus cursors to its neighbours"""
+
+    def __init__(self, object_list, next_cursor, previous_cursor, query_params=None, cursor_param='cursor'):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.query_params = query_params
+        self.cursor_param = cursor_param
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def _querystring(self, cursor):
+        params = self.query_params.copy() if self.query_params is not None else {}
+        params[self.cursor_param] = cursor
+        if hasattr(params, 'urlencode'):
+            return params.urlencode()
+        return urlencode(params)
+
+    @property
+    def next_querystring(self):
+        return self._querystring(self.next_cursor) if self.has_next else ''
+
+    @property
+    def previous_querystring(self):
+        return self._querystring(self.previous_cursor) if self.has_previous else ''
+
+
+class KeysetPaginator:
+    """Paginate a queryset by a fixed ordering without OFFSET
+
+    ``ordering`` is a list of field or annotation names, each optionally
+    prefixed with ``-``. The primary key is appended as a tie-breaker so that
+    every row has a unique position.
+    """
+
+    def __init__(self, queryset, ordering, per_page=24, cursor_param='cursor'):
+        ordering = list(ordering)
+        if not any(field.lstrip('-') in ('pk', 'id') for field in ordering):
+            descending = ordering[-1].startswith('-') if ordering else True
+            ordering.append('-pk' if descending else 'pk')
+        self.queryset = queryset
+        self.ordering = ordering
+        self.per_page = per_page
+        self.cursor_param = cursor_param
+
+    @staticmethod
+    def _field(name):
+        return name.lstrip('-'), name.startswith('-')
+
+    def _reverse_ordering(self):
+        return [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+
+    def _values(self, obj):
+        return [getattr(obj, self._field(name)[0]) for name in self.ordering]
+
+    def _seek(self, values, forward):
+        """Q object selecting rows strictly after ``values`` in the given direction"""
+        if len(values) != len(self.ordering):
+            raise InvalidCursor(values)
+        condition = Q()
+        equal = Q()
+        for name, value in zip(self.ordering, values):
+            field, descending = self._field(name)
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+    def _fetch(self, values, forward):
+        return self._fetch_from(self.queryset, values, forward)
+
+    def _fetch_from(self, queryset, values, forward):
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, forward))
+        queryset = queryset.order_by(*(self.ordering if forward else self._reverse_ordering()))
+        return list(queryset[:self.per_page + 1])
+
+    def get_page(self, cursor=None, query_params=None):
+        """Return the page addressed by ``cursor`` (first page if missing or invalid)"""
+        values, forward = None, True
+        if cursor:
+            try:
+                values, direction = decode_cursor(cursor)
+                forward = direction == 'next'
+            except InvalidCursor:
+                pass
+
+        try:
+            rows = self._fetch(values, forward)
+        except (InvalidCursor, ValidationError, ValueError, TypeError):
+            # Tampered cursor values that do not fit the ordering fields
+            values, forward = None, True
+            rows = self._fetch(values, forward)
+
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or not forward:
+                next_cursor = encode_cursor(self._values(rows[-1]), 'next')
+            if values is not None and (forward or has_more):
+                previous_cursor = encode_cursor(self._values(rows[0]), 'prev')
+
+        return KeysetPage(rows, next_cursor, previous_cursor, query_params, self.cursor_param)
+
+    def paginate_request(self, request):
+        """Page for ``request.GET[cursor_param]`` with links preserving other filters"""
+        params = request.GET.copy()
+        params.pop(self.cursor_param, None)
+        return self.get_page(request.GET.get(self.cursor_param), params)
+
+
+class MergedKeysetPaginator(KeysetPaginator):
+    """Keyset pagination over several querysets with the same ordering fields
+
+    Every page reads at most ``per_page + 1`` rows from each queryset and
+    merges them, e.g. live and archived orders (their primary keys must not
+    overlap). Pass querysets that cannot match anything as ``None``.
+    """
+
+    def __init__(self, querysets, ordering, per_page=24, cursor_param='cursor'):
+        super().__init__(None, ordering, per_page, cursor_param)
+        self.querysets = [queryset for queryset in querysets if queryset is not None]
+
+    def _compare(self, first, second, forward):
+        for name in self.ordering:
+            field, descending = self._field(name)
+            a, b = getattr(first, field), getattr(second, field)
+            if a != b:
+                before = a > b if descending == forward else a < b
+                return -1 if before else 1
+        return 0
+
+    def _fetch(self, values, forward):
+        rows = []
+        for queryset in self.querysets:
+            rows.extend(self._fetch_from(queryset, values, forward))
+        rows.sort(key=functools.cmp_to_key(lambda a, b: self._compare(a, b, forward)))
+        return rows[:self.per_page + 1]
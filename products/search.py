@@ -0,0 +1,266 @@
+"""
+Full-text search for the product catalog.
+
+The index is a separate table keyed by product id and holds a normalized copy
+of the product name, description and producer name. Backends are selected by
+``settings.SEARCH_BACKEND`` (dotted path); by default SQLite uses FTS5 and
+PostgreSQL uses a ``tsvector`` table. Other databases fall back to the
+``icontains`` lookup the catalog used before.
+"""
+
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, IntegerField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+
+SEARCH_TABLE = 'products_product_search'
+
+# Kyrgyz letters are folded to their closest Russian counterparts so that
+# "өрүк", "орук" and "ОРУК" all match the same products.
+_CHAR_FOLDING = str.maketrans({
+    'ё': 'е',
+    'ө': 'о',
+    'ү': 'у',
+    'ң': 'н',
+})
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def normalize_search_text(text):
+    """Lowercase text and fold Russian/Kyrgyz letter variants"""
+    if not text:
+        return ''
+    return text.casefold().translate(_CHAR_FOLDING)
+
+
+def search_tokens(query):
+    """Split a search query into normalized word tokens"""
+    return _TOKEN_RE.findall(normalize_search_text(query))
+
+
+class BaseSearchBackend:
+    """Interface every search backend implements"""
+
+    def index_products(self, products):
+        """Add or refresh index rows for the given products"""
+        raise NotImplementedError
+
+    def remove_products(self, product_ids):
+        """Drop index rows for the given product ids"""
+        raise NotImplementedError
+
+    def match_sql(self, query):
+        """(sql, params) selecting the ids of matching products, or None"""
+        raise NotImplementedError
+
+    def rank_sql(self, query, pk_column):
+        """(sql, params) of the rank of the product ``pk_column``, lower is better"""
+        raise NotImplementedError
+
+    def search(self, queryset, query):
+        """Filter a Product queryset by query and annotate ``search_rank``
+
+        Lower ``search_rank`` means a better match. The index is joined into
+        the queryset's own SQL, so its other filters and the pagination apply
+        to every match rather than to a fixed number of best ones.
+        """
+        match = self.match_sql(query)
+        if match is None:
+            return queryset.none()
+        opts = queryset.model._meta
+        pk_column = f'{connection.ops.quote_name(opts.db_table)}.{connection.ops.quote_name(opts.pk.column)}'
+        return queryset.filter(pk__in=RawSQL(*match)).annotate(
+            search_rank=RawSQL(*self.rank_sql(query, pk_column), output_field=FloatField())
+        )
+
+    def rebuild(self):
+        """Re-index every product"""
+        from .models import Product
+
+        self.clear()
+        queryset = Product.objects.select_related('producer').order_by('pk')
+        batch = []
+        for product in queryset.iterator(chunk_size=500):
+            batch.append(product)
+            if len(batch) >= 500:
+                self.index_products(batch)
+                batch = []
+        if batch:
+            self.index_products(batch)
+
+    def clear(self):
+        """Remove every row from the index"""
+        raise NotImplementedError
+
+    @staticmethod
+    def document(product):
+        """Normalized (name, description, producer name) for a product"""
+        return (
+            normalize_search_text(product.name),
+            normalize_search_text(product.description),
+            normalize_search_text(product.producer.name),
+        )
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """Index-free fallback using icontains lookups"""
+
+    def index_products(self, products):
+        pass
+
+    def remove_products(self, product_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, queryset, query):
+        query = query.strip()
+        return queryset.filter(
+            Q(name__icontains=query) |
+            Q(description__icontains=query) |
+            Q(producer__name__icontains=query)
+        ).annotate(search_rank=Value(0, output_field=IntegerField()))
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """FTS5 virtual table with bm25 ranking"""
+
+    # bm25 column weights: name, description, producer
+    weights = (10.0, 1.0, 5.0)
+
+    def index_products(self, products):
+        rows = [(product.pk, *self.document(product)) for product in products]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s',
+                [(row[0],) for row in rows]
+            )
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, name, description, producer) '
+                f'VALUES (%s, %s, %s, %s)',
+                rows
+            )
+
+    def remove_products(self, product_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s',
+                [(pk,) for pk in product_ids]
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+
+    @staticmethod
+    def match_expression(query):
+        tokens = search_tokens(query)
+        if not tokens:
+            return None
+        # Every token must match, the last one may be a prefix of a word
+        # (the user is usually still typing it).
+        match = ' '.join(f'"{token}"' for token in tokens[:-1])
+        return f'{match} "{tokens[-1]}"*'.strip()
+
+    def match_sql(self, query):
+        match = self.match_expression(query)
+        if match is None:
+            return None
+        return f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [match]
+
+    def rank_sql(self, query, pk_column):
+        weights = ', '.join(str(weight) for weight in self.weights)
+        return (
+            f'SELECT bm25({SEARCH_TABLE}, {weights}) FROM {SEARCH_TABLE} '
+            f'WHERE {SEARCH_TABLE} MATCH %s AND rowid = {pk_column}',
+            [self.match_expression(query)]
+        )
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """Weighted tsvector table with a GIN index and ts_rank ordering"""
+
+    config = 'simple'
+
+    def index_products(self, products):
+        rows = [(product.pk, *self.document(product)) for product in products]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (product_id, document) VALUES ('
+                f'%s, '
+                f"setweight(to_tsvector('{self.config}', %s), 'A') || "
+                f"setweight(to_tsvector('{self.config}', %s), 'C') || "
+                f"setweight(to_tsvector('{self.config}', %s), 'B')) "
+                f'ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document',
+                rows
+            )
+
+    def remove_products(self, product_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {SEARCH_TABLE} WHERE product_id = ANY(%s)',
+                [list(product_ids)]
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {SEARCH_TABLE}')
+
+    @staticmethod
+    def tsquery(query):
+        tokens = search_tokens(query)
+        if not tokens:
+            return None
+        return ' & '.join(tokens[:-1] + [f'{tokens[-1]}:*'])
+
+    def match_sql(self, query):
+        tsquery = self.tsquery(query)
+        if tsquery is None:
+            return None
+        return (
+            f"SELECT product_id FROM {SEARCH_TABLE} "
+            f"WHERE document @@ to_tsquery('{self.config}', %s)",
+            [tsquery]
+        )
+
+    def rank_sql(self, query, pk_column):
+        # Negated so that, as with bm25, a lower rank is a better match
+        return (
+            f"SELECT -ts_rank(document, to_tsquery('{self.config}', %s)) "
+            f'FROM {SEARCH_TABLE} WHERE product_id = {pk_column}',
+            [self.tsquery(query)]
+        )
+
+
+DEFAULT_BACKENDS = {
+    'sqlite': 'products.search.SQLiteSearchBackend',
+    'postgresql': 'products.search.PostgresSearchBackend',
+}
+
+_backend = None
+
+
+def get_search_backend():
+    """Return the configured search backend instance"""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'SEARCH_BACKEND', None) or DEFAULT_BACKENDS.get(
+            connection.vendor, 'products.search.SimpleSearchBackend'
+        )
+        _backend = import_string(path)()
+    return _backend
+
+
+def search_products(queryset, query):
+    """Filter a Product queryset by a free-text query using the search backend"""
+    return get_search_backend().search(queryset, query)
@@ -0,0 +1,62 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from users.models import Producer
+from .cache import CACHED_MODELS, bump_generations
+from .models import Product, Review, update_product_rating
+from .search import get_search_backend
+
+
+# Fields whose changes require the search index row to be rebuilt
+SEARCH_FIELDS = {'name', 'description', 'producer', 'producer_id'}
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Keep the search index in sync with product edits"""
+    if raw:
+        return
+    if update_fields is not None and not SEARCH_FIELDS.intersection(update_fields):
+        return
+    get_search_backend().index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    """Drop deleted products from the search index"""
+    get_search_backend().remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Producer)
+def reindex_producer_products(sender, instance, update_fields=None, raw=False, created=False, **kwargs):
+    """Producer name is part of every product document"""
+    if raw or created:
+        return
+    if update_fields is not None and 'name' not in update_fields:
+        return
+    products = list(instance.products.all())
+    for product in products:
+        product.producer = instance
+    get_search_backend().index_products(products)
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_rating(sender, instance, **kwargs):
+    """Subtract a deleted review from the product rating aggregates
+
+    post_delete runs inside the deletion transaction, so the aggregates
+    change atomically with the row.
+    """
+    rating = getattr(instance, '_loaded_rating', None) or instance.rating
+    product_id = getattr(instance, '_loaded_product_id', None) or instance.product_id
+    update_product_rating(product_id, removed=rating)
+
+
+def bump_catalog_generation(sender, **kwargs):
+    """Cached catalogue entries built from the changed model are stale now"""
+    bump_generations(sender)
+
+
+for label in CACHED_MODELS:
+    post_save.connect(bump_catalog_generation, sender=label, dispatch_uid=f'catalog_cache_save_{label}')
+    post_delete.connect(bump_catalog_generation, sender=label, dispatch_uid=f'catalog_cache_delete_{label}')
@@ -0,0 +1,49 @@
+from django import template
+from django.apps import apps
+
+from products.cache import cached_fragment
+
+
+register = template.Library()
+
+
+class CatalogCacheNode(template.Node):
+    def __init__(self, nodelist, name, models, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.models = models
+        self.vary_on = vary_on
+
+    def render(self, context):
+        models = [apps.get_model(label.strip()) for label in self.models.resolve(context).split(',')]
+        vary_on = [value.resolve(context) for value in self.vary_on]
+        return cached_fragment(
+            self.name.resolve(context), models, lambda: self.nodelist.render(context), *vary_on
+        )
+
+
+@register.tag('catalog_cache')
+def do_catalog_cache(parser, token):
+    """Cache the enclosed fragment until one of the listed models changes
+
+    Usage::
+
+        {% load catalog_cache %}
+        {% catalog_cache 'home_categories' 'products.Category' [var1 var2 ...] %}
+            ...
+        {% endcatalog_cache %}
+
+    Models are comma-separated labels; the optional variables give one
+    cached copy per combination of their values.
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a name and model labels")
+    nodelist = parser.parse(('endcatalog_cache',))
+    parser.delete_first_token()
+    return CatalogCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        parser.compile_filter(bits[2]),
+        [parser.compile_filter(bit) for bit in bits[3:]],
+    )
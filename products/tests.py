@@ -1,3 +1,238 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import QueryDict
 from django.test import TestCase
+from django.utils import timezone
+
+from products.cache import cached_queryset, versioned_key
+from products.models import Category, Product, Review, recalculate_product_ratings
+from products.pagination import KeysetPaginator, MergedKeysetPaginator, encode_cursor
+from products.search import get_search_backend, search_products
+from users.models import Producer
+
+
+def create_product(producer, category, name, description='-', price='100.00', **fields):
+    return Product.objects.create(
+        producer=producer, category=category, name=name, description=description,
+        price=Decimal(price), image='product_images/test.jpg', **fields
+    )
+
+
+class CatalogTestCase(TestCase):
+
+    def setUp(self):
+        user = User.objects.create(username='producer')
+        self.producer = Producer.objects.create(user=user, name='Арсланбоб', description='-', region='jalal-abad')
+        self.category = Category.objects.create(name='Орехи', slug='nuts')
+        self.product = create_product(self.producer, self.category, 'Грецкие орехи')
+
+
+class RatingTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.users = [User.objects.create(username=f'user{n}') for n in range(3)]
+
+    def rating(self, product=None):
+        product = Product.objects.get(pk=(product or self.product).pk)
+        counts = [getattr(product, f'rating_{stars}_count') for stars in range(1, 6)]
+        return product.rating_sum, product.rating_count, product.avg_rating, counts
+
+    def review(self, user, rating, product=None):
+        return Review.objects.create(product=product or self.product, user=user, text='-', rating=rating)
+
+    def test_adding_reviews(self):
+        self.review(self.users[0], 5)
+        self.review(self.users[1], 4)
+        self.assertEqual(self.rating(), (9, 2, 4.5, [0, 0, 0, 1, 1]))
+
+    def test_editing_a_review(self):
+        review = self.review(self.users[0], 5)
+        self.review(self.users[1], 3)
+
+        review = Review.objects.get(pk=review.pk)
+        review.rating = 1
+        review.save()
+        self.assertEqual(self.rating(), (4, 2, 2.0, [1, 0, 1, 0, 0]))
+
+        # Saving without a change keeps the counters
+        review.text = 'Изменен'
+        review.save()
+        self.assertEqual(self.rating(), (4, 2, 2.0, [1, 0, 1, 0, 0]))
+
+    def test_moving_a_review_to_another_product(self):
+        other = create_product(self.producer, self.category, 'Миндаль')
+        review = self.review(self.users[0], 4)
+
+        review = Review.objects.get(pk=review.pk)
+        review.product = other
+        review.save()
+        self.assertEqual(self.rating(), (0, 0, 0.0, [0, 0, 0, 0, 0]))
+        self.assertEqual(self.rating(other), (4, 1, 4.0, [0, 0, 0, 1, 0]))
+
+    def test_deleting_reviews(self):
+        first = self.review(self.users[0], 2)
+        self.review(self.users[1], 4)
+
+        Review.objects.get(pk=first.pk).delete()
+        self.assertEqual(self.rating(), (4, 1, 4.0, [0, 0, 0, 1, 0]))
+
+        Review.objects.all().delete()
+        self.assertEqual(self.rating(), (0, 0, 0.0, [0, 0, 0, 0, 0]))
+
+    def test_recalculate_repairs_counters(self):
+        self.review(self.users[0], 5)
+        self.review(self.users[1], 2)
+        expected = self.rating()
+        Product.objects.update(rating_sum=0, rating_count=0, avg_rating=0, rating_5_count=7)
+
+        recalculate_product_ratings()
+        self.assertEqual(self.rating(), expected)
+
+    def test_rating_histogram(self):
+        for user, rating in zip(self.users, (5, 5, 2)):
+            self.review(user, rating)
+
+        histogram = Product.objects.get(pk=self.product.pk).rating_histogram()
+        self.assertEqual(
+            [(row['stars'], row['count'], row['percent']) for row in histogram],
+            [(5, 2, 67), (4, 0, 0), (3, 0, 0), (2, 1, 33), (1, 0, 0)],
+        )
+
+
+
+class KeysetPaginationTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for n, price in enumerate(('300.00', '100.00', '200.00', '100.00', '300.00', '100.00')):
+            create_product(self.producer, self.category, f'Орехи {n}', price=price)
+        # Every product shares one created_at, only the pk tie-breaker orders them
+        Product.objects.update(created_at=timezone.now())
+
+    def walk(self, paginator):
+        """Pages followed forwards to the end, then backwards to the start"""
+        forward, page = [], paginator.get_page()
+        self.assertFalse(page.has_previous)
+        while True:
+            forward.append([product.pk for product in page])
+            if not page.has_next:
+                break
+            page = paginator.get_page(page.next_cursor)
+        backward = [forward[-1]]
+        while page.has_previous:
+            page = paginator.get_page(page.previous_cursor)
+            backward.insert(0, [product.pk for product in page])
+        return forward, backward
+
+    def test_equal_created_at_is_ordered_by_pk(self):
+        forward, backward = self.walk(KeysetPaginator(Product.objects.all(), ['-created_at'], per_page=3))
+        pks = list(Product.objects.order_by('-pk').values_list('pk', flat=True))
+        self.assertEqual(forward, [pks[0:3], pks[3:6], pks[6:]])
+        self.assertEqual(backward, forward)
+
+    def test_ties_on_a_non_unique_field(self):
+        paginator = KeysetPaginator(Product.objects.all(), ['price'], per_page=2)
+        forward, backward = self.walk(paginator)
+        expected = list(Product.objects.order_by('price', 'pk').values_list('pk', flat=True))
+        self.assertEqual(sum(forward, []), expected)
+        self.assertEqual(backward, forward)
+
+    def test_invalid_cursor_falls_back_to_the_first_page(self):
+        paginator = KeysetPaginator(Product.objects.all(), ['-created_at'], per_page=3)
+        first = [product.pk for product in paginator.get_page()]
+        for cursor in ('garbage', encode_cursor(['not a date', 1], 'next'), encode_cursor([1], 'next'),
+                       encode_cursor([timezone.now(), 1], 'sideways')):
+            page = paginator.get_page(cursor)
+            self.assertEqual([product.pk for product in page], first, cursor)
+            self.assertFalse(page.has_previous)
+
+    def test_links_keep_other_parameters(self):
+        page = KeysetPaginator(Product.objects.all(), ['-created_at'], per_page=3).get_page(
+            query_params=QueryDict('category=nuts&sort=newest')
+        )
+        self.assertEqual(
+            QueryDict(page.next_querystring).dict(), {'category': 'nuts', 'sort': 'newest', 'cursor': page.next_cursor}
+        )
+
+    def test_merged_querysets(self):
+        cheap = Product.objects.filter(price__lt=150)
+        other = Product.objects.exclude(price__lt=150)
+        forward, backward = self.walk(MergedKeysetPaginator([cheap, None, other], ['-created_at'], per_page=3))
+        self.assertEqual(sum(forward, []), list(Product.objects.order_by('-pk').values_list('pk', flat=True)))
+        self.assertEqual(backward, forward)
+
+class SearchTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.honey = Category.objects.create(name='Мед', slug='honey')
+        # Many strong matches in one category, a weak one in another
+        products = Product.objects.bulk_create([
+            Product(producer=self.producer, category=self.category, name=f'Орехи в меду {n}',
+                    description='Мед горный', price=Decimal('100.00'), image='product_images/test.jpg')
+            for n in range(520)
+        ])
+        get_search_backend().index_products(products)
+        self.weak = create_product(self.producer, self.honey, 'Курут', description='Хорошо с медом')
+
+    def test_ranked_search(self):
+        results = search_products(Product.objects.all(), 'орехи').order_by('search_rank')[:1]
+        self.assertEqual(list(results), [self.product])
+
+    def test_filters_apply_to_every_match(self):
+        results = search_products(Product.objects.all(), 'мед')
+        self.assertEqual(results.count(), 521)
+        self.assertEqual(list(results.filter(category=self.honey)), [self.weak])
+
+    def test_prefix_of_last_word_matches(self):
+        self.assertEqual(list(search_products(Product.objects.all(), 'курут хоро')), [self.weak])
+
+    def test_empty_query_matches_nothing(self):
+        self.assertFalse(search_products(Product.objects.all(), ' !? ').exists())
+
+
+class CatalogCacheTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def cached_names(self):
+        return [product.name for product in cached_queryset('names', [Product], Product.objects.order_by('pk'))]
+
+    def test_write_invalidates_cached_queryset(self):
+        self.assertEqual(self.cached_names(), ['Грецкие орехи'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_product(self.producer, self.category, 'Миндаль')
+        self.assertEqual(self.cached_names(), ['Грецкие орехи', 'Миндаль'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(name='Миндаль').delete()
+        self.assertEqual(self.cached_names(), ['Грецкие орехи'])
+
+    def test_update_writes_bump_generation(self):
+        self.cached_names()
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(product=self.product, user=User.objects.create(username='buyer'), text='-', rating=5)
+        product = cached_queryset('products', [Product], Product.objects.all())[0]
+        self.assertEqual(product.rating_count, 1)
+
+    def test_other_models_keep_their_entries(self):
+        categories = cached_queryset('categories', [Category], Category.objects.all())
+        with self.captureOnCommitCallbacks(execute=True):
+            create_product(self.producer, self.category, 'Миндаль')
+        with self.assertNumQueries(0):
+            self.assertEqual(cached_queryset('categories', [Category], Category.objects.all()), categories)
 
-# Create your tests here.
+    def test_bump_waits_for_commit(self):
+        key = versioned_key('names', [Product])
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            create_product(self.producer, self.category, 'Миндаль')
+            self.assertEqual(versioned_key('names', [Product]), key)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(versioned_key('names', [Product]), key)
@@ -54,6 +54,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'cart.middleware.CartStorageMiddleware',  # Persist cookie/cache guest carts
 ]
 
 ROOT_URLCONF = 'tanda_project.urls'
@@ -162,6 +163,33 @@ SESSION_COOKIE_SECURE = False  # Set to True in production with HTTPS
 SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_SAMESITE = 'Lax'
 
+# Cache backend, set with the CACHE_BACKEND and CACHE_LOCATION environment variables:
+#   'locmem' - memory of one process (runserver or a single worker)
+#   'file'   - directory shared by the worker processes of one host
+#   'redis'  - a Redis-compatible server, e.g. redis://127.0.0.1:6379/1
+#              (needs the redis package)
+# Cached catalogue data (products.cache) is invalidated on every write, so
+# several worker processes must share a 'file' or 'redis' cache.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'tanda'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / 'cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': os.environ.get('CACHE_LOCATION', CACHE_BACKENDS[CACHE_BACKEND][1]),
+        'KEY_PREFIX': 'tanda',
+    }
+}
+# Upper bound (seconds) on how long unreachable catalogue entries are kept
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Guest cart storage: 'cookie' (signed cookie), 'cache' or 'database'.
+# Cookie and cache carts are saved to the database only when the visitor logs in.
+CART_ANONYMOUS_STORAGE = 'cookie'
+
 # Login/Logout URLs
 LOGIN_URL = '/users/login/'
 LOGIN_REDIRECT_URL = '/'
@@ -176,4 +204,36 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 # EMAIL_PORT = 587
 # EMAIL_USE_TLS = True
 # EMAIL_HOST_USER = 'your-email@gmail.com'
-# EMAIL_HOST_PASSWORD = 'your-password'
\ No newline at end of file
+# EMAIL_HOST_PASSWORD = 'your-password'
+
+# Order notifications are queued in the outbox and sent by a separate worker:
+#   python manage.py send_notifications --loop
+NOTIFICATION_MAX_ATTEMPTS = 5
+NOTIFICATION_RETRY_DELAY = 60  # seconds, doubled after every failed attempt
+# New orders of a producer within this many minutes are sent as one digest email
+NOTIFICATION_DIGEST_WINDOW = 10
+
+# Daily order rollups behind the admin analytics are updated on every order
+# write. Fill them once after deploying and re-check recent days from cron:
+#   python manage.py refresh_order_stats
+#   python manage.py refresh_order_stats --days 2
+
+# Order CSV exports larger than this are written to a gzipped file in the
+# background by a separate worker:
+#   python manage.py run_order_exports --loop
+ORDER_EXPORT_STREAM_MAX_ORDERS = 20000
+
+# Completed and cancelled orders older than this many days are moved to the
+# archive tables (history pages and exports still include them), e.g. nightly:
+#   python manage.py archive_orders
+ORDER_ARCHIVE_AFTER_DAYS = 180
+
+# Live order updates (Server-Sent Events) need an ASGI server, e.g.
+#   uvicorn tanda_project.asgi:application
+# The local broker only reaches clients of the same process; with several
+# worker processes use the database broker so that they share events.
+ORDER_EVENTS_BROKER = 'orders.events.LocalBroker'
+# ORDER_EVENTS_BROKER = 'orders.events.DatabaseBroker'
+
+# Product search backend (defaults: FTS5 on SQLite, tsvector on PostgreSQL)
+# SEARCH_BACKEND = 'products.search.SimpleSearchBackend'
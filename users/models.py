@@ -123,4 +123,16 @@ def is_favorite(user, product):
     """Check if product is in user's favorites"""
     if not user.is_authenticated:
         return False
-    return Favorite.objects.filter(user=user, product=product).exists()
\ No newline at end of file
+    return Favorite.objects.filter(user=user, product=product).exists()
+
+
+def favorite_product_ids(user, products):
+    """Return ids of the given products (or product ids) in user's favorites with one query"""
+    if not user.is_authenticated:
+        return set()
+    ids = [getattr(product, 'pk', product) for product in products]
+    if not ids:
+        return set()
+    return set(
+        Favorite.objects.filter(user=user, product_id__in=ids).values_list('product_id', flat=True)
+    )
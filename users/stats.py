@@ -0,0 +1,82 @@
+"""
+Aggregated numbers for the producer dashboard.
+
+Order counters and revenue come from one conditional-aggregate query over the
+producer's orders (served by the ``order_producer_status_idx`` covering
+index) plus the same query over the archived orders, product counters from
+one aggregate over the producer's products, so the cost does not grow with
+the number of orders or products.
+"""
+
+from decimal import Decimal
+
+from django.db.models import Count, Q, Sum
+
+from orders.models import ArchivedOrder, Order
+from products.models import Product
+
+
+# Statuses whose order total counts as revenue
+REVENUE_STATUSES = ('paid', 'completed')
+
+
+class ProducerStats:
+    """Dashboard counters of a single producer"""
+
+    def __init__(self, total_products=0, total_sales=0, total_orders=0, pending_orders=0,
+                 paid_orders=0, completed_orders=0, cancelled_orders=0, total_revenue=Decimal('0')):
+        self.total_products = total_products
+        self.total_sales = total_sales
+        self.total_orders = total_orders
+        self.pending_orders = pending_orders
+        self.paid_orders = paid_orders
+        self.completed_orders = completed_orders
+        self.cancelled_orders = cancelled_orders
+        self.total_revenue = total_revenue
+
+    @classmethod
+    def for_producer(cls, producer):
+        """Compute the stats with three aggregate queries"""
+        orders = {}
+        for model in (Order, ArchivedOrder):
+            counts = model.objects.filter(producer=producer).aggregate(
+                total_orders=Count('id'),
+                pending_orders=Count('id', filter=Q(status='pending')),
+                paid_orders=Count('id', filter=Q(status='paid')),
+                completed_orders=Count('id', filter=Q(status='completed')),
+                cancelled_orders=Count('id', filter=Q(status='cancelled')),
+                total_revenue=Sum('total_price', filter=Q(status__in=REVENUE_STATUSES)),
+            )
+            for name, value in counts.items():
+                orders[name] = orders.get(name, 0) + (value or 0)
+        products = Product.objects.filter(producer=producer).aggregate(
+            total_products=Count('id'),
+            total_sales=Sum('num_sales'),
+        )
+        return cls(
+            total_products=products['total_products'],
+            total_sales=products['total_sales'] or 0,
+            total_orders=orders['total_orders'],
+            pending_orders=orders['pending_orders'],
+            paid_orders=orders['paid_orders'],
+            completed_orders=orders['completed_orders'],
+            cancelled_orders=orders['cancelled_orders'],
+            total_revenue=orders['total_revenue'] or Decimal('0'),
+        )
+
+    def as_dict(self):
+        """JSON-serializable counters"""
+        data = dict(vars(self))
+        data['total_revenue'] = float(self.total_revenue)
+        return data
+
+
+def last_order_change(producer):
+    """``(updated_at, pk)`` of the producer's latest changed order, or None
+
+    Used as the polling cursor; ``order_producer_updated_idx`` answers it
+    with one index seek.
+    """
+    return Order.objects.filter(producer=producer).order_by(
+        '-updated_at', '-pk'
+    ).values_list('updated_at', 'pk').first()
@@ -1,3 +1,152 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from cart.models import Cart, CartItem
+from orders.archive import archive_batch, archive_cutoff
+from orders.models import ArchivedOrder, Order
+from orders.transitions import transition_orders
+from orders.views import checkout_cart
+from products.models import Category, Product
+from users.models import Producer
+from users.stats import ProducerStats
+from users.views import ORDER_CHANGES_LIMIT, format_changes_cursor, parse_changes_cursor
+
+
+class ChangesCursorTests(TestCase):
+
+    def test_cursor_round_trip(self):
+        cursor = format_changes_cursor((timezone.now(), 42))
+        since, pk = parse_changes_cursor(cursor)
+        self.assertEqual(pk, 42)
+        self.assertEqual(format_changes_cursor((since, pk)), cursor)
+
+    def test_invalid_cursors(self):
+        for value in (None, '', 'garbage', '2026-01-01T00:00:00+00:00', '2026-01-01T00:00:00+00:00,x'):
+            self.assertIsNone(parse_changes_cursor(value))
+
+
+class ProducerOrderChangesTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create(username='producer')
+        self.producer = Producer.objects.create(user=user, name='Бренд', description='-', region='osh')
+        category = Category.objects.create(name='Мед', slug='honey')
+        self.product = Product.objects.create(
+            producer=self.producer, category=category, name='Мед', description='-',
+            price=Decimal('100.00'), image='product_images/test.jpg',
+        )
+        self.client.force_login(user)
+        self.url = reverse('producer_order_changes')
+
+    def place_orders(self, count):
+        buyers = User.objects.bulk_create([User(username=f'buyer{n}') for n in range(count)])
+        carts = Cart.objects.bulk_create([Cart(user=buyer) for buyer in buyers])
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=self.product) for cart in carts])
+        for buyer in buyers:
+            checkout_cart(buyer)
+
+    def poll(self, cursor):
+        return self.client.get(self.url, {'since': cursor})
+
+    def test_initial_cursor_and_not_modified(self):
+        self.place_orders(2)
+        data = self.client.get(self.url).json()
+        self.assertEqual(data['orders'], [])
+
+        self.assertEqual(self.poll(data['cursor']).status_code, 304)
+
+    def test_changes_after_cursor(self):
+        self.place_orders(1)
+        cursor = self.client.get(self.url).json()['cursor']
+        order = Order.objects.get()
+        transition_orders(Order.objects.all(), 'paid')
+
+        data = self.poll(cursor).json()
+        self.assertEqual([(row['id'], row['status']) for row in data['orders']], [(order.pk, 'paid')])
+        self.assertFalse(data['has_more'])
+        self.assertEqual(self.poll(data['cursor']).status_code, 304)
+
+    def test_bulk_update_larger_than_a_page_is_not_skipped(self):
+        count = ORDER_CHANGES_LIMIT + 20
+        self.place_orders(count)
+        cursor = self.client.get(self.url).json()['cursor']
+        # Every order gets the same updated_at
+        transition_orders(Order.objects.all(), 'paid')
+        self.assertEqual(Order.objects.values('updated_at').distinct().count(), 1)
+
+        seen = []
+        response = self.poll(cursor)
+        while response.status_code == 200:
+            data = response.json()
+            seen.extend(row['id'] for row in data['orders'])
+            response = self.poll(data['cursor'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(sorted(seen), sorted(Order.objects.values_list('pk', flat=True)))
+        self.assertEqual(len(seen), count)
+
+
+class ProducerStatsTests(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name='Мед', slug='honey')
+        self.producer = Producer.objects.create(
+            user=User.objects.create(username='producer'), name='Бренд', description='-', region='osh'
+        )
+        other = Producer.objects.create(
+            user=User.objects.create(username='other'), name='Другой', description='-', region='naryn'
+        )
+        self.products = [
+            Product.objects.create(
+                producer=producer, category=category, name=name, description='-',
+                price=Decimal(price), image='product_images/test.jpg',
+            )
+            for producer, name, price in (
+                (self.producer, 'Мед горный', '500.00'), (self.producer, 'Мед цветочный', '300.00'),
+                (other, 'Курут', '150.00'),
+            )
+        ]
+
+    def place_order(self, username, product, quantity, status=None):
+        buyer = User.objects.create(username=username)
+        CartItem.objects.create(cart=Cart.objects.create(user=buyer), product=product, quantity=quantity)
+        order = checkout_cart(buyer)[0]
+        for step in {'paid': ['paid'], 'completed': ['paid', 'completed'], 'cancelled': ['cancelled']}.get(status, []):
+            transition_orders(Order.objects.filter(pk=order.pk), step)
+        return order
+
+    def test_counts_and_revenue_include_the_archive(self):
+        archived = [
+            self.place_order('buyer1', self.products[0], 2, 'completed'),
+            self.place_order('buyer2', self.products[0], 1, 'cancelled'),
+        ]
+        self.place_order('buyer3', self.products[1], 1, 'paid')
+        self.place_order('buyer4', self.products[0], 1)
+        self.place_order('buyer5', self.products[1], 2, 'completed')
+        self.place_order('buyer6', self.products[2], 3, 'completed')
+
+        old = timezone.now() - timedelta(days=365)
+        Order.objects.filter(pk__in=[order.pk for order in archived]).update(created_at=old, updated_at=old)
+        self.assertEqual(archive_batch(archive_cutoff()), 2)
+        self.assertEqual(ArchivedOrder.objects.count(), 2)
+
+        with self.assertNumQueries(3):
+            stats = ProducerStats.for_producer(self.producer)
+        self.assertEqual(stats.as_dict(), {
+            'total_products': 2,
+            'total_sales': 4,
+            'total_orders': 5,
+            'pending_orders': 1,
+            'paid_orders': 1,
+            'completed_orders': 2,
+            'cancelled_orders': 1,
+            'total_revenue': 1900.0,
+        })
 
-# Create your tests here.
+    def test_producer_without_orders(self):
+        stats = ProducerStats.for_producer(self.producer)
+        self.assertEqual((stats.total_orders, stats.total_sales, stats.total_revenue), (0, 0, Decimal('0')))
@@ -31,11 +31,16 @@ urlpatterns = [
     # Producer orders management
     path('orders/', login_required(views.producer_orders), name='producer_orders'),
     path('orders/update-status/', login_required(views.update_order_status_producer), name='update_order_status_producer'),
+    path('orders/bulk-update-status/', login_required(views.bulk_update_order_status_producer), name='bulk_update_order_status_producer'),
+    path('orders/changes/', login_required(views.producer_order_changes), name='producer_order_changes'),
+    path('orders/events/', login_required(views.producer_order_events), name='producer_order_events'),
+    path('orders/export/', login_required(views.producer_orders_export), name='producer_orders_export'),
     
     # Favorites
     path('favorites/', login_required(views.favorites_view), name='favorites_view'),
     path('favorites/toggle/', login_required(views.toggle_favorite_view), name='toggle_favorite'),
     path('check-favorite/', login_required(views.check_favorite_status), name='check_favorite_status'),
+    path('favorites/status/', login_required(views.favorite_status_batch), name='favorite_status_batch'),
     
     # Store locations (stubs for now)
     path('store-location/add/', views.add_store_location, name='add_store_location'),
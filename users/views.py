@@ -5,18 +5,28 @@ from django.contrib.auth import login, authenticate
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.db.models import Q
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_protect
 from django.views.decorators.cache import never_cache
 from django.views.decorators.http import require_POST
-from django.db.models import Sum, Count, Q
 from django.utils import timezone
-from datetime import timedelta
+from django.utils.dateparse import parse_datetime
+from datetime import datetime, timedelta, timezone as dt_timezone
 import json
 
 from .forms import SmartRegistrationForm, ProducerProfileForm
-from .models import Producer, Favorite, toggle_favorite, is_favorite
+from .models import Producer, Favorite, toggle_favorite, is_favorite, favorite_product_ids
+from .stats import ProducerStats, last_order_change
 from products.models import Product
+from products.pagination import KeysetPaginator, MergedKeysetPaginator
+
+
+FAVORITES_PER_PAGE = 24
+PRODUCER_ORDERS_PER_PAGE = 50
+PRODUCER_EXPORTS_SHOWN = 5
+FAVORITE_STATUS_MAX_IDS = 200
 
 
 @never_cache
@@ -120,56 +130,49 @@ def producer_dashboard(request):
         from orders.models import Order
         
         products = Product.objects.filter(producer=producer).order_by('-created_at')
-        total_products = products.count()
-        total_sales = sum(product.num_sales for product in products)
-        
-        # Get orders for producer's products
-        orders = Order.objects.filter(
-            product__producer=producer
-        ).select_related(
-            'user', 'product'
-        ).order_by('-created_at')
         
-        # Orders statistics
-        pending_orders = orders.filter(status='pending').count()
-        paid_orders = orders.filter(status='paid').count()
-        completed_orders = orders.filter(status='completed').count()
-        total_revenue = orders.filter(
-            status__in=['paid', 'completed']
-        ).aggregate(
-            total=Sum('total_price')
-        )['total'] or 0
+        # Every dashboard counter in a constant number of queries
+        stats = ProducerStats.for_producer(producer)
         
         # Recent orders (last 10)
-        recent_orders = orders[:10]
+        recent_orders = Order.objects.filter(
+            producer=producer
+        ).select_related(
+            'checkout', 'checkout__user'
+        ).prefetch_related(
+            'lines__product'
+        ).order_by('-created_at')[:10]
         
     except Exception as e:
         print(f"Error in producer_dashboard: {e}")
         products = []
-        orders = []
         recent_orders = []
-        total_products = 0
-        total_sales = 0
-        pending_orders = 0
-        paid_orders = 0
-        completed_orders = 0
-        total_revenue = 0
+        stats = ProducerStats()
     
     context = {
         'producer': producer,
         'products': products,
-        'orders': orders,
         'recent_orders': recent_orders,
-        'total_products': total_products,
-        'total_sales': total_sales,
-        'pending_orders': pending_orders,
-        'paid_orders': paid_orders,
-        'completed_orders': completed_orders,
-        'total_revenue': total_revenue,
+        'stats': stats,
+        'changes_cursor': format_changes_cursor(last_order_change(producer)),
     }
     return render(request, 'users/producer_dashboard.html', context)
 
 
+def filter_producer_orders(request, producer):
+    """Producer's live and archived orders filtered by ``status`` and ``search``
+
+    Returns (orders, archived_orders, status_filter, search_query);
+    archived_orders is None when the status filter excludes the archive.
+    """
+    from orders.search import producer_order_querysets
+    
+    status_filter = request.GET.get('status')
+    search_query = request.GET.get('search', '').strip()
+    orders, archived_orders = producer_order_querysets(producer, status_filter, search_query)
+    return orders, archived_orders, status_filter, search_query
+
+
 @login_required
 def producer_orders(request):
     """Dedicated page for producer to view all their orders"""
@@ -179,41 +182,58 @@ def producer_orders(request):
         messages.error(request, 'Вы не являетесь производителем')
         return redirect('become_producer')
     
-    # Get orders for producer's products
-    from orders.models import Order
+    from orders.models import OrderExport
     
-    orders = Order.objects.filter(
-        product__producer=producer
-    ).select_related(
-        'user', 'product'
-    ).order_by('-created_at')
+    orders, archived_orders, status_filter, search_query = filter_producer_orders(request, producer)
     
-    # Filter by status if requested
-    status_filter = request.GET.get('status')
-    if status_filter and status_filter in ['pending', 'paid', 'completed', 'cancelled']:
-        orders = orders.filter(status=status_filter)
-    
-    # Search functionality
-    search_query = request.GET.get('search')
-    if search_query:
-        orders = orders.filter(
-            Q(user__first_name__icontains=search_query) |
-            Q(user__last_name__icontains=search_query) |
-            Q(user__username__icontains=search_query) |
-            Q(product__name__icontains=search_query) |
-            Q(buyer_name__icontains=search_query) |
-            Q(buyer_phone__icontains=search_query)
-        )
+    # Archived (old completed/cancelled) orders are merged into the same list
+    orders_count = orders.count()
+    if archived_orders is not None:
+        orders_count += archived_orders.count()
+        archived_orders = archived_orders.select_related('checkout', 'checkout__user').prefetch_related('lines__product')
+    page = MergedKeysetPaginator(
+        [orders.select_related('checkout', 'checkout__user').prefetch_related('lines__product'), archived_orders],
+        ['-created_at'],
+        per_page=PRODUCER_ORDERS_PER_PAGE,
+    ).paginate_request(request)
     
     context = {
         'producer': producer,
-        'orders': orders,
+        'orders': page,
+        'orders_count': orders_count,
+        'page': page,
         'status_filter': status_filter,
         'search_query': search_query,
+        'changes_cursor': format_changes_cursor(last_order_change(producer)),
+        'exports': OrderExport.objects.filter(producer=producer, requested_by=request.user)[:PRODUCER_EXPORTS_SHOWN],
     }
     return render(request, 'users/producer_orders.html', context)
 
 
+@login_required
+def producer_orders_export(request):
+    """CSV export of the producer's orders with the current page filters"""
+    try:
+        producer = request.user.producer
+    except:
+        messages.error(request, 'Вы не являетесь производителем')
+        return redirect('become_producer')
+    
+    from orders.exports import queue_export, should_run_in_background, streaming_export_response
+    
+    orders, archived_orders, status_filter, search_query = filter_producer_orders(request, producer)
+    if should_run_in_background(orders, archived_orders):
+        queue_export(
+            request.user, 'producer', producer=producer,
+            filters={'status': status_filter, 'search': search_query},
+        )
+        messages.info(request, 'Заказов много, поэтому файл готовится в фоне. Ссылка на скачивание появится в списке выгрузок.')
+        return redirect(f"{reverse('producer_orders')}?{request.GET.urlencode()}")
+    return streaming_export_response(
+        orders, filename=f'orders-{timezone.localdate():%Y-%m-%d}.csv', archived=archived_orders
+    )
+
+
 @login_required
 @require_POST
 def update_order_status_producer(request):
@@ -240,7 +260,7 @@ def update_order_status_producer(request):
         from orders.models import Order
         order = Order.objects.get(
             id=order_id, 
-            product__producer=producer
+            producer=producer
         )
         
         # Validate status transition
@@ -251,7 +271,12 @@ def update_order_status_producer(request):
                 'message': 'Неверный статус'
             })
         
-        old_status = order.status
+        if not order.can_change_status_to(status):
+            return JsonResponse({
+                'success': False,
+                'message': f'Нельзя изменить статус заказа №{order.id} с "{order.get_status_display()}" на выбранный'
+            })
+        
         order.status = status
         order.save()
         
@@ -281,6 +306,170 @@ def update_order_status_producer(request):
         })
 
 
+@login_required
+@require_POST
+def bulk_update_order_status_producer(request):
+    """Producer changes the status of several orders at once"""
+    try:
+        producer = request.user.producer
+    except:
+        return JsonResponse({
+            'success': False,
+            'message': 'Вы не являетесь производителем'
+        })
+    
+    from orders.models import Order
+    from orders.transitions import FORWARD_STATUSES, transition_orders
+    
+    try:
+        data = json.loads(request.body)
+        order_ids = data.get('order_ids')
+        status = data.get('status')
+        
+        if not order_ids or not isinstance(order_ids, list) or status not in FORWARD_STATUSES:
+            return JsonResponse({
+                'success': False,
+                'message': 'Не все данные указаны'
+            })
+        
+        orders = Order.objects.filter(id__in=order_ids, producer=producer)
+        updated_ids = transition_orders(orders, status, forward_only=True)
+        
+        status_display = dict(Order.STATUS_CHOICES)[status]
+        return JsonResponse({
+            'success': bool(updated_ids),
+            'message': (
+                f'Статус {len(updated_ids)} заказов изменен на "{status_display}"'
+                if updated_ids else 'Ни один из выбранных заказов нельзя перевести в этот статус'
+            ),
+            'updated_ids': updated_ids,
+            'skipped_count': len(order_ids) - len(updated_ids),
+            'new_status': status,
+            'status_display': status_display
+        })
+        
+    except (ValueError, TypeError):
+        return JsonResponse({
+            'success': False,
+            'message': 'Неверный формат данных'
+        })
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': f'Ошибка: {str(e)}'
+        })
+
+
+# Maximum number of changed orders returned by one poll
+ORDER_CHANGES_LIMIT = 100
+
+
+def format_changes_cursor(value):
+    """Polling cursor for an ``(updated_at, pk)`` position
+
+    Without orders the cursor starts at the epoch, so the first order is
+    reported as a change. The pk breaks ties between orders updated at the
+    same instant (bulk transitions share one timestamp).
+    """
+    if value is None:
+        value = (datetime.fromtimestamp(0, tz=dt_timezone.utc), 0)
+    updated_at, pk = value
+    return f'{updated_at.isoformat()},{pk}'
+
+
+def parse_changes_cursor(value):
+    """``(updated_at, pk)`` from a polling cursor, or None if missing or invalid"""
+    timestamp, _, pk = (value or '').partition(',')
+    try:
+        since = parse_datetime(timestamp)
+        pk = int(pk)
+    except ValueError:
+        return None
+    if since is None:
+        return None
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since, pk
+
+
+@login_required
+@never_cache
+def producer_order_changes(request):
+    """Orders changed after the ``since`` cursor, for dashboard auto-refresh
+
+    Responds 304 without a body when nothing changed, so an idle dashboard
+    costs one indexed query per poll. Without a cursor only the current
+    cursor and counters are returned.
+    """
+    try:
+        producer = request.user.producer
+    except:
+        return JsonResponse({
+            'success': False,
+            'message': 'Вы не являетесь производителем'
+        }, status=403)
+    
+    from orders.models import Order
+    
+    cursor = parse_changes_cursor(request.GET.get('since'))
+    changed = []
+    has_more = False
+    if cursor is not None:
+        since, since_pk = cursor
+        changed = list(
+            Order.objects.filter(
+                Q(updated_at__gt=since) | Q(updated_at=since, pk__gt=since_pk),
+                producer=producer,
+            ).select_related(
+                'checkout'
+            ).prefetch_related(
+                'lines'
+            ).order_by('updated_at', 'pk')[:ORDER_CHANGES_LIMIT + 1]
+        )
+        if not changed:
+            return HttpResponseNotModified()
+        has_more = len(changed) > ORDER_CHANGES_LIMIT
+        changed = changed[:ORDER_CHANGES_LIMIT]
+        cursor = (changed[-1].updated_at, changed[-1].pk)
+    else:
+        cursor = last_order_change(producer)
+    
+    return JsonResponse({
+        'success': True,
+        'cursor': format_changes_cursor(cursor),
+        'has_more': has_more,
+        'orders': [
+            {
+                'id': order.id,
+                'status': order.status,
+                'status_display': order.get_status_display(),
+                'total_price': float(order.total_price),
+                'total_quantity': order.total_quantity,
+                'buyer_name': order.checkout.buyer_name,
+                'created_at': order.created_at.isoformat(),
+                'is_new': order.created_at > since,
+            }
+            for order in changed
+        ],
+        'stats': ProducerStats.for_producer(producer).as_dict(),
+    })
+
+
+@login_required
+async def producer_order_events(request):
+    """Server-Sent Events stream of the producer's new orders and status changes"""
+    from orders.events import event_stream_response, producer_channel
+    
+    user = await request.auser()
+    producer_id = await Producer.objects.filter(user=user).values_list('pk', flat=True).afirst()
+    if producer_id is None:
+        return JsonResponse({
+            'success': False,
+            'message': 'Вы не являетесь производителем'
+        }, status=403)
+    return event_stream_response(request, producer_channel(producer_id))
+
+
 @login_required
 def edit_producer_profile(request):
     """Edit producer profile"""
@@ -322,11 +511,14 @@ def edit_producer_profile(request):
 def favorites_view(request):
     """Display user's favorite products"""
     favorites = Favorite.objects.filter(user=request.user).select_related('product', 'product__producer')
-    favorite_products = [fav.product for fav in favorites]
+    page = KeysetPaginator(favorites, ['-created_at'], per_page=FAVORITES_PER_PAGE).paginate_request(request)
+    favorite_products = [fav.product for fav in page]
     
     context = {
-        'favorites': favorites,
+        'favorites': page,
         'favorite_products': favorite_products,
+        'favorites_count': favorites.count(),
+        'page': page,
     }
     return render(request, 'users/favorites.html', context)
 
@@ -389,6 +581,26 @@ def check_favorite_status(request):
         })
 
 
+@login_required
+@require_POST
+def favorite_status_batch(request):
+    """Return which of the given products are in user's favorites"""
+    try:
+        data = json.loads(request.body)
+        product_ids = [int(pk) for pk in data.get('product_ids', [])][:FAVORITE_STATUS_MAX_IDS]
+        
+        return JsonResponse({
+            'success': True,
+            'favorite_ids': sorted(favorite_product_ids(request.user, product_ids))
+        })
+        
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': f'Ошибка: {str(e)}'
+        })
+
+
 # Store location management stubs
 @login_required
 def add_store_location(request):